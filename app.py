@@ -0,0 +1,47 @@
+import os, sys
+import uvicorn
+from fastapi import FastAPI, Body, HTTPException
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.predictor import ModelResolver, Predictor
+from sensor.serving import MicroBatcher
+
+#micro batch bounds, a batch is predicted when it is full or when the first request waited max wait time
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE",64))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS",5))
+
+app = FastAPI()
+predictor = Predictor(model_resolver = ModelResolver())
+batcher = MicroBatcher(predict_func = predictor.predict_dataframe,max_batch_size = MAX_BATCH_SIZE,max_wait_ms = MAX_WAIT_MS)
+feature_names = []
+
+@app.on_event("startup")
+async def startup():
+    #pipeline objects are loaded once and stay in memory for every request
+    predictor.load_objects()
+    feature_names.extend(predictor.get_feature_names())
+    await batcher.start()
+    logging.info(f"inference service started with max batch size: {MAX_BATCH_SIZE} and max wait: {MAX_WAIT_MS} ms")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await batcher.stop()
+
+@app.post("/predict")
+async def predict(reading:dict = Body(...)):
+    #a reading without every sensor column is rejected before it can fail a whole batch
+    missing_columns = [column for column in feature_names if column not in reading]
+    if len(missing_columns) > 0:
+        raise HTTPException(status_code = 422,detail = f"missing columns: {missing_columns}")
+    try:
+        prediction = await batcher.submit(reading)
+        return {"prediction":prediction.item() if hasattr(prediction,"item") else prediction}
+    except Exception as e:
+        raise HTTPException(status_code = 500,detail = str(SensorException(e, sys)))
+
+@app.get("/metrics")
+async def metrics():
+    return batcher.metrics.summary()
+
+if __name__ == "__main__":
+    uvicorn.run(app,host = os.getenv("HOST","0.0.0.0"),port = int(os.getenv("PORT",8080)))
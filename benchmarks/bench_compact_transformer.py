@@ -0,0 +1,74 @@
+"""
+Benchmark of the compact float32 transformer against the fitted sklearn pipeline
+
+python benchmarks/bench_compact_transformer.py --rows 50000 --columns 170
+"""
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from sensor.components.data_transformation import DataTransformation
+from sensor.compact_transformer import CompactTransformer
+
+def make_data(rows:int,columns:int,missing_ratio:float,seed:int = 42)->pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = rng.lognormal(size = (rows,columns)).round(2)
+    data[rng.random(data.shape) < missing_ratio] = np.nan
+    #a column without any observed value is dropped by the imputer
+    data[:,0] = np.nan
+    return pd.DataFrame(data,columns = [f"sensor_{column}" for column in range(columns)])
+
+def timeit(func,repeat:int,number:int = 1)->float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 50000)
+    parser.add_argument("--columns",type = int,default = 170)
+    parser.add_argument("--missing-ratio",type = float,default = 0.05)
+    parser.add_argument("--repeat",type = int,default = 5)
+    parser.add_argument("--single-row-calls",type = int,default = 1000)
+    args = parser.parse_args()
+
+    df = make_data(rows = args.rows,columns = args.columns,missing_ratio = args.missing_ratio)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        pipeline = DataTransformation.get_data_tranformer_object().fit(df)
+    compact_transformer = CompactTransformer.from_pipeline(pipeline = pipeline)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = pipeline.transform(df)
+    result = compact_transformer.transform(df)
+    max_abs_diff = float(np.abs(expected - result).max())
+    max_rel_diff = float((np.abs(expected - result) / np.maximum(np.abs(expected),1)).max())
+    print(f"max abs diff: {max_abs_diff:.3e}, max relative diff: {max_rel_diff:.3e}")
+
+    arr = df.to_numpy(dtype = np.float32)
+    buffer = np.empty((args.rows,compact_transformer.n_features_out),dtype = np.float32)
+    row_df = df.iloc[:1]
+    row_arr = arr[:1]
+    row_buffer = np.empty((1,compact_transformer.n_features_out),dtype = np.float32)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        timings = {
+            "batch sklearn pipeline (dataframe)":timeit(lambda: pipeline.transform(df),args.repeat),
+            "batch compact (dataframe)":timeit(lambda: compact_transformer.transform(df),args.repeat),
+            "batch compact (float32 array, buffer)":timeit(lambda: compact_transformer.transform(arr,out = buffer),args.repeat),
+            "single row sklearn pipeline (dataframe)":timeit(lambda: pipeline.transform(row_df),args.repeat,args.single_row_calls),
+            "single row compact (dataframe)":timeit(lambda: compact_transformer.transform(row_df),args.repeat,args.single_row_calls),
+            "single row compact (float32 array, buffer)":timeit(lambda: compact_transformer.transform(row_arr,out = row_buffer),
+                args.repeat,args.single_row_calls)}
+
+    for name,seconds in timings.items():
+        print(f"{name:45s} {seconds * 1000:10.3f} ms")
+    print(f"batch speedup: {timings['batch sklearn pipeline (dataframe)'] / timings['batch compact (float32 array, buffer)']:.1f}x")
+    print(f"single row speedup: {timings['single row sklearn pipeline (dataframe)'] / timings['single row compact (float32 array, buffer)']:.1f}x")
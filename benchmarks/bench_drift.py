@@ -0,0 +1,51 @@
+"""
+Benchmark of the batched KS drift engine against the per column scipy loop
+
+python benchmarks/bench_drift.py --rows 36000 --columns 170 --n-jobs 4
+"""
+import argparse
+import time
+import numpy as np
+from scipy.stats import ks_2samp
+from sensor.drift import ks_2samp_columns
+
+def make_data(rows:int,columns:int,missing_ratio:float,seed:int = 42):
+    rng = np.random.default_rng(seed)
+    base = rng.lognormal(size = (rows,columns)).round(2)
+    current = rng.lognormal(mean = 0.01,size = (rows // 4,columns)).round(2)
+    base[rng.random(base.shape) < missing_ratio] = np.nan
+    current[rng.random(current.shape) < missing_ratio] = np.nan
+    return base, current
+
+def scipy_loop(base:np.ndarray,current:np.ndarray)->np.ndarray:
+    return np.array([ks_2samp(base[:,column],current[:,column],nan_policy = "omit").pvalue
+        for column in range(base.shape[1])])
+
+def timeit(func,repeat:int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 36000)
+    parser.add_argument("--columns",type = int,default = 170)
+    parser.add_argument("--missing-ratio",type = float,default = 0.05)
+    parser.add_argument("--block-size",type = int,default = 32)
+    parser.add_argument("--n-jobs",type = int,default = 1)
+    parser.add_argument("--repeat",type = int,default = 3)
+    args = parser.parse_args()
+
+    base, current = make_data(rows = args.rows,columns = args.columns,missing_ratio = args.missing_ratio)
+
+    loop_time, loop_pvalues = timeit(lambda: scipy_loop(base,current),args.repeat)
+    engine_time, (_, engine_pvalues) = timeit(lambda: ks_2samp_columns(base,current,
+        block_size = args.block_size,n_jobs = args.n_jobs),args.repeat)
+
+    print(f"rows: {args.rows} columns: {args.columns} block size: {args.block_size} n_jobs: {args.n_jobs}")
+    print(f"scipy per column loop: {loop_time:.3f}s")
+    print(f"batched drift engine : {engine_time:.3f}s ({loop_time / engine_time:.1f}x)")
+    print(f"max p-value difference: {np.nanmax(np.abs(loop_pvalues - engine_pvalues)):.2e}")
@@ -0,0 +1,72 @@
+"""
+Benchmark of in memory training against xgboost external memory training from chunks of the transformed arrays
+arrays are generated and every mode runs in its own fresh process, a spawned process keeps
+the peak rss of its parent so the parent never holds the arrays
+
+python benchmarks/bench_external_memory.py --rows 300000 --columns 160 --chunk-size 50000
+"""
+import argparse
+import os
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+from sensor import utils
+from sensor.entity import config_entity, artifact_entity
+from sensor.components.model_trainer import ModelTrainer
+from sensor.instrumentation import get_peak_rss_mb
+
+def make_arrays(data_dir:str,rows:int,columns:int,seed:int = 42)->tuple:
+    """
+    write train and test arrays of the transformed artifact layout: float32 input features and int8 target
+    """
+    rng = np.random.default_rng(seed)
+    file_paths = []
+    for name,n_rows in (("train",rows),("test",rows // 4)):
+        X = rng.normal(size = (n_rows,columns)).astype(np.float32)
+        y = (X[:,:5].sum(axis = 1) + rng.normal(scale = 2.0,size = n_rows) > 3).astype(np.int8)
+        dir_path = os.path.join(data_dir,name)
+        utils.save_numpy_arrays(dir_path = dir_path,X = X,y = y)
+        file_paths.append(dir_path)
+        del X,y
+    return tuple(file_paths)
+
+def run_mode(training_mode:str,train_path:str,test_path:str,artifact_dir:str,chunk_size:int,n_threads:int)->dict:
+    training_pipeline_config = config_entity.TrainingPipelineConfig()
+    training_pipeline_config.artifact_dir = artifact_dir
+    model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config = training_pipeline_config)
+    model_trainer_config.training_mode = training_mode
+    model_trainer_config.chunk_size = chunk_size
+    model_trainer_config.n_threads = n_threads
+    model_trainer_config.expected_score = 0
+    model_trainer_config.overfitting_threshold = 1
+    data_transformation_artifact = artifact_entity.DataTransformationArtifact(transform_object_path = None,
+        transformed_train_path = train_path,transformed_test_path = test_path,
+        target_encoder_path = None,compact_transformer_path = None)
+
+    start_time = time.perf_counter()
+    model_trainer_artifact = ModelTrainer(model_trainer_config = model_trainer_config,
+        data_transformation_artifact = data_transformation_artifact).initiate_model_trainer()
+    return {"wall_time_seconds":round(time.perf_counter() - start_time,2),
+        "peak_rss_mb":round(get_peak_rss_mb(),1),
+        "f1_test_score":round(model_trainer_artifact.f1_test_score,4)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 300000)
+    parser.add_argument("--columns",type = int,default = 160)
+    parser.add_argument("--chunk-size",type = int,default = 50000)
+    parser.add_argument("--n-threads",type = int,default = os.cpu_count())
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir:
+        with context.Pool(processes = 1,maxtasksperchild = 1) as pool:
+            train_path,test_path = pool.apply(make_arrays,(data_dir,args.rows,args.columns))
+        print(f"train array: {os.path.getsize(os.path.join(train_path,'X.npy')) / 1024**2:.1f} MB")
+
+        for training_mode in ("in_memory","external_memory"):
+            with context.Pool(processes = 1,maxtasksperchild = 1) as pool:
+                result = pool.apply(run_mode,(training_mode,train_path,test_path,
+                    os.path.join(data_dir,training_mode),args.chunk_size,args.n_threads))
+            print(f"{training_mode:16s} {result}")
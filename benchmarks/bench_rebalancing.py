@@ -0,0 +1,38 @@
+"""
+Benchmark of the rebalancing strategies of data transformation against SMOTETomek of imblearn
+
+python benchmarks/bench_rebalancing.py --rows 36000 --columns 160 --n-jobs 4
+"""
+import argparse
+import time
+import numpy as np
+from imblearn.combine import SMOTETomek
+from sensor.rebalancing import Rebalancer, REBALANCING_STRATEGIES
+
+def make_data(rows:int,columns:int,minority_ratio:float,seed:int = 42)->tuple:
+    rng = np.random.default_rng(seed)
+    y = (rng.random(rows) < minority_ratio).astype(np.int64)
+    X = rng.normal(size = (rows,columns))
+    X[y == 1] += 0.3
+    return X,y
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 36000)
+    parser.add_argument("--columns",type = int,default = 160)
+    parser.add_argument("--minority-ratio",type = float,default = 0.02)
+    parser.add_argument("--n-jobs",type = int,default = 1)
+    parser.add_argument("--skip-imblearn",action = "store_true")
+    args = parser.parse_args()
+
+    X,y = make_data(rows = args.rows,columns = args.columns,minority_ratio = args.minority_ratio)
+    if not args.skip_imblearn:
+        start_time = time.perf_counter()
+        X_resampled,_ = SMOTETomek(sampling_strategy = "minority").fit_resample(X,y)
+        print(f"{'imblearn SMOTETomek':32s} {time.perf_counter() - start_time:8.2f} s rows: {len(X_resampled)}")
+
+    for strategy in REBALANCING_STRATEGIES:
+        for approximate in ((False,True) if strategy in ("smote","smotetomek") else (False,)):
+            _,_,report = Rebalancer(strategy = strategy,n_jobs = args.n_jobs,approximate = approximate).fit_resample(X,y)
+            name = f"{strategy}{' approximate' if approximate else ''}"
+            print(f"{name:32s} {report['seconds']:8.2f} s class counts: {report['class_counts_after']}")
@@ -0,0 +1,81 @@
+"""
+Benchmark of dill pickles against the object file format of sensor.serialization
+for the transformer pipeline, target encoder and xgboost model: file size, load time
+in a warm process and load time of the whole bundle in a fresh process
+
+python benchmarks/bench_serialization.py --rows 20000 --columns 160 --n-estimators 300
+"""
+import argparse
+import os
+import time
+import tempfile
+import multiprocessing
+import dill
+import numpy as np
+from sensor import serialization
+
+def make_objects(rows:int,columns:int,n_estimators:int,seed:int = 42)->dict:
+    #sklearn and xgboost are imported here so fresh processes loading the bundle import them while loading
+    import pandas as pd
+    from sklearn.preprocessing import LabelEncoder
+    from xgboost import XGBClassifier
+    from sensor.components.data_transformation import DataTransformation
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size = (rows,columns)).astype(np.float32),columns = [f"sensor_{i}" for i in range(columns)])
+    df = df.mask(rng.random(df.shape) < 0.05)
+    target = np.where(df.iloc[:,:5].sum(axis = 1) + rng.normal(scale = 2.0,size = rows) > 3,"pos","neg")
+
+    transformer = DataTransformation.get_data_tranformer_object().fit(df)
+    target_encoder = LabelEncoder().fit(target)
+    model = XGBClassifier(n_estimators = n_estimators,max_depth = 6).fit(transformer.transform(df),target_encoder.transform(target))
+    return {"transformer":transformer,"target_encoder":target_encoder,"model":model}
+
+def load_dill(file_path:str):
+    with open(file_path,"rb") as file_obj:
+        return dill.load(file_obj)
+
+def load_bundle(file_paths:list,fmt:str)->float:
+    #runs in a fresh process, so imports of sklearn and xgboost pulled in by loading are part of the time
+    start_time = time.perf_counter()
+    for file_path in file_paths:
+        load_dill(file_path) if fmt == "dill" else serialization.load(file_path)
+    return time.perf_counter() - start_time
+
+def best_time(func,repeats:int)->float:
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 20000)
+    parser.add_argument("--columns",type = int,default = 160)
+    parser.add_argument("--n-estimators",type = int,default = 300)
+    parser.add_argument("--repeats",type = int,default = 20)
+    args = parser.parse_args()
+
+    objects = make_objects(rows = args.rows,columns = args.columns,n_estimators = args.n_estimators)
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as data_dir:
+        file_paths = {"dill":[],"object_file":[]}
+        for name,obj in objects.items():
+            dill_path = os.path.join(data_dir,f"{name}.pkl")
+            with open(dill_path,"wb") as file_obj:
+                dill.dump(obj,file_obj)
+            object_path = os.path.join(data_dir,f"{name}.obj")
+            serialization.dump(obj,file_path = object_path)
+            file_paths["dill"].append(dill_path)
+            file_paths["object_file"].append(object_path)
+
+            dill_seconds = best_time(lambda: load_dill(dill_path),repeats = args.repeats)
+            object_seconds = best_time(lambda: serialization.load(object_path),repeats = args.repeats)
+            print(f"{name:16s} dill: {os.path.getsize(dill_path) / 1024:9.1f} KB {dill_seconds * 1000:8.2f} ms"
+                f" | object file: {os.path.getsize(object_path) / 1024:9.1f} KB {object_seconds * 1000:8.2f} ms")
+
+        for fmt,paths in file_paths.items():
+            with context.Pool(processes = 1,maxtasksperchild = 1) as pool:
+                seconds = pool.apply(load_bundle,(paths,fmt))
+            print(f"cold load of bundle with {fmt:12s} {seconds * 1000:8.2f} ms")
@@ -0,0 +1,182 @@
+"""
+Benchmark of every pipeline stage and utils I/O helper on synthetic APS data
+Every row count runs offline in its own fresh process and working directory, with a mongomock
+client in place of mongodb. Results are appended to a json lines file with the git commit
+they were measured on, so two commits can be compared.
+
+pip install -r benchmarks/requirements.txt
+python benchmarks/bench_stages.py --rows 10000 100000 1000000
+python benchmarks/bench_stages.py --compare <commit> <other commit>
+"""
+import argparse
+import json
+import os, sys
+import time
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+from datetime import datetime
+from synthetic_aps import write_aps_csv
+
+RESULTS_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),"results","bench_stages.jsonl")
+
+def get_commit()->str:
+    """
+    return commit of the working tree, suffixed with -dirty when it has uncommitted changes
+    """
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git","rev-parse","--short","HEAD"],cwd = repo_dir,capture_output = True,text = True,check = True).stdout.strip()
+        is_dirty = subprocess.run(["git","status","--porcelain","--untracked-files=no"],cwd = repo_dir,
+            capture_output = True,text = True,check = True).stdout.strip() != ""
+        return f"{commit}-dirty" if is_dirty else commit
+    except (OSError,subprocess.CalledProcessError):
+        return "unknown"
+
+class StageTimer:
+    """
+    Runs benchmark steps in order and keeps wall time and peak rss of the process after each of them
+    """
+
+    def __init__(self):
+        self.results = []
+
+    def run(self,name:str,func,*args,**kwargs):
+        from sensor.instrumentation import get_peak_rss_mb
+        start_time = time.perf_counter()
+        try:
+            value = func(*args,**kwargs)
+            error = None
+        except Exception as e:
+            value = None
+            error = str(e)[-500:]
+        self.results.append({"name":name,"seconds":round(time.perf_counter() - start_time,4),
+            "peak_rss_mb":round(get_peak_rss_mb(),1),"error":error})
+        print(f"{name:56s} {self.results[-1]['seconds']:10.3f} s{'  ERROR ' + error[-200:] if error else ''}",flush = True)
+        if error is not None:
+            raise RuntimeError(f"benchmark step: {name} failed")
+        return value
+
+def run_benchmark(rows:int,work_dir:str,n_jobs:int)->list:
+    """
+    run every step on rows synthetic rows, stops at the first failing step as the next ones depend on it
+    """
+    #configs place artifacts, logs and registry in the current working directory
+    os.chdir(work_dir)
+    import mongomock
+    from sensor import utils
+    from sensor.config import set_mongo_client
+    from sensor.bulk_loader import BulkLoader
+    from sensor.entity import config_entity
+    from sensor.components.data_ingestion import DataIngestion
+    from sensor.components.data_validation import DataValidation
+    from sensor.components.data_transformation import DataTransformation
+    from sensor.components.model_trainer import ModelTrainer
+    from sensor.components.model_evaluation import ModelEvaluation
+    from sensor.components.model_pusher import ModelPusher
+
+    set_mongo_client(mongomock.MongoClient())
+    timer = StageTimer()
+    try:
+        training_pipeline_config = config_entity.TrainingPipelineConfig()
+        training_pipeline_config.use_cache = False
+        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config = training_pipeline_config)
+        database_name,collection_name = data_ingestion_config.database_name,data_ingestion_config.collection_name
+
+        #base file of data validation is another sample of the same distribution
+        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config = training_pipeline_config)
+        write_aps_csv(file_path = data_validation_config.base_file_path,rows = min(rows,60000),seed = 7)
+        file_path = timer.run("synthetic_aps.write_aps_csv",write_aps_csv,file_path = "aps_synthetic.csv",rows = rows)
+        timer.run("BulkLoader.load",BulkLoader(database_name = database_name,collection_name = collection_name,
+            n_jobs = n_jobs).load,file_path = file_path)
+
+        timer.run("utils.get_collection_as_dataframe_chunks",lambda: sum(len(df) for df in
+            utils.get_collection_as_dataframe_chunks(database_name = database_name,collection_name = collection_name)))
+        timer.run("utils.get_collection_as_dataframe_partitions",lambda: sum(len(df) for df in
+            utils.get_collection_as_dataframe_partitions(database_name = database_name,collection_name = collection_name,n_jobs = n_jobs)))
+
+        data_ingestion_artifact = timer.run("DataIngestion.initiate_data_ingestion",
+            DataIngestion(data_ingestion_config = data_ingestion_config).initiate_data_ingestion)
+        train_df = timer.run("utils.read_dataframe",utils.read_dataframe,file_path = data_ingestion_artifact.train_file_path)
+        for file_format in ("parquet","csv"):
+            def write_dataframe():
+                with utils.DataFrameWriter(file_path = os.path.join(work_dir,f"train_copy.{file_format}")) as writer:
+                    writer.write(train_df)
+            timer.run(f"utils.DataFrameWriter.write {file_format}",write_dataframe)
+
+        timer.run("DataValidation.initiate_data_validation",DataValidation(data_validation_config = data_validation_config,
+            data_ingestion_artifact = data_ingestion_artifact).initiate_data_validation)
+
+        data_transformation_artifact = timer.run("DataTransformation.initiate_data_transformation",DataTransformation(
+            data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config = training_pipeline_config),
+            data_ingestion_artifact = data_ingestion_artifact).initiate_data_transformation)
+        timer.run("utils.load_numpy_arrays",lambda: {name:array.sum() for name,array in
+            utils.load_numpy_arrays(dir_path = data_transformation_artifact.transformed_train_path).items()})
+
+        #synthetic data is not judged, only timed
+        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config = training_pipeline_config)
+        model_trainer_config.expected_score = 0
+        model_trainer_config.overfitting_threshold = 1
+        model_trainer_artifact = timer.run("ModelTrainer.initiate_model_trainer",ModelTrainer(model_trainer_config = model_trainer_config,
+            data_transformation_artifact = data_transformation_artifact).initiate_model_trainer)
+        model = timer.run("utils.load_object",utils.load_object,file_path = model_trainer_artifact.model_path)
+        timer.run("utils.save_object",utils.save_object,file_path = os.path.join(work_dir,"model_copy","model.pkl"),obj = model)
+
+        model_evaluation_artifact = timer.run("ModelEvaluation.initiate_model_evaluation",ModelEvaluation(
+            model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config = training_pipeline_config),
+            data_ingestion_artifact = data_ingestion_artifact,
+            data_transformation_artifact = data_transformation_artifact,
+            model_trainer_artifact = model_trainer_artifact).initiate_model_evaluation)
+        if model_evaluation_artifact.is_model_accepted:
+            timer.run("ModelPusher.initiate_model_pusher",ModelPusher(
+                model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config = training_pipeline_config),
+                data_transformation_artifact = data_transformation_artifact,
+                model_trainer_artifact = model_trainer_artifact).initiate_model_pusher)
+    except RuntimeError:
+        pass
+    return timer.results
+
+def compare(results_file_path:str,base_commit:str,commit:str)->None:
+    """
+    print time of every step of the latest run of two commits and their ratio
+    """
+    latest = dict()
+    with open(results_file_path) as file_obj:
+        for line in file_obj:
+            record = json.loads(line)
+            if record["commit"] in (base_commit,commit) and record["error"] is None:
+                latest[(record["commit"],record["rows"],record["name"])] = record["seconds"]
+    keys = sorted({(rows,name) for _,rows,name in latest})
+    print(f"{'rows':>9s} {'step':56s} {base_commit:>12s} {commit:>12s} {'ratio':>7s}")
+    for rows,name in keys:
+        base_seconds,seconds = latest.get((base_commit,rows,name)),latest.get((commit,rows,name))
+        ratio = f"{seconds / base_seconds:7.2f}" if base_seconds and seconds else f"{'-':>7s}"
+        print(f"{rows:9d} {name:56s} {base_seconds or float('nan'):12.3f} {seconds or float('nan'):12.3f} {ratio}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,nargs = "+",default = [10000,100000,1000000])
+    parser.add_argument("--n-jobs",type = int,default = 4)
+    parser.add_argument("--results-file-path",default = RESULTS_FILE_PATH)
+    parser.add_argument("--compare",nargs = 2,metavar = ("BASE_COMMIT","COMMIT"),default = None)
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        compare(results_file_path = args.results_file_path,base_commit = args.compare[0],commit = args.compare[1])
+        sys.exit(0)
+
+    commit = get_commit()
+    os.makedirs(os.path.dirname(args.results_file_path),exist_ok = True)
+    context = multiprocessing.get_context("spawn")
+    for rows in args.rows:
+        print(f"{rows} rows on commit {commit}")
+        with tempfile.TemporaryDirectory() as work_dir:
+            with context.Pool(processes = 1,maxtasksperchild = 1) as pool:
+                results = pool.apply(run_benchmark,(rows,work_dir,args.n_jobs))
+        with open(args.results_file_path,"a") as file_obj:
+            for result in results:
+                record = {"commit":commit,"timestamp":datetime.now().isoformat(timespec = "seconds"),
+                    "machine":platform.node(),"cpu_count":os.cpu_count(),"rows":rows,**result}
+                file_obj.write(json.dumps(record) + "\n")
+    print(f"results appended to {args.results_file_path}")
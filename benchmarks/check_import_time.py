@@ -0,0 +1,46 @@
+"""
+Import time budget of the prediction path
+every module is imported in fresh interpreters, the best time of all runs is compared to the budget
+and modules of training only libraries must not be imported on the way, exit code is 1 when a check fails
+
+python benchmarks/check_import_time.py --module sensor.predictor --budget-ms 1000
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+#libraries only training components may import
+TRAINING_ONLY_MODULES = ["xgboost","sklearn","imblearn","scipy","pymongo","dill"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start_time
+print(json.dumps({{"seconds":seconds,"modules":sorted(name for name in sys.modules if "." not in name)}}))
+"""
+
+def measure_import(module:str)->dict:
+    result = subprocess.run([sys.executable,"-c",IMPORT_SCRIPT.format(module = module)],
+        capture_output = True,text = True,check = True)
+    #the package prints a line when it loads the .env file, the measurement is the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module",action = "append",default = None)
+    parser.add_argument("--budget-ms",type = float,default = 1000)
+    parser.add_argument("--runs",type = int,default = 5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or ["sensor.predictor","sensor.serving"]:
+        measurements = [measure_import(module) for _ in range(args.runs)]
+        best_ms = min(measurement["seconds"] for measurement in measurements) * 1000
+        heavy_modules = [name for name in TRAINING_ONLY_MODULES if name in measurements[0]["modules"]]
+        is_ok = best_ms <= args.budget_ms and len(heavy_modules) == 0
+        failed = failed or not is_ok
+        print(f"{'ok' if is_ok else 'FAIL':4s} import {module}: {best_ms:.1f} ms (budget {args.budget_ms:.0f} ms)"
+            f" training only modules imported: {heavy_modules}")
+    sys.exit(1 if failed else 0)
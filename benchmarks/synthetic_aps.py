@@ -0,0 +1,81 @@
+"""
+Generator of synthetic data shaped like the APS failure dataset: a "class" target with
+about 1 pos for 59 neg rows, 170 non negative counter columns named like the APS ones,
+"na" tokens in every column and a few columns missing in most rows.
+Rows are generated chunk by chunk from seed, the same arguments always give the same file.
+
+python benchmarks/synthetic_aps.py --rows 60000 --file-path aps_synthetic.csv
+"""
+import argparse
+import string
+import numpy as np
+import pandas as pd
+
+N_COLUMNS = 170
+POS_RATIO = 1000 / 60000
+#share of columns missing in most rows, like br_000 or cr_000 of the APS dataset
+HEAVILY_MISSING_RATIO = 0.04
+
+def get_column_names(n_columns:int = N_COLUMNS)->list:
+    """
+    return APS like column names: aa_000, ab_000 ... with every 7th prefix a histogram of 10 bins ag_000 ... ag_009
+    """
+    prefixes = [first + second for first in string.ascii_lowercase for second in string.ascii_lowercase]
+    column_names = []
+    for index,prefix in enumerate(prefixes):
+        n_bins = 10 if index % 7 == 6 else 1
+        column_names.extend(f"{prefix}_{bin_number:03d}" for bin_number in range(n_bins))
+        if len(column_names) >= n_columns:
+            return column_names[:n_columns]
+    return column_names
+
+def get_column_profile(n_columns:int,seed:int)->dict:
+    """
+    return per column scale of values, missing ratio and shift of pos rows, fixed for a seed
+    """
+    rng = np.random.default_rng(seed)
+    missing_ratio = rng.uniform(0.0,0.08,size = n_columns)
+    heavily_missing = rng.random(n_columns) < HEAVILY_MISSING_RATIO
+    missing_ratio[heavily_missing] = rng.uniform(0.7,0.85,size = heavily_missing.sum())
+    return {"log_scale":rng.uniform(1.0,12.0,size = n_columns),
+        "missing_ratio":missing_ratio,
+        #about a third of the columns tell failures apart
+        "pos_shift":np.where(rng.random(n_columns) < 0.3,rng.uniform(0.5,2.5,size = n_columns),0.0)}
+
+def iter_aps_chunks(rows:int,chunk_size:int = 100000,n_columns:int = N_COLUMNS,pos_ratio:float = POS_RATIO,
+                    seed:int = 42)->pd.DataFrame:
+    """
+    yield dataframes of at most chunk_size rows, missing values are the "na" token like in the APS csv
+    """
+    column_names = get_column_names(n_columns = n_columns)
+    profile = get_column_profile(n_columns = n_columns,seed = seed)
+    for chunk_number,start in enumerate(range(0,rows,chunk_size)):
+        n_rows = min(chunk_size,rows - start)
+        rng = np.random.default_rng([seed,chunk_number])
+        is_pos = rng.random(n_rows) < pos_ratio
+        #counters: log normal magnitudes rounded to integers, failures have larger counts on informative columns
+        log_values = rng.normal(loc = profile["log_scale"],scale = 1.5,size = (n_rows,n_columns))
+        log_values[is_pos] += profile["pos_shift"]
+        values = np.floor(np.expm1(np.clip(log_values,0,None)))
+        values[rng.random((n_rows,n_columns)) < profile["missing_ratio"]] = np.nan
+
+        df = pd.DataFrame(values,columns = column_names)
+        df.insert(0,"class",np.where(is_pos,"pos","neg"))
+        yield df
+
+def write_aps_csv(file_path:str,rows:int,chunk_size:int = 100000,seed:int = 42)->str:
+    """
+    write synthetic APS csv of rows rows chunk by chunk
+    """
+    for chunk_number,df in enumerate(iter_aps_chunks(rows = rows,chunk_size = chunk_size,seed = seed)):
+        df.to_csv(file_path,mode = "w" if chunk_number == 0 else "a",header = chunk_number == 0,
+            index = False,na_rep = "na",float_format = "%.0f")
+    return file_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows",type = int,default = 60000)
+    parser.add_argument("--file-path",default = "aps_synthetic.csv")
+    parser.add_argument("--seed",type = int,default = 42)
+    args = parser.parse_args()
+    print(write_aps_csv(file_path = args.file_path,rows = args.rows,seed = args.seed))
@@ -1,25 +1,25 @@
-import pymongo
-import pandas as pd
-import json
-
-# Provide the mongodb localhost url to connect python to mongodb.
-client = pymongo.MongoClient("mongodb://localhost:27017/neurolabDB")
+import argparse
+from sensor.bulk_loader import BulkLoader
 
+# Provide the mongodb url to connect python to mongodb with MONGODB_URL environment variable.
 data_file_path = '/config/workspace/aps_failure_training_set1.csv'
 database_name = 'aps'
 collection_name = 'sensor'
 
 if __name__ == '__main__':
-    df = pd.read_csv(data_file_path)
-    print(f'Dataset contains {df.shape[0]} rows and {df.shape[1]} columns')
-
-    #convert dataframe to json so that we can dump these records in mongo db
-    df.reset_index(drop=True,inplace=True)
-
-    json_records = list(json.loads(df.T.to_json()).values())
-
-    #print(json_records)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file-path",default = data_file_path)
+    parser.add_argument("--database-name",default = database_name)
+    parser.add_argument("--collection-name",default = collection_name)
+    parser.add_argument("--batch-size",type = int,default = 10000)
+    parser.add_argument("--n-jobs",type = int,default = 4)
+    parser.add_argument("--checkpoint-file-path",default = None)
+    args = parser.parse_args()
 
-    #insert converted json record into MongoDB
-    client[database_name][collection_name].insert_many(json_records)
-    
\ No newline at end of file
+    #csv is streamed in batches, inserted by several workers and the load resumes where a previous run stopped
+    bulk_loader = BulkLoader(database_name = args.database_name,collection_name = args.collection_name,
+        batch_size = args.batch_size,n_jobs = args.n_jobs,
+        checkpoint_file_path = args.checkpoint_file_path)
+    load_report = bulk_loader.load(file_path = args.file_path)
+    print(f"Inserted {load_report['rows_inserted']} of {load_report['rows']} rows "
+        f"in {load_report['seconds']} s ({load_report['rows_per_second']} rows per second)")
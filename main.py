@@ -1,48 +1,14 @@
-import sys, os
-from sensor.logger import logging
+import sys
 from sensor.exception import SensorException
-from sensor.utils import get_collection_as_datarame
 from sensor.entity import config_entity
-from sensor.components import data_ingestion
-from sensor.components.data_validation import DataValidation
-from sensor.components.data_transformation import DataTransformation
-from sensor.components.model_trainer import ModelTrainer
-from sensor.components.model_evaluation import ModelEvaluation
+from sensor.pipeline.training_pipeline import TrainingPipeline
 
-dd
 if __name__ =="__main__":
      try:
-          #data ingestion 
           training_pipeline_config = config_entity.TrainingPipelineConfig()
-          data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config = training_pipeline_config)
-          print(data_ingestion_config.to_dict())
-          data_ingestion = data_ingestion.DataIngestion(data_ingestion_config = data_ingestion_config)
-          data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
-          
-          #data validation
-          data_validation_config = config_entity.DataValidationConfig(training_pipeline_config = training_pipeline_config)
-          data_validation = DataValidation(data_validation_config = data_validation_config,
-                                        data_ingestion_artifact = data_ingestion_artifact)
-          data_validation_artifact = data_validation.initiate_data_validation()
-
-          #data transformation
-          data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config = training_pipeline_config)
-          data_transformation = DataTransformation(data_transformation_config = data_transformation_config ,
-                                        data_ingestion_artifact = data_ingestion_artifact)
-          data_transformation_artifact = data_transformation.initiate_data_transformation()
-
-          #model trainer
-          model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config = training_pipeline_config)
-          model_trainer = ModelTrainer(model_trainer_config = model_trainer_config,
-                                             data_transformation_artifact = data_transformation_artifact)
-          model_trainer_artifact = model_trainer.initiate_model_trainer()
-
-          model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config = training_pipeline_config)
-          model_eval = ModelEvaluation(model_eval_config = model_eval_config,
-                                             data_ingestion_artifact = data_ingestion_artifact,
-                                             data_transformation_artifact = data_transformation_artifact,
-                                             model_trainer_artifact = model_trainer_artifact)
-          model_eval_artifact = model_eval.initiate_model_evaluation()
+          training_pipeline = TrainingPipeline(training_pipeline_config = training_pipeline_config)
+          artifacts = training_pipeline.run()
+          print(artifacts)
 
      except Exception as e:
-            raise SensorException(e, sys)
\ No newline at end of file
+            raise SensorException(e, sys)
@@ -0,0 +1,137 @@
+import os, sys
+import numpy as np
+import pandas as pd
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor.config import TARGET_COLUMN
+from sensor import utils, drift
+
+PROFILE_FILE_NAME = "profile.yaml"
+SORTED_VALUES_FILE_NAME = "sorted_values.npy"
+HASH_INDEX_FILE_NAME = "hash_index.yaml"
+
+class BaselineProfile:
+    """
+    Precomputed profile of the base dataset used by data validation.
+    It keeps null ratio and dtype of every column, the columns retained after
+    dropping missing value columns and column wise sorted values of retained
+    numeric columns, so drift can be computed without reading the base file again.
+    Profiles are stored in profile_dir keyed by content hash of the base file and the float dtype
+    its values were parsed in, so they tie exactly with train and test values parsed in the same dtype.
+    """
+
+    def __init__(self,profile:dict,sorted_values:np.ndarray):
+        try:
+            self.base_file_hash:str = profile["base_file_hash"]
+            self.missing_threshold:float = profile["missing_threshold"]
+            self.float_dtype:str = profile["float_dtype"]
+            self.null_ratio:dict = profile["null_ratio"]
+            self.dtypes:dict = profile["dtypes"]
+            self.dropped_columns:list = profile["dropped_columns"]
+            self.columns:list = profile["columns"]
+            self.numeric_columns:list = profile["numeric_columns"]
+            self.sorted_values = sorted_values
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def get_profile_dir(cls,profile_dir:str,base_file_hash:str,missing_threshold:float,float_dtype:str)->str:
+        return os.path.join(profile_dir,f"{base_file_hash}_{missing_threshold}_{float_dtype}")
+
+    @classmethod
+    def get_base_file_hash(cls,base_file_path:str,profile_dir:str)->str:
+        """
+        return content hash of base file, hash is only recomputed when size or modification time changes
+        """
+        try:
+            os.makedirs(profile_dir,exist_ok = True)
+            return utils.get_cached_file_hash(file_path = base_file_path,
+                hash_index_file_path = os.path.join(profile_dir,HASH_INDEX_FILE_NAME))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def build(cls,base_file_path:str,missing_threshold:float,base_file_hash:str,float_dtype:str = "float64")->"BaselineProfile":
+        """
+        read base file once and compute its profile
+        float_dtype: dtype sensor values are parsed in, values are rounded through it before sorting
+        """
+        try:
+            logging.info(f"building baseline profile of base file: {base_file_path}")
+            #'na' values are parsed directly as NaN
+            base_df = pd.read_csv(base_file_path,na_values = ["na"])
+
+            null_report = base_df.isnull().mean()
+            dropped_columns = list(null_report[null_report>missing_threshold].index)
+            base_df.drop(dropped_columns,axis = 1,inplace = True)
+
+            numeric_columns = [column for column in base_df.columns if column != TARGET_COLUMN]
+            base_df = utils.convert_column_float(df = base_df,exclude_columns = [TARGET_COLUMN],dtype = float_dtype)
+            #values above 2^24 only tie with float32 train and test values when rounded through float32 as well
+            sorted_values, _ = drift.sort_columns(base_df[numeric_columns].to_numpy(dtype = float_dtype).astype(np.float64))
+
+            profile = {
+                "base_file_hash":base_file_hash,
+                "missing_threshold":float(missing_threshold),
+                "float_dtype":float_dtype,
+                "null_ratio":{column:float(ratio) for column,ratio in null_report.items()},
+                "dtypes":{column:str(dtype) for column,dtype in base_df.dtypes.items()},
+                "dropped_columns":dropped_columns,
+                "columns":list(base_df.columns),
+                "numeric_columns":numeric_columns}
+            return cls(profile = profile,sorted_values = np.ascontiguousarray(sorted_values))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def save(self,profile_dir:str)->None:
+        try:
+            profile_dir = BaselineProfile.get_profile_dir(profile_dir = profile_dir,
+                base_file_hash = self.base_file_hash,missing_threshold = self.missing_threshold,float_dtype = self.float_dtype)
+            os.makedirs(profile_dir,exist_ok = True)
+            np.save(os.path.join(profile_dir,SORTED_VALUES_FILE_NAME),self.sorted_values)
+
+            #profile yaml is written last, a profile without yaml is treated as missing
+            utils.write_yaml_file(file_path = os.path.join(profile_dir,PROFILE_FILE_NAME),data = {
+                "base_file_hash":self.base_file_hash,
+                "missing_threshold":self.missing_threshold,
+                "float_dtype":self.float_dtype,
+                "null_ratio":self.null_ratio,
+                "dtypes":self.dtypes,
+                "dropped_columns":self.dropped_columns,
+                "columns":self.columns,
+                "numeric_columns":self.numeric_columns})
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load_or_build(cls,base_file_path:str,profile_dir:str,missing_threshold:float,float_dtype:str = "float64")->"BaselineProfile":
+        """
+        return stored profile of base file, profile is built and stored if not available
+        base_file_path: location of base dataset
+        profile_dir: directory where profiles are stored
+        missing_threshold: columns with higher null ratio are dropped
+        float_dtype: dtype train and test values are parsed in
+        """
+        try:
+            base_file_hash = cls.get_base_file_hash(base_file_path = base_file_path,profile_dir = profile_dir)
+            stored_profile_dir = cls.get_profile_dir(profile_dir = profile_dir,
+                base_file_hash = base_file_hash,missing_threshold = missing_threshold,float_dtype = float_dtype)
+            profile_file_path = os.path.join(stored_profile_dir,PROFILE_FILE_NAME)
+
+            if os.path.exists(profile_file_path):
+                logging.info(f"loading baseline profile: {stored_profile_dir}")
+                #sorted values are memory mapped, pages are read only when drift is computed
+                return cls(profile = utils.read_yaml_file(profile_file_path),
+                    sorted_values = np.load(os.path.join(stored_profile_dir,SORTED_VALUES_FILE_NAME),mmap_mode = "r"))
+
+            profile = cls.build(base_file_path = base_file_path,missing_threshold = missing_threshold,
+                base_file_hash = base_file_hash,float_dtype = float_dtype)
+            profile.save(profile_dir = profile_dir)
+            return profile
+
+        except Exception as e:
+            raise SensorException(e, sys)
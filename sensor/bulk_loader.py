@@ -0,0 +1,186 @@
+import os, sys
+import time
+import uuid
+import json
+import struct
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import pandas as pd
+from bson import ObjectId
+from sensor.config import get_mongo_client
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import utils
+
+#error code of a document whose _id is already in the collection
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+class BulkLoader:
+    """
+    Loads a csv file into a collection in batches of batch_size rows.
+    The file is streamed, every batch is converted to documents without a json round trip
+    and inserted unordered by one of n_jobs workers over the pooled mongodb client.
+    Document _id is an ObjectId made of the load start time, a hash of the file and the row number,
+    so ids grow in row order after the documents already in the collection, two files never share ids
+    and a load stopped midway resumes after the last batch recorded in the checkpoint file,
+    inserting batches written after the checkpoint again as a no-op.
+    """
+
+    def __init__(self,database_name:str,collection_name:str,batch_size:int = 10000,n_jobs:int = 4,
+                checkpoint_file_path:Optional[str] = None):
+        try:
+            self.database_name = database_name
+            self.collection_name = collection_name
+            self.batch_size = batch_size
+            self.n_jobs = n_jobs
+            self.checkpoint_file_path = os.path.abspath(checkpoint_file_path or os.path.join("data_dump",
+                f"{database_name}.{collection_name}.checkpoint.yaml"))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def get_file_signature(cls,file_path:str)->dict:
+        """
+        return size and modification time of a file, a checkpoint is only used for the file it was written for
+        """
+        file_stat = os.stat(file_path)
+        return {"file_path":os.path.abspath(file_path),"size":file_stat.st_size,"mtime_ns":file_stat.st_mtime_ns}
+
+    @classmethod
+    def get_id_prefix(cls,file_path:str)->str:
+        """
+        return first 7 bytes of the ObjectIds of a new load of file as hex:
+        4 bytes of current time like any ObjectId and 3 bytes of hash of the file signature
+        """
+        file_hash = hashlib.sha256(json.dumps(BulkLoader.get_file_signature(file_path),sort_keys = True).encode()).digest()
+        return (struct.pack(">I",int(time.time())) + file_hash[:3]).hex()
+
+    def read_checkpoint(self,file_path:str)->Optional[dict]:
+        """
+        return checkpoint with rows of file already loaded and id prefix of the load, None when there is no checkpoint of this file
+        """
+        try:
+            if not os.path.exists(self.checkpoint_file_path):
+                return None
+            checkpoint = utils.read_yaml_file(self.checkpoint_file_path)
+            if checkpoint.get("file") != BulkLoader.get_file_signature(file_path) or "id_prefix" not in checkpoint:
+                logging.info(f"checkpoint: {self.checkpoint_file_path} belongs to another file, it is ignored")
+                return None
+            return checkpoint
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def write_checkpoint(self,file_path:str,id_prefix:str,rows_loaded:int)->None:
+        try:
+            checkpoint = {"file":BulkLoader.get_file_signature(file_path),"id_prefix":id_prefix,"rows_loaded":rows_loaded}
+            tmp_file_path = f"{self.checkpoint_file_path}.{uuid.uuid4().hex}.tmp"
+            utils.write_yaml_file(file_path = tmp_file_path,data = checkpoint)
+            os.replace(tmp_file_path,self.checkpoint_file_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_documents(self,df:pd.DataFrame,start_row:int,id_prefix:str)->list:
+        """
+        return documents of a chunk of rows starting at start_row of file
+        missing values become null like they did with the json export of data_dump.py
+        _id is id prefix of the load followed by 5 bytes of row number
+        """
+        try:
+            documents = df.astype(object).where(df.notna(),None).to_dict("records")
+            prefix = bytes.fromhex(id_prefix)
+            for row_number,document in enumerate(documents,start = start_row):
+                document["_id"] = ObjectId(prefix + row_number.to_bytes(5,"big"))
+            return documents
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def insert_batch(self,documents:list)->int:
+        """
+        insert documents unordered, documents already in the collection are skipped
+        ================================
+        return number of inserted documents
+        """
+        try:
+            from pymongo.errors import BulkWriteError
+            collection = get_mongo_client()[self.database_name][self.collection_name]
+            try:
+                return len(collection.insert_many(documents,ordered = False).inserted_ids)
+            except BulkWriteError as e:
+                #a batch sent again after a restart only fails on duplicate _id
+                other_errors = [error for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY_ERROR_CODE]
+                if len(other_errors) > 0:
+                    raise Exception(f"insert of batch failed: {other_errors[:5]}")
+                return e.details["nInserted"]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def load(self,file_path:str)->dict:
+        """
+        load csv file into the collection, resuming after the rows recorded in the checkpoint file
+        ================================
+        return dictionary with rows inserted, rows skipped as already loaded and throughput
+        """
+        try:
+            start_time = time.perf_counter()
+            checkpoint = self.read_checkpoint(file_path = file_path)
+            is_resumed = checkpoint is not None
+            if is_resumed:
+                id_prefix,rows_loaded = checkpoint["id_prefix"],checkpoint["rows_loaded"]
+            else:
+                #checkpoint is written before the first batch, so a restart always reuses the ids of this load
+                id_prefix,rows_loaded = BulkLoader.get_id_prefix(file_path = file_path),0
+                self.write_checkpoint(file_path = file_path,id_prefix = id_prefix,rows_loaded = rows_loaded)
+            logging.info(f"loading file: {file_path} into [{self.database_name}][{self.collection_name}] from row: {rows_loaded}")
+
+            #rows before the checkpoint are skipped by the csv parser, the header line is kept
+            #every chunk is parsed at once so a column of a chunk gets a single type
+            df_chunks = pd.read_csv(file_path,chunksize = self.batch_size,skiprows = range(1,rows_loaded + 1),low_memory = False)
+            rows_resumed = rows_loaded
+            rows_inserted = 0
+
+            def complete_batch(batch:tuple)->None:
+                nonlocal rows_loaded,rows_inserted
+                rows_loaded,n_rows,future = batch
+                n_inserted = future.result()
+                #only batches after the checkpoint of a resumed load can already be in the collection
+                if n_inserted < n_rows and not is_resumed:
+                    raise Exception(f"{n_rows - n_inserted} of {n_rows} rows before row: {rows_loaded} of a new load "
+                        f"have an _id already in [{self.database_name}][{self.collection_name}]")
+                rows_inserted += n_inserted
+                self.write_checkpoint(file_path = file_path,id_prefix = id_prefix,rows_loaded = rows_loaded)
+
+            with ThreadPoolExecutor(max_workers = self.n_jobs) as executor:
+                #batches are checkpointed in file order, only a bounded number of them is in flight
+                pending = deque()
+                start_row = rows_loaded
+                for df in df_chunks:
+                    #a file loaded up to its last row still yields an empty chunk with the header
+                    if len(df) == 0:
+                        continue
+                    documents = self.get_documents(df = df,start_row = start_row,id_prefix = id_prefix)
+                    start_row += len(df)
+                    pending.append((start_row,len(df),executor.submit(self.insert_batch,documents)))
+                    while len(pending) >= 2 * self.n_jobs or (len(pending) > 0 and pending[0][2].done()):
+                        complete_batch(pending.popleft())
+                while len(pending) > 0:
+                    complete_batch(pending.popleft())
+
+            seconds = time.perf_counter() - start_time
+            load_report = {"file_path":file_path,
+                "rows":rows_loaded,
+                "rows_resumed":rows_resumed,
+                "rows_inserted":rows_inserted,
+                "seconds":round(seconds,3),
+                "rows_per_second":round((rows_loaded - rows_resumed) / seconds,1) if seconds > 0 else None}
+            logging.info(f"load finished: {load_report}")
+            return load_report
+
+        except Exception as e:
+            raise SensorException(e, sys)
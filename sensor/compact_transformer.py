@@ -0,0 +1,158 @@
+import sys
+import numpy as np
+import pandas as pd
+from typing import Optional, TYPE_CHECKING
+from sensor.exception import SensorException
+
+#sklearn is only needed to export a fitted pipeline, loading and transforming never import it
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
+
+#rows transformed at a time, a block of every intermediate stays in cpu cache
+BLOCK_SIZE = 1024
+
+class CompactTransformer:
+    """
+    Inference form of the fitted SimpleImputer + RobustScaler pipeline.
+    Only the fill, center and scale vectors are kept as float32 arrays and
+    transform applies impute and scale in a single pass over a float32 buffer,
+    without sklearn input validation or intermediate copies.
+    Missing values are filled with the imputer statistic already centered and
+    scaled, so the result is the one of the sklearn pipeline up to float32 rounding.
+    """
+
+    def __init__(self,feature_names_in:Optional[np.ndarray],keep_indices:Optional[np.ndarray],
+                center:np.ndarray,scale:np.ndarray,scaled_fill:np.ndarray):
+        try:
+            self.feature_names_in_ = feature_names_in
+            #indices of input columns kept by the imputer, None when every column is kept
+            self.keep_indices = keep_indices
+            self.center = center
+            self.scale = scale
+            self.scaled_fill = scaled_fill
+            self.column_runs = CompactTransformer.get_column_runs(keep_indices = keep_indices)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @property
+    def n_features_out(self)->int:
+        return len(self.scale)
+
+    @classmethod
+    def get_column_runs(cls,keep_indices:Optional[np.ndarray])->Optional[list]:
+        """
+        return kept input columns as (input start, input stop, output start) runs of consecutive columns
+        so they are copied as slices instead of gathered one by one
+        """
+        if keep_indices is None:
+            return None
+        run_starts = np.flatnonzero(np.diff(keep_indices,prepend = -2) != 1)
+        run_stops = np.append(run_starts[1:],len(keep_indices))
+        return [(int(keep_indices[start]),int(keep_indices[stop - 1]) + 1,int(start))
+            for start,stop in zip(run_starts,run_stops)]
+
+    @classmethod
+    def from_pipeline(cls,pipeline:"Pipeline")->"CompactTransformer":
+        """
+        export fitted pipeline of DataTransformation.get_data_tranformer_object
+        """
+        try:
+            from sklearn.impute import SimpleImputer
+            from sklearn.preprocessing import RobustScaler
+            steps = [step for _,step in pipeline.steps]
+            if len(steps) != 2 or not isinstance(steps[0],SimpleImputer) or not isinstance(steps[1],RobustScaler):
+                raise Exception(f"Only a SimpleImputer + RobustScaler pipeline can be exported, got: {pipeline.steps}")
+            imputer,scaler = steps
+            if imputer.add_indicator:
+                raise Exception(f"SimpleImputer with add_indicator can not be exported")
+
+            #imputer drops columns without any observed value unless it keeps empty features
+            statistics = imputer.statistics_.astype(np.float64)
+            keep_mask = ~np.isnan(statistics)
+            keep_indices = None if keep_mask.all() else np.flatnonzero(keep_mask).astype(np.int64)
+            fill = statistics[keep_mask]
+
+            center = scaler.center_ if scaler.with_centering else np.zeros(len(fill))
+            scale = scaler.scale_ if scaler.with_scaling else np.ones(len(fill))
+            feature_names_in = getattr(imputer,"feature_names_in_",None)
+
+            return cls(feature_names_in = feature_names_in,keep_indices = keep_indices,
+                center = np.asarray(center,dtype = np.float32),
+                scale = np.asarray(scale,dtype = np.float32),
+                #fill value goes through the same scaling in float64 before it is rounded once
+                scaled_fill = ((fill - center) / scale).astype(np.float32))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def transform(self,X,out:Optional[np.ndarray] = None)->np.ndarray:
+        """
+        impute and scale input features
+        X: dataframe with every fitted column or array of shape (rows, fitted columns)
+        out: optional float32 buffer of shape (rows, output columns), it may be X itself
+        when every column is kept and X is a float32 array
+        ================================
+        return transformed float32 array
+        """
+        try:
+            is_copy = False
+            if isinstance(X,pd.DataFrame):
+                columns = X.columns if self.feature_names_in_ is None else list(self.feature_names_in_)
+                #single cast to float32, the fresh array is transformed in place
+                X = np.array(X[columns],dtype = np.float32)
+                is_copy = True
+            elif X.dtype != np.float32:
+                X = X.astype(np.float32)
+                is_copy = True
+            if out is None and is_copy and self.keep_indices is None:
+                out = X
+            if out is None:
+                out = np.empty((X.shape[0],self.n_features_out),dtype = np.float32)
+
+            mask = np.empty((min(BLOCK_SIZE,X.shape[0]),self.n_features_out),dtype = bool)
+            for start in range(0,X.shape[0],BLOCK_SIZE):
+                input_block = X[start:start + BLOCK_SIZE]
+                out_block = out[start:start + BLOCK_SIZE]
+                if self.column_runs is not None:
+                    for input_start,input_stop,output_start in self.column_runs:
+                        out_block[:,output_start:output_start + input_stop - input_start] = input_block[:,input_start:input_stop]
+                elif out is not X:
+                    out_block[:] = input_block
+
+                out_block -= self.center
+                out_block /= self.scale
+                #NaN survives centering and scaling, it is replaced by the scaled fill value
+                mask_block = mask[:out_block.shape[0]]
+                np.isnan(out_block,out = mask_block)
+                np.copyto(out_block,self.scaled_fill,where = mask_block)
+            return out
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def save(self,file_path:str)->None:
+        try:
+            arrays = {"center":self.center,"scale":self.scale,"scaled_fill":self.scaled_fill}
+            if self.feature_names_in_ is not None:
+                arrays["feature_names_in"] = np.asarray(self.feature_names_in_,dtype = str)
+            if self.keep_indices is not None:
+                arrays["keep_indices"] = self.keep_indices
+            with open(file_path,"wb") as file_obj:
+                np.savez(file_obj,**arrays)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def load(cls,file_path:str)->"CompactTransformer":
+        try:
+            with np.load(file_path,allow_pickle = False) as arrays:
+                return cls(feature_names_in = arrays["feature_names_in"].astype(object) if "feature_names_in" in arrays else None,
+                    keep_indices = arrays["keep_indices"] if "keep_indices" in arrays else None,
+                    center = arrays["center"],
+                    scale = arrays["scale"],
+                    scaled_fill = arrays["scaled_fill"])
+
+        except Exception as e:
+            raise SensorException(e, sys)
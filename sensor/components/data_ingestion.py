@@ -1,12 +1,14 @@
-from sensor import utils
+from sensor import utils, instrumentation
 from sensor.entity import config_entity
 from sensor.entity import artifact_entity
 from sensor.exception import SensorException
 from sensor.logger import logging
-import os,sys
+from sensor.feature_store import FeatureStore
+from sensor.config import TARGET_COLUMN
+from typing import Optional
+import sys
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 
 class DataIngestion:
     
@@ -17,46 +19,184 @@ class DataIngestion:
         except Exception as e:
             raise SensorException(e, sys)
 
-    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+    def get_dataframe_chunks(self,query:Optional[dict] = None,sort_field = None):
+        """
+        This function returns the collection as an iterator of dataframes
+        if chunk_size is None whole collection is exported as a single dataframe
+        with read_n_jobs above 1 ranges of partition_field are read concurrently, in partition_field order
+        """
         try:
-            logging.info(f"Exporting collection data as pandas dataframe")
-            #exporting collection data as a dataframe.
-            df:pd.DataFrame = utils.get_collection_as_datarame(
+            chunk_size = self.data_ingestion_config.chunk_size
+            partition_field = self.data_ingestion_config.partition_field
+            if self.data_ingestion_config.read_n_jobs > 1 and sort_field in (None,partition_field):
+                return utils.get_collection_as_dataframe_partitions(
+                    database_name = self.data_ingestion_config.database_name,
+                    collection_name = self.data_ingestion_config.collection_name,
+                    partition_size = chunk_size or 10000,
+                    partition_field = partition_field,
+                    query = query,
+                    n_jobs = self.data_ingestion_config.read_n_jobs,
+                    include_id = sort_field == "_id")
+
+            if chunk_size is None and query is None:
+                return iter([utils.get_collection_as_datarame(
+                    database_name = self.data_ingestion_config.database_name,
+                    collection_name = self.data_ingestion_config.collection_name)])
+
+            return utils.get_collection_as_dataframe_chunks(
                 database_name = self.data_ingestion_config.database_name,
-                collection_name = self.data_ingestion_config.collection_name)
+                collection_name = self.data_ingestion_config.collection_name,
+                chunk_size = chunk_size or 10000,
+                query = query,
+                sort_field = sort_field)
 
-            logging.info("Save data in feature store")
+        except Exception as e:
+            raise SensorException(e, sys)
 
+    def prepare_dataframe(self,df:pd.DataFrame)->pd.DataFrame:
+        """
+        This function replaces na with NaN and converts sensor columns to float
+        so every chunk is written with the same schema
+        """
+        try:
             #replace na with NaN
-            df.replace(to_replace = "na",value = np.NAN, inplace = True)
+            df.replace(to_replace = "na",value = np.nan, inplace = True)
+            return utils.convert_column_float(df = df,exclude_columns = [TARGET_COLUMN],dtype = self.data_ingestion_config.float_dtype)
+
+        except Exception as e:
+            raise SensorException(e, sys)
 
-            #save data in feature store
+    def split_train_test(self,df:pd.DataFrame)->tuple:
+        """
+        split a chunk into train and test set by a hash of the feature values of every row
+        a row lands on the same side in every run whatever the chunk it comes in, so rows held out
+        once stay held out when a later run scores registry versions on its test set
+        ================================================
+        return train and test dataframe
+        """
+        try:
+            #values are hashed in the float dtype of the store so a row read back from csv or parquet hashes the same
+            features_df = utils.convert_column_float(df = df.drop(TARGET_COLUMN,axis = 1),exclude_columns = [],
+                dtype = self.data_ingestion_config.float_dtype)
+            row_hash = pd.util.hash_pandas_object(features_df,index = False).to_numpy()
+            is_test = row_hash % 10000 < int(self.data_ingestion_config.test_size * 10000)
+            return df[~is_test], df[is_test]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def export_to_feature_store(self):
+        """
+        This function exports the whole collection to the feature store file
+        ================================================
+        return iterator of exported dataframe chunks, every chunk is written to feature store before it is yielded
+        """
+        try:
             logging.info("Create feature store folder if not available")
-            #ceate feature store folder if not available
-            feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            os.makedirs(feature_store_dir,exist_ok=True)
-            
-            logging.info("Save df to feature store folder")
-            #save df to feature store folder
-            df.to_csv(path_or_buf = self.data_ingestion_config.feature_store_file_path,index = False,header=True)
+            #feature store folder is created by the writer if not available
+            with utils.DataFrameWriter(file_path = self.data_ingestion_config.feature_store_file_path) as feature_store_writer:
+                for chunk_number,df in enumerate(self.get_dataframe_chunks()):
+                    df = self.prepare_dataframe(df = df)
 
-            logging.info("split dataset into train and test set")
-            #split dataset into train and test
-            train_df, test_df = train_test_split(df,test_size = self.data_ingestion_config.test_size)
+                    logging.info("Save chunk %s with %s rows in feature store",chunk_number,len(df))
+                    feature_store_writer.write(df)
+                    yield df
 
-            logging.info("create dataset directory folder if not available")
-            #create dataset directory folder if not available
-            dataset_dir = os.path.dirname(self.data_ingestion_config.train_file_path)
-            os.makedirs(dataset_dir,exist_ok=True)
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_watermark_query(self,watermark)->Optional[dict]:
+        """
+        return filter of documents after the watermark
+        a watermark field other than _id is paired with _id, documents arriving later with
+        the same field value as the watermark are still pulled and none is pulled twice
+        """
+        watermark_field = self.data_ingestion_config.watermark_field
+        if watermark is None:
+            return None
+        if watermark_field == "_id":
+            return {"_id":{"$gt":watermark}}
+        if not isinstance(watermark,dict):
+            #watermark stored before it was paired with _id
+            return {watermark_field:{"$gt":watermark}}
+        return {"$or":[{watermark_field:{"$gt":watermark[watermark_field]}},
+            {watermark_field:watermark[watermark_field],"_id":{"$gt":watermark["_id"]}}]}
+
+    def export_to_persistent_feature_store(self,feature_store:FeatureStore)->int:
+        """
+        This function pulls documents newer than the stored watermark and adds them as a new partition
+        ================================================
+        return number of new rows
+        """
+        try:
+            watermark_field = self.data_ingestion_config.watermark_field
+            watermark = feature_store.get_watermark()
+            query = self.get_watermark_query(watermark = watermark)
+            sort_fields = ["_id"] if watermark_field == "_id" else [watermark_field,"_id"]
+            logging.info(f"Pulling documents with {sort_fields} after watermark: {watermark}")
+
+            tmp_file_path = feature_store.get_tmp_partition_file_path()
+            with utils.DataFrameWriter(file_path = tmp_file_path) as partition_writer:
+                for df in self.get_dataframe_chunks(query = query,sort_field = sort_fields):
+                    #documents are sorted on watermark field and _id so last row holds the new watermark
+                    last_row = df.iloc[-1]
+                    watermark = last_row["_id"] if watermark_field == "_id" else {watermark_field:last_row[watermark_field],"_id":last_row["_id"]}
+                    #watermark field and _id are bookkeeping, they are never written as feature columns
+                    df = df.drop(columns = list(dict.fromkeys(sort_fields)))
+
+                    partition_writer.write(self.prepare_dataframe(df = df))
+
+            rows = partition_writer.rows
+            if rows > 0:
+                feature_store.add_partition(tmp_file_path = tmp_file_path,rows = rows,watermark = watermark)
+            logging.info(f"New rows added to feature store: {rows}")
+            return rows
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_data_ingestion(self)->artifact_entity.DataIngestionArtifact:
+        try:
+            if self.data_ingestion_config.incremental:
+                logging.info(f"Incremental ingestion into feature store: {self.data_ingestion_config.persistent_feature_store_dir}")
+                feature_store = FeatureStore(feature_store_dir = self.data_ingestion_config.persistent_feature_store_dir,
+                    file_format = self.data_ingestion_config.file_format)
+                with instrumentation.step("export_to_persistent_feature_store") as metrics:
+                    metrics.add(rows_out = self.export_to_persistent_feature_store(feature_store = feature_store))
+                feature_store_file_path = feature_store.manifest_file_path
+                #train and test set are prepared from every partition of the feature store
+                df_chunks = feature_store.iter_dataframes(chunk_size = self.data_ingestion_config.chunk_size)
+            else:
+                logging.info(f"Exporting collection data as pandas dataframe chunks")
+                feature_store_file_path = self.data_ingestion_config.feature_store_file_path
+                df_chunks = self.export_to_feature_store()
+
+            logging.info("create dataset directory folder if not available and save train and test set")
+            #dataset directory folder is created by the writers if not available
+            #chunks are exported while they are split, so both are measured as one step
+            with instrumentation.step("export_and_split") as metrics, \
+                utils.DataFrameWriter(file_path = self.data_ingestion_config.train_file_path) as train_writer, \
+                utils.DataFrameWriter(file_path = self.data_ingestion_config.test_file_path) as test_writer:
+                for df in df_chunks:
+                    metrics.add(rows_in = len(df))
+                    #split chunk into train and test
+                    train_df, test_df = self.split_train_test(df = df)
 
-            logging.info("Save df to feature store folder")
-            #save df to feature store folder
-            train_df.to_csv(path_or_buf = self.data_ingestion_config.train_file_path,index = False,header=True)
-            test_df.to_csv(path_or_buf = self.data_ingestion_config.test_file_path,index = False,header=True)
+                    #save train and test chunk to dataset folder
+                    train_writer.write(train_df)
+                    test_writer.write(test_df)
+
+            total_rows = train_writer.rows + test_writer.rows
+            if total_rows == 0:
+                raise Exception(f"No data found in collection: [{self.data_ingestion_config.collection_name}]")
+            logging.info(f"Rows written in train and test set: {total_rows}")
+            instrumentation.add(rows_out = total_rows)
+            for file_path in (feature_store_file_path,self.data_ingestion_config.train_file_path,self.data_ingestion_config.test_file_path):
+                instrumentation.add_file_written(file_path)
 
             #prepare artifact
             data_ingestion_artifact = artifact_entity.DataIngestionArtifact(
-                feature_store_file_path = self.data_ingestion_config.feature_store_file_path,
+                feature_store_file_path = feature_store_file_path,
                 train_file_path = self.data_ingestion_config.train_file_path,
                 test_file_path = self.data_ingestion_config.test_file_path)
 
@@ -65,4 +205,4 @@ class DataIngestion:
             return data_ingestion_artifact
 
         except Exception as e:
-            raise SensorException(e, sys)
\ No newline at end of file
+            raise SensorException(e, sys)
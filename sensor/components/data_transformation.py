@@ -3,15 +3,14 @@ from sensor.exception import SensorException
 from sensor.logger import logging
 from typing import Optional
 import os, sys
-import pandas as pd
-import numpy as np
-from sensor import utils
+from sensor import utils, instrumentation
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder
-from imblearn.combine import SMOTETomek
+from sensor.rebalancing import Rebalancer
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import RobustScaler
 from sensor.config import TARGET_COLUMN
+from sensor.compact_transformer import CompactTransformer
 
 class DataTransformation:
 
@@ -40,12 +39,16 @@ class DataTransformation:
     def initiate_data_transformation(self,)->artifact_entity.DataTransformationArtifact:
         try:
             #read train and test dataframe
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            train_df = utils.read_dataframe(file_path = self.data_ingestion_artifact.train_file_path)
+            test_df = utils.read_dataframe(file_path = self.data_ingestion_artifact.test_file_path)
+            instrumentation.add(rows_in = len(train_df) + len(test_df))
+            instrumentation.add_file_read(self.data_ingestion_artifact.train_file_path)
+            instrumentation.add_file_read(self.data_ingestion_artifact.test_file_path)
 
-            #select input features for train and test dataframe
-            input_feature_train_df = train_df.drop(TARGET_COLUMN,axis = 1)
-            input_feature_test_df = test_df.drop(TARGET_COLUMN,axis = 1)
+            #select input features for train and test dataframe, pipeline keeps their float dtype
+            float_dtype = self.data_transformation_config.float_dtype
+            input_feature_train_df = utils.convert_column_float(df = train_df.drop(TARGET_COLUMN,axis = 1),exclude_columns = [],dtype = float_dtype)
+            input_feature_test_df = utils.convert_column_float(df = test_df.drop(TARGET_COLUMN,axis = 1),exclude_columns = [],dtype = float_dtype)
 
             #select target features for train and test dataframe
             target_feature_train_df = train_df[TARGET_COLUMN]
@@ -55,43 +58,69 @@ class DataTransformation:
             label_encoder.fit(target_feature_train_df)
 
             #transformation on target column
-            target_feature_train_arr = label_encoder.transform(target_feature_train_df)
-            target_feature_test_arr = label_encoder.transform(target_feature_test_df)
+            target_dtype = self.data_transformation_config.target_dtype
+            target_feature_train_arr = label_encoder.transform(target_feature_train_df).astype(target_dtype)
+            target_feature_test_arr = label_encoder.transform(target_feature_test_df).astype(target_dtype)
 
            
-            transformation_pipeline = DataTransformation.get_data_tranformer_object()
-            transformation_pipeline.fit(input_feature_train_df)
+            with instrumentation.step("fit_transform") as metrics:
+                metrics.add(rows_in = len(input_feature_train_df) + len(input_feature_test_df))
+                transformation_pipeline = DataTransformation.get_data_tranformer_object()
+                transformation_pipeline.fit(input_feature_train_df)
+
+                #transformation on input features
+                input_feature_train_arr = transformation_pipeline.transform(input_feature_train_df)
+                input_feature_test_arr = transformation_pipeline.transform(input_feature_test_df)
+
+            rebalancer = Rebalancer(strategy = self.data_transformation_config.rebalancing_strategy,
+                n_jobs = self.data_transformation_config.rebalancing_n_jobs,
+                approximate = self.data_transformation_config.approximate_neighbors,
+                random_state = self.data_transformation_config.random_state)
+            logging.info(f"Before resampling in training set, Input:{input_feature_train_arr.shape} and Target:{target_feature_train_arr.shape}")
+            with instrumentation.step(f"rebalancing_{rebalancer.strategy}") as metrics:
+                metrics.add(rows_in = len(target_feature_train_arr))
+                input_feature_train_arr,target_feature_train_arr,train_rebalancing_report = rebalancer.fit_resample(
+                    input_feature_train_arr,target_feature_train_arr)
+                metrics.add(rows_out = len(target_feature_train_arr))
+            logging.info(f"After resampling in training set, Input:{input_feature_train_arr.shape} and Target:{target_feature_train_arr.shape}")
+            rebalancing_report = {"train":train_rebalancing_report}
+
+            if self.data_transformation_config.resample_test:
+                logging.info(f"Before resampling in test set, Input:{input_feature_test_arr.shape} and Target:{target_feature_test_arr.shape}")
+                input_feature_test_arr,target_feature_test_arr,rebalancing_report["test"] = rebalancer.fit_resample(
+                    input_feature_test_arr,target_feature_test_arr)
+                logging.info(f"After resampling in test set, Input:{input_feature_test_arr.shape} and Target:{target_feature_test_arr.shape}")
+            utils.write_yaml_file(file_path = self.data_transformation_config.rebalancing_report_path,data = rebalancing_report)
             
-            #transformation on input features
-            input_feature_train_arr = transformation_pipeline.transform(input_feature_train_df)
-            input_feature_test_arr = transformation_pipeline.transform(input_feature_test_df)
-
-            smt = SMOTETomek(sampling_strategy = "minority")
-            logging.info(f"Before resampling in training set, Input:{input_feature_train_arr.shape} and Target:{input_feature_train_arr.shape}")
-            input_feature_train_arr,target_feature_train_arr = smt.fit_resample(input_feature_train_arr,target_feature_train_arr)
-            logging.info(f"After resampling in training set, Input:{input_feature_train_arr.shape} and Target:{input_feature_train_arr.shape}")
-            
-            logging.info(f"Before resampling in test set, Input:{input_feature_test_arr.shape} and Target:{input_feature_test_arr.shape}")
-            input_feature_test_arr,target_feature_test_arr = smt.fit_resample(input_feature_test_arr,target_feature_test_arr)
-            logging.info(f"After resampling in test set, Input:{input_feature_test_arr.shape} and Target:{input_feature_test_arr.shape}")
-            
-            #target encoder
-            train_arr = np.c_[input_feature_train_arr,target_feature_train_arr]
-            test_arr = np.c_[input_feature_test_arr,target_feature_test_arr]
-            
-            #save numpy array
-            utils.save_numpy_array_data(file_path = self.data_transformation_config.transformed_train_path, array = train_arr)
-            utils.save_numpy_array_data(file_path = self.data_transformation_config.transformed_test_path, array = test_arr)
-
-            utils.save_object(file_path = self.data_transformation_config.transform_object_path, obj = transformation_pipeline)
-
-            utils.save_object(file_path = self.data_transformation_config.target_encoder_path, obj = label_encoder)
+            with instrumentation.step("save_artifacts"):
+                #input features and target are saved as separate arrays so each keeps its own dtype
+                utils.save_numpy_arrays(dir_path = self.data_transformation_config.transformed_train_path,
+                    X = input_feature_train_arr,y = target_feature_train_arr)
+                utils.save_numpy_arrays(dir_path = self.data_transformation_config.transformed_test_path,
+                    X = input_feature_test_arr,y = target_feature_test_arr)
+
+                utils.save_object(file_path = self.data_transformation_config.transform_object_path, obj = transformation_pipeline)
+
+                #float32 fill, center and scale vectors used at inference time instead of the sklearn pipeline
+                logging.info(f"export compact transformer")
+                CompactTransformer.from_pipeline(pipeline = transformation_pipeline).save(
+                    file_path = self.data_transformation_config.compact_transformer_path)
+
+                utils.save_object(file_path = self.data_transformation_config.target_encoder_path, obj = label_encoder)
+                for path in (self.data_transformation_config.transformed_train_path,self.data_transformation_config.transformed_test_path,
+                        self.data_transformation_config.transform_object_path,self.data_transformation_config.compact_transformer_path,
+                        self.data_transformation_config.target_encoder_path):
+                    instrumentation.add_file_written(path)
+            instrumentation.add(rows_out = len(target_feature_train_arr) + len(target_feature_test_arr))
 
             data_transformation_artifact = artifact_entity.DataTransformationArtifact(
                 transform_object_path = self.data_transformation_config.transform_object_path,
                 transformed_train_path = self.data_transformation_config.transformed_train_path,
                 transformed_test_path = self.data_transformation_config.transformed_test_path,
-                target_encoder_path = self.data_transformation_config.target_encoder_path)
+                target_encoder_path = self.data_transformation_config.target_encoder_path,
+                compact_transformer_path = self.data_transformation_config.compact_transformer_path,
+                rebalancing_report_path = self.data_transformation_config.rebalancing_report_path,
+                scale_pos_weight = train_rebalancing_report["scale_pos_weight"])
 
             logging.info(f"Data transformation object: {data_transformation_artifact}")
 
@@ -1,12 +1,12 @@
-import os,sys
+import sys
 import numpy as np
 import pandas as pd
 from sensor.entity import artifact_entity, config_entity
 from sensor.exception import SensorException
 from sensor.logger import logging
-from scipy.stats import ks_2samp
 from typing import Optional
-from sensor import utils
+from sensor import utils, drift, instrumentation
+from sensor.baseline_profile import BaselineProfile
 from sensor.config import TARGET_COLUMN
 
 class DataValidation:
@@ -42,7 +42,7 @@ class DataValidation:
 
             logging.info(f"select column names containing null values more than {threshold*100}%")
             #select column names containing null values more than threshold
-            drop_column_names = null_report[null_report>0.7].index
+            drop_column_names = null_report[null_report>threshold].index
             
             logging.info(f"columns to drop:{list(drop_column_names)}")
             #store dropped column names in dictionary
@@ -57,17 +57,16 @@ class DataValidation:
         except Exception as e:
             raise SensorException(e,sys)
 
-    def is_required_column_exists(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str)->bool:
+    def is_required_column_exists(self,base_columns:list,current_df:pd.DataFrame,report_key_name:str)->bool:
 
         try:
-            base_columns = base_df.columns
             current_columns = current_df.columns
 
             #check missing columns in current_df
             missing_columns = []
             for base_column in base_columns:
                 if base_column not in current_columns:
-                    logging,info(f"column:[{base} is not available.]")
+                    logging.info("column:[%s is not available.]",base_column)
                     missing_columns.append(base_column)
             
             #store missing column names in dictionary
@@ -78,23 +77,28 @@ class DataValidation:
         except Exception as e:
             raise SensorException(e,sys)
 
-    def data_drift(self,base_df:pd.DataFrame,current_df:pd.DataFrame,report_key_name:str):
+    def data_drift(self,base_profile:BaselineProfile,current_df:pd.DataFrame,report_key_name:str):
         try:
             drift_report = dict()
 
-            base_columns = base_df.columns
-            current_columns = current_df.columns
-
-            for base_column in base_columns:
-                base_data, current_data = base_df[base_column],current_df[base_column]
-                
-                #null hypothesis is that both data drawn from same distribution
-                distribution = ks_2samp(base_data, current_data)
-
-                if distribution.pvalue>0.05:
-                    drift_report[base_column] = {'pvalue':float(distribution.pvalue),"same_distribution":True}
+            #KS test is only defined for numeric columns, target column is not part of the profile values
+            base_columns = base_profile.numeric_columns
+
+            #null hypothesis is that both data drawn from same distribution
+            #every column is tested in a single batched pass against presorted base values, NaN values are omitted
+            with instrumentation.step(f"ks_drift_{report_key_name}") as metrics:
+                metrics.add(rows_in = len(current_df))
+                _, pvalues = drift.ks_2samp_columns(base = base_profile.sorted_values,
+                    current = current_df[base_columns].to_numpy(dtype = np.float64),
+                    base_is_sorted = True,
+                    block_size = self.data_validation_config.drift_block_size,
+                    n_jobs = self.data_validation_config.drift_n_jobs)
+
+            for base_column,pvalue in zip(base_columns,pvalues):
+                if pvalue>0.05:
+                    drift_report[base_column] = {'pvalue':float(pvalue),"same_distribution":True}
                 else:
-                    drift_report[base_column] = {'pvalue':float(distribution.pvalue),"same_distribution":False}
+                    drift_report[base_column] = {'pvalue':float(pvalue),"same_distribution":False}
 
             self.validation_error[report_key_name] = drift_report
         except Exception as e:
@@ -102,21 +106,25 @@ class DataValidation:
 
     def initiate_data_validation(self)-> artifact_entity.DataIngestionArtifact:
         try:
-            logging.info(f"reading base dataframe")
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-            
-            logging.info(f"replacing 'na' values with np.NaN in base dataframe")
-            #replace 'na' values in base_df with np.NaN 
-            base_df.replace({"na":np.NAN},inplace = True)
-            
-            logging.info(f"drop null values columns from base dataframe")
-            base_df = self.drop_missing_values_columns(df = base_df,report_key_name = "missing_values_within_base_dataset")
-
-            logging.info(f"reading train dataframe")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-
-            logging.info(f"reading test dataframe")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            logging.info(f"loading baseline profile of base dataframe")
+            #profile is built from base file only once and reused while the file content is unchanged
+            with instrumentation.step("load_baseline_profile"):
+                base_profile = BaselineProfile.load_or_build(base_file_path = self.data_validation_config.base_file_path,
+                    profile_dir = self.data_validation_config.baseline_profile_dir,
+                    missing_threshold = self.data_validation_config.missing_threshold,
+                    float_dtype = self.data_validation_config.float_dtype)
+            self.validation_error["missing_values_within_base_dataset"] = base_profile.dropped_columns
+
+            with instrumentation.step("read_dataframes") as metrics:
+                logging.info(f"reading train dataframe")
+                train_df = utils.read_dataframe(file_path = self.data_ingestion_artifact.train_file_path)
+
+                logging.info(f"reading test dataframe")
+                test_df = utils.read_dataframe(file_path = self.data_ingestion_artifact.test_file_path)
+                metrics.add(rows_out = len(train_df) + len(test_df))
+                instrumentation.add_file_read(self.data_ingestion_artifact.train_file_path)
+                instrumentation.add_file_read(self.data_ingestion_artifact.test_file_path)
+            instrumentation.add(rows_in = len(train_df) + len(test_df))
 
             logging.info(f"drop null values columns from training dataframe")
             train_df = self.drop_missing_values_columns(df = train_df,report_key_name = "missing_values_within_train_dataset")
@@ -124,30 +132,30 @@ class DataValidation:
             logging.info(f"drop null values columns from test dataframe")
             test_df = self.drop_missing_values_columns(df = test_df,report_key_name = "missing_values_within_test_dataset")
 
-            exclude_columns = TARGET_COLUMN
-            utils.convert_column_float(df = base_df, exclude_columns = exclude_columns)
-            utils.convert_column_float(df = train_df, exclude_columns = exclude_columns)
-            utils.convert_column_float(df = test_df, exclude_columns = exclude_columns)
+            exclude_columns = [TARGET_COLUMN]
+            train_df = utils.convert_column_float(df = train_df, exclude_columns = exclude_columns,dtype = self.data_validation_config.float_dtype)
+            test_df = utils.convert_column_float(df = test_df, exclude_columns = exclude_columns,dtype = self.data_validation_config.float_dtype)
 
 
             logging.info(f"is all required columns present in training dataframe")
-            train_df_columns_status = self.is_required_column_exists(base_df = base_df, current_df = train_df,report_key_name="missing_columns_within_train_dataset")
+            train_df_columns_status = self.is_required_column_exists(base_columns = base_profile.columns, current_df = train_df,report_key_name="missing_columns_within_train_dataset")
             
             logging.info(f"is all required columns present in test dataframe")
-            test_df_columns_status = self.is_required_column_exists(base_df = base_df, current_df = test_df,report_key_name="missing_columns_within_test_dataset")
+            test_df_columns_status = self.is_required_column_exists(base_columns = base_profile.columns, current_df = test_df,report_key_name="missing_columns_within_test_dataset")
 
             if train_df_columns_status:
                 logging.info(f"As all columns are available in training dataframe hence detecting data drift")
-                self.data_drift(base_df= base_df, current_df= train_df,report_key_name="data_drift_within_train_dataset")
+                self.data_drift(base_profile = base_profile, current_df = train_df,report_key_name="data_drift_within_train_dataset")
 
             if test_df_columns_status:
                 logging.info(f"As all columns are available in test dataframe hence detecting data drift")
-                self.data_drift(base_df= base_df, current_df= test_df,report_key_name="data_drift_within_test_dataset")   
+                self.data_drift(base_profile = base_profile, current_df = test_df,report_key_name="data_drift_within_test_dataset")   
             
             #write the report
             logging.info(f"writing report in yaml file")
             utils.write_yaml_file(file_path = self.data_validation_config.report_file_path,
             data = self.validation_error) 
+            instrumentation.add_file_written(self.data_validation_config.report_file_path)
 
             data_validation_artifact = artifact_entity.DataValidationArtifact(report_file_path = self.data_validation_config.report_file_path)
             logging.info(f"Data validation artifact: {data_validation_artifact}")
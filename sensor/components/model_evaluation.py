@@ -1,33 +1,208 @@
-from sensor.predictor import ModelResolver
+from sensor.predictor import ModelResolver, load_transformer, transform_features
 from sensor.entity import config_entity,artifact_entity
+from sensor.entity.config_entity import MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME
+from sensor.config import TARGET_COLUMN
+from sensor.exception import SensorException
 from sensor.logger import logging
+from sensor import utils, instrumentation
+from concurrent.futures import ThreadPoolExecutor
+from sklearn.metrics import f1_score
+import numpy as np
+import pandas as pd
+import hashlib
+import json
+import os, sys
+import uuid
+
+TRAINED_MODEL_NAME = "trained"
 
 class ModelEvaluation:
+    """
+    Scores the trained model and the latest registry versions on the same held out test data.
+    Candidates sharing a transformer are predicted from one transformed copy of the test data,
+    every transformer group is scored in its own thread and predictions are cached on disk by
+    content hash of test file, transformer and model, so an evaluation run again is not predicted again.
+    """
 
     def __init__(self,model_eval_config:config_entity.ModelEvaluationConfig,
                 data_ingestion_artifact:artifact_entity.DataIngestionArtifact,
                 data_transformation_artifact:artifact_entity.DataTransformationArtifact,
                 model_trainer_artifact:artifact_entity.ModelTrainerArtifact):
-        
+
         try:
             logging.info(f"{'=='*5} Model Evaluation {'=='*5}")
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
-            self.model_resolver = ModelResolver()
+            self.model_resolver = ModelResolver(model_registry = self.model_eval_config.saved_model_dir)
+            self.hash_index_file_path = os.path.join(self.model_eval_config.prediction_cache_dir,"hash_index.yaml")
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_candidates(self,manifest:dict)->list:
+        """
+        return trained model and latest n_versions registry versions, newest version first
+        every candidate has its name, version and transformer, target encoder and model file paths
+        manifest: registry manifest snapshot, its latest version is always a candidate
+        """
+        try:
+            candidates = [{"name":TRAINED_MODEL_NAME,"version":None,
+                "transformer_path":self.data_transformation_artifact.compact_transformer_path,
+                "target_encoder_path":self.data_transformation_artifact.target_encoder_path,
+                "model_path":self.model_trainer_artifact.model_path}]
+
+            versions = sorted(manifest["versions"],reverse = True)[:self.model_eval_config.n_versions]
+            if manifest["latest"] is not None and manifest["latest"] not in versions:
+                versions.append(manifest["latest"])
+            for version in versions:
+                version_dir = self.model_resolver.get_version_dir_path(version = version)
+                candidates.append({"name":f"version_{version}","version":int(version),
+                    "transformer_path":self.model_resolver.get_transformer_path(version_dir = version_dir),
+                    "target_encoder_path":os.path.join(version_dir,self.model_resolver.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME),
+                    "model_path":os.path.join(version_dir,self.model_resolver.model_dir_name,MODEL_FILE_NAME)})
+            return candidates
 
         except Exception as e:
             raise SensorException(e, sys)
-    
+
+    def get_file_hash(self,file_path:str)->str:
+        if not self.model_eval_config.use_prediction_cache:
+            return utils.get_file_hash(file_path = file_path)
+        return utils.get_cached_file_hash(file_path = file_path,hash_index_file_path = self.hash_index_file_path)
+
+    def get_prediction_file_path(self,test_file_hash:str,candidate:dict)->str:
+        """
+        return cache file of predictions of a candidate, prediction only depends on test data, transformer and model
+        """
+        key = hashlib.sha256(json.dumps([test_file_hash,candidate["transformer_hash"],candidate["model_hash"]]).encode()).hexdigest()
+        return os.path.join(self.model_eval_config.prediction_cache_dir,f"{key}.npy")
+
+    def predict_group(self,test_df:pd.DataFrame,candidates:list)->dict:
+        """
+        predict test data with every candidate of a transformer group
+        test data is transformed at most once and only when a prediction of the group is not cached
+        ================================
+        return model output and whether it came from the cache for every candidate name
+        """
+        try:
+            input_arr = None
+            predictions = dict()
+            for candidate in candidates:
+                prediction_file_path = candidate["prediction_file_path"]
+                if self.model_eval_config.use_prediction_cache and os.path.exists(prediction_file_path):
+                    predictions[candidate["name"]] = (np.load(prediction_file_path),True)
+                    continue
+
+                if input_arr is None:
+                    logging.info(f"transforming test data with transformer: {candidate['transformer_path']}")
+                    input_arr = transform_features(load_transformer(file_path = candidate["transformer_path"]),test_df)
+                model = utils.load_object(file_path = candidate["model_path"])
+                prediction = model.predict(input_arr)
+                predictions[candidate["name"]] = (prediction,False)
+
+                if self.model_eval_config.use_prediction_cache:
+                    #written under a temp name and renamed so a reader never sees a partial file
+                    tmp_file_path = f"{prediction_file_path}.{uuid.uuid4().hex}.tmp.npy"
+                    np.save(tmp_file_path,prediction)
+                    os.replace(tmp_file_path,prediction_file_path)
+            return predictions
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_leaderboard(self,candidates:list,predictions:dict,y_true:np.ndarray,target_encoder)->list:
+        """
+        return f1 score of every candidate on the test data, best first
+        predicted labels of every version are encoded with the target encoder of the trained model
+        """
+        try:
+            leaderboard = []
+            for candidate in candidates:
+                prediction,is_cached = predictions[candidate["name"]]
+                version_target_encoder = utils.load_object(file_path = candidate["target_encoder_path"])
+                y_pred = target_encoder.transform(version_target_encoder.inverse_transform(prediction.astype(int)))
+                leaderboard.append({"name":candidate["name"],
+                    "version":candidate["version"],
+                    "f1_score":float(f1_score(y_true = y_true,y_pred = y_pred)),
+                    "prediction_cached":is_cached})
+            leaderboard.sort(key = lambda entry: entry["f1_score"],reverse = True)
+            return leaderboard
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
     def initiate_model_evaluation(self)->artifact_entity.ModelEvaluationArtifact:
         try:
-            #if saved folder has model, then we will compare which model is best: trained or model from saved folder model
-            latest_dir_path = self.model_resolver.get_latest_dir_path()
-            if latest_dir_path == None:
-                model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted= True, improved_accuracy = None)
+            if self.model_eval_config.use_prediction_cache:
+                os.makedirs(self.model_eval_config.prediction_cache_dir,exist_ok = True)
+
+            logging.info(f"reading test dataframe")
+            test_file_path = self.data_ingestion_artifact.test_file_path
+            with instrumentation.step("read_test_dataframe") as metrics:
+                test_df = utils.read_dataframe(file_path = test_file_path)
+                metrics.add(rows_out = len(test_df))
+                instrumentation.add_file_read(test_file_path)
+            target_encoder = utils.load_object(file_path = self.data_transformation_artifact.target_encoder_path)
+            y_true = target_encoder.transform(test_df[TARGET_COLUMN])
+
+            #candidates and production version come from one manifest snapshot, a version published
+            #meanwhile is neither scored nor compared against
+            manifest = self.model_resolver.read_manifest()
+            candidates = self.get_candidates(manifest = manifest)
+            #hashes are computed before scoring so threads never write the hash index concurrently
+            test_file_hash = self.get_file_hash(file_path = test_file_path)
+            transformer_groups = dict()
+            for candidate in candidates:
+                candidate["transformer_hash"] = self.get_file_hash(file_path = candidate["transformer_path"])
+                candidate["model_hash"] = self.get_file_hash(file_path = candidate["model_path"])
+                candidate["prediction_file_path"] = self.get_prediction_file_path(test_file_hash = test_file_hash,candidate = candidate)
+                transformer_groups.setdefault(candidate["transformer_hash"],[]).append(candidate)
+            logging.info(f"scoring {len(candidates)} candidates with {len(transformer_groups)} distinct transformers")
+
+            with instrumentation.step("score_candidates") as metrics:
+                predictions = dict()
+                with ThreadPoolExecutor(max_workers = self.model_eval_config.n_jobs) as executor:
+                    for group_predictions in executor.map(lambda group: self.predict_group(test_df = test_df,candidates = group),
+                            transformer_groups.values()):
+                        predictions.update(group_predictions)
+                n_cached = sum(is_cached for _,is_cached in predictions.values())
+                metrics.add(rows_in = len(test_df) * (len(candidates) - n_cached),predictions_cached = n_cached,
+                    predictions_computed = len(candidates) - n_cached)
+
+            leaderboard = self.get_leaderboard(candidates = candidates,predictions = predictions,
+                y_true = y_true,target_encoder = target_encoder)
+            scores = {entry["name"]:entry["f1_score"] for entry in leaderboard}
+
+            #production version is the latest one of the registry
+            production_version = manifest["latest"]
+            production_score = None
+            if production_version is None:
+                logging.info(f"model registry is empty, trained model is accepted")
+                improved_accuracy = None
+                is_model_accepted = True
+            else:
+                production_score = scores[f"version_{production_version}"]
+                improved_accuracy = scores[TRAINED_MODEL_NAME] - production_score
+                is_model_accepted = improved_accuracy > self.model_eval_config.change_threshold
+                logging.info(f"trained model score: {scores[TRAINED_MODEL_NAME]} and production version: {production_version} "
+                    f"score: {production_score}, improvement: {improved_accuracy} with change threshold: {self.model_eval_config.change_threshold}")
+
+            report = {"is_model_accepted":is_model_accepted,
+                "improved_accuracy":improved_accuracy,
+                "change_threshold":self.model_eval_config.change_threshold,
+                "trained_f1_score":scores[TRAINED_MODEL_NAME],
+                "production_version":production_version,
+                "production_f1_score":production_score,
+                "leaderboard":leaderboard}
+            utils.write_yaml_file(file_path = self.model_eval_config.report_file_path,data = report)
+            instrumentation.add_file_written(self.model_eval_config.report_file_path)
+
+            model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted = is_model_accepted,
+                improved_accuracy = improved_accuracy,report_file_path = self.model_eval_config.report_file_path)
             logging.info(f"Model evaluation artifact: {model_eval_artifact}")
             return model_eval_artifact
-        
+
         except Exception as e:
             raise SensorException(e, sys)
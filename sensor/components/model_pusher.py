@@ -0,0 +1,142 @@
+from sensor.predictor import ModelResolver
+from sensor.entity.config_entity import ModelPusherConfig, REGISTRY_MANIFEST_FILE_NAME
+from sensor.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import utils
+from datetime import datetime
+import os, sys
+import shutil
+import uuid
+
+class ModelPusher:
+    """
+    Publishes trained transformer, target encoder and model as a new version of the model registry.
+    Objects are first written to a temp dir inside the registry, the dir is renamed to its version
+    number and only then the manifest is replaced, so readers never see a half written version.
+    """
+
+    def __init__(self,model_pusher_config:ModelPusherConfig,
+                data_transformation_artifact:DataTransformationArtifact,
+                model_trainer_artifact:ModelTrainerArtifact):
+        try:
+            logging.info(f"{'=='*5} Model Pusher {'=='*5}")
+            self.model_pusher_config = model_pusher_config
+            self.data_transformation_artifact = data_transformation_artifact
+            self.model_trainer_artifact = model_trainer_artifact
+            self.model_resolver = ModelResolver(model_registry = self.model_pusher_config.saved_model_dir)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_version_files(self)->dict:
+        """
+        return registry sub dir and source file path of every object of a version keyed by object name
+        """
+        return {
+            "transformer":(self.model_resolver.transformer_dir_name,self.data_transformation_artifact.transform_object_path),
+            "compact_transformer":(self.model_resolver.transformer_dir_name,self.data_transformation_artifact.compact_transformer_path),
+            "target_encoder":(self.model_resolver.target_encoder_dir_name,self.data_transformation_artifact.target_encoder_path),
+            "model":(self.model_resolver.model_dir_name,self.model_trainer_artifact.model_path)}
+
+    def copy_version_files(self,version_dir:str)->dict:
+        """
+        copy objects of a version into version_dir
+        ================================
+        return path relative to version_dir and sha256 of every copied object
+        """
+        try:
+            files = dict()
+            for name,(dir_name,src_file_path) in self.get_version_files().items():
+                dst_file_path = os.path.join(version_dir,dir_name,os.path.basename(src_file_path))
+                os.makedirs(os.path.dirname(dst_file_path),exist_ok = True)
+                shutil.copyfile(src_file_path,dst_file_path)
+                files[name] = {"path":os.path.relpath(dst_file_path,version_dir),
+                    "sha256":utils.get_file_hash(dst_file_path)}
+            return files
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def publish_version(self,tmp_version_dir:str)->int:
+        """
+        rename temp dir to the next free version number
+        ================================
+        return published version
+        """
+        try:
+            while True:
+                latest_dir = self.model_resolver.get_latest_dir_path()
+                version = 0 if latest_dir is None else int(os.path.basename(latest_dir)) + 1
+                #a dir left by an interrupted publish is never reused
+                while os.path.exists(os.path.join(self.model_pusher_config.saved_model_dir,f"{version}")):
+                    version += 1
+                version_dir = os.path.join(self.model_pusher_config.saved_model_dir,f"{version}")
+                try:
+                    #rename of a dir is atomic and fails if another pusher took the version meanwhile
+                    os.rename(tmp_version_dir,version_dir)
+                    return version
+                except OSError:
+                    if not os.path.exists(version_dir):
+                        raise
+                    logging.info(f"version: {version} was published by another pusher, retrying")
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def update_manifest(self,version:int,files:dict)->str:
+        """
+        add version to the registry manifest and mark it as latest
+        read, update and replace of the manifest hold the registry lock so concurrent pushers never drop each other's version
+        ================================
+        return manifest file path
+        """
+        try:
+            manifest_file_path = os.path.join(self.model_pusher_config.saved_model_dir,REGISTRY_MANIFEST_FILE_NAME)
+            with utils.FileLock(lock_file_path = f"{manifest_file_path}.lock"):
+                manifest = self.model_resolver.read_manifest()
+                manifest["versions"][version] = {
+                    "dir_name":f"{version}",
+                    "published_at":datetime.now().isoformat(),
+                    "metrics":{"f1_train_score":float(self.model_trainer_artifact.f1_train_score),
+                        "f1_test_score":float(self.model_trainer_artifact.f1_test_score)},
+                    "files":files}
+                manifest["latest"] = max(manifest["versions"])
+
+                #readers only ever see the previous or the new manifest
+                tmp_file_path = f"{manifest_file_path}.{uuid.uuid4().hex}.tmp"
+                utils.write_yaml_file(file_path = tmp_file_path,data = manifest)
+                os.replace(tmp_file_path,manifest_file_path)
+            return manifest_file_path
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def initiate_model_pusher(self)->ModelPusherArtifact:
+        try:
+            #keep a copy of pushed objects in the artifact dir of this run
+            logging.info(f"saving objects in pusher artifact dir: {self.model_pusher_config.pusher_model_dir}")
+            self.copy_version_files(version_dir = self.model_pusher_config.pusher_model_dir)
+
+            #write new version in a temp dir inside the registry so the rename stays on one filesystem
+            tmp_version_dir = os.path.join(self.model_pusher_config.saved_model_dir,f".tmp-{uuid.uuid4().hex}")
+            try:
+                logging.info(f"writing new version in temp dir: {tmp_version_dir}")
+                files = self.copy_version_files(version_dir = tmp_version_dir)
+                version = self.publish_version(tmp_version_dir = tmp_version_dir)
+            finally:
+                if os.path.exists(tmp_version_dir):
+                    shutil.rmtree(tmp_version_dir,ignore_errors = True)
+
+            manifest_file_path = self.update_manifest(version = version,files = files)
+            logging.info(f"published version: {version} in model registry: {self.model_pusher_config.saved_model_dir}")
+
+            model_pusher_artifact = ModelPusherArtifact(pusher_model_dir = self.model_pusher_config.pusher_model_dir,
+                saved_model_dir = self.model_pusher_config.saved_model_dir,
+                version = version,
+                manifest_file_path = manifest_file_path)
+            logging.info(f"Model pusher artifact: {model_pusher_artifact}")
+            return model_pusher_artifact
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -3,11 +3,54 @@ from sensor.exception import SensorException
 from sensor.logger import logging
 from typing import Optional
 import os, sys
-import pandas as pd
+import shutil
 import numpy as np
-from sensor import utils
+from sensor import utils, instrumentation
+import xgboost
 from xgboost import XGBClassifier
 from sklearn.metrics import f1_score
+from sklearn.model_selection import ParameterSampler, train_test_split
+from joblib import Parallel, delayed
+
+def fit_candidate(params:dict,n_estimators:int,early_stopping_rounds:int,n_threads:int,
+                X_fit:np.ndarray,y_fit:np.ndarray,X_val:np.ndarray,y_val:np.ndarray)->dict:
+    """
+    train one candidate of the search with early stopping on validation array
+    arrays arrive in joblib workers as read only memory maps shared by every candidate
+    ================================
+    return validation logloss and f1 score and number of boosting rounds actually used
+    """
+    xgb_clf = XGBClassifier(**params,n_estimators = n_estimators,early_stopping_rounds = early_stopping_rounds,
+        eval_metric = "logloss",n_jobs = n_threads)
+    xgb_clf.fit(X_fit,y_fit,eval_set = [(X_val,y_val)],verbose = False)
+    return {"params":params,
+        "n_estimators":n_estimators,
+        "best_iteration":int(xgb_clf.best_iteration),
+        "val_logloss":float(xgb_clf.best_score),
+        "val_f1_score":float(f1_score(y_true = y_val,y_pred = xgb_clf.predict(X_val)))}
+
+class ArrayChunkIter(xgboost.DataIter):
+    """
+    Feeds input features and target of a transformed array directory to xgboost one chunk of rows at a time
+    """
+
+    def __init__(self,file_path:str,chunk_size:int,cache_prefix:str):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.reset()
+        super().__init__(cache_prefix = cache_prefix)
+
+    def next(self,input_data)->int:
+        chunk = next(self.chunks,None)
+        if chunk is None:
+            return 0
+        X,y = chunk
+        input_data(data = X,label = y)
+        return 1
+
+    def reset(self)->None:
+        self.chunks = zip(utils.iter_numpy_array_chunks(file_path = self.file_path,chunk_size = self.chunk_size,array_name = "X"),
+            utils.iter_numpy_array_chunks(file_path = self.file_path,chunk_size = self.chunk_size,array_name = "y"))
 
 class ModelTrainer:
 
@@ -21,42 +64,184 @@ class ModelTrainer:
         except Exception as e:
             raise SensorException(e, sys)
     
-    def fine_tune(self):
+    def fine_tune(self,X,y)->dict:
+        """
+        successive halving search of xgboost parameters
+        every rung trains the remaining candidates in parallel workers with early stopping and
+        keeps the best 1/halving_factor of them for the next rung with halving_factor times more rounds
+        X: input features of train array
+        y: target of train array
+        ================================
+        return best parameters with their number of boosting rounds and trace of every rung
+        """
         try:
-            #write code for GridsearchCV
-            pass
+            config = self.model_trainer_config
+            X_fit,X_val,y_fit,y_val = train_test_split(X,y,test_size = config.validation_size,
+                stratify = y,random_state = config.random_state)
+            candidates = list(ParameterSampler(config.search_space,n_iter = config.n_candidates,
+                random_state = config.random_state))
+            #threads of the machine are split between workers instead of every worker using all of them
+            n_threads = max(1,(os.cpu_count() or 1) // config.search_n_jobs)
+
+            search_trace = []
+            n_estimators = config.min_boosting_rounds
+            #arrays bigger than max_nbytes are dumped once and memory mapped read only by every worker
+            with Parallel(n_jobs = config.search_n_jobs,max_nbytes = "1M",mmap_mode = "r") as parallel:
+                while True:
+                    logging.info(f"search rung {len(search_trace)}: {len(candidates)} candidates with {n_estimators} boosting rounds")
+                    results = parallel(delayed(fit_candidate)(params = dict(params,**self.get_class_weight_params()),n_estimators = n_estimators,
+                        early_stopping_rounds = config.early_stopping_rounds,n_threads = n_threads,
+                        X_fit = X_fit,y_fit = y_fit,X_val = X_val,y_val = y_val) for params in candidates)
+                    results.sort(key = lambda result: result["val_logloss"])
+                    search_trace.append({"rung":len(search_trace),"n_estimators":n_estimators,"results":results})
+
+                    n_keep = len(candidates) // config.halving_factor
+                    if n_keep < 1 or n_estimators * config.halving_factor > config.max_boosting_rounds:
+                        break
+                    candidates = [result["params"] for result in results[:n_keep]]
+                    n_estimators *= config.halving_factor
+
+            best_result = search_trace[-1]["results"][0]
+            best_params = dict(best_result["params"],n_estimators = best_result["best_iteration"] + 1)
+            logging.info(f"best parameters: {best_params} with validation logloss: {best_result['val_logloss']}")
+            return {"best_params":best_params,"search_trace":search_trace}
 
         except Exception as e:
             raise SensorException(e, sys)
 
-    def train_model(self,X,y):
+    def get_class_weight_params(self)->dict:
+        """
+        return scale_pos_weight when data transformation weighted classes instead of resampling them
+        """
+        scale_pos_weight = self.data_transformation_artifact.scale_pos_weight
+        return dict() if scale_pos_weight is None else {"scale_pos_weight":scale_pos_weight}
+
+    def train_model(self,X,y,params:Optional[dict] = None):
         try:
-            xgb_clf = XGBClassifier()
+            xgb_clf = XGBClassifier(**dict(params or dict(),**self.get_class_weight_params()))
             xgb_clf.fit(X,y)
             return xgb_clf
 
         except Exception as e:
             raise SensorException(e, sys)
 
+    def get_external_memory_matrix(self,file_path:str,name:str,ref = None):
+        """
+        return quantized histogram matrix built from chunks of a transformed array file
+        pages are cached on disk in external_memory_cache_dir instead of being kept in memory
+        """
+        try:
+            config = self.model_trainer_config
+            data_iter = ArrayChunkIter(file_path = file_path,chunk_size = config.chunk_size,
+                cache_prefix = os.path.join(config.external_memory_cache_dir,name))
+            #ExtMemQuantileDMatrix is available from xgboost 3.0, older versions build an external memory DMatrix
+            if hasattr(xgboost,"ExtMemQuantileDMatrix"):
+                return xgboost.ExtMemQuantileDMatrix(data_iter,max_bin = config.max_bin,nthread = config.n_threads,ref = ref)
+            return xgboost.DMatrix(data_iter,nthread = config.n_threads)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def train_model_external_memory(self)->XGBClassifier:
+        """
+        train with early stopping on test array without loading train or test array in memory
+        """
+        try:
+            config = self.model_trainer_config
+            os.makedirs(config.external_memory_cache_dir,exist_ok = True)
+            train_matrix = self.get_external_memory_matrix(file_path = self.data_transformation_artifact.transformed_train_path,name = "train")
+            test_matrix = self.get_external_memory_matrix(file_path = self.data_transformation_artifact.transformed_test_path,name = "test",
+                ref = train_matrix)
+
+            params = {"objective":"binary:logistic","tree_method":"hist","max_bin":config.max_bin,
+                "nthread":config.n_threads,"eval_metric":"logloss",**self.get_class_weight_params()}
+            booster = xgboost.train(params,train_matrix,num_boost_round = config.num_boost_round,
+                evals = [(test_matrix,"test")],early_stopping_rounds = config.early_stopping_rounds,verbose_eval = False)
+            logging.info(f"best iteration: {booster.best_iteration} with test logloss: {booster.best_score}")
+
+            #keep trees up to the best iteration and wrap booster so the model is used like an in memory one
+            model = XGBClassifier()
+            model.load_model(bytearray(booster[:booster.best_iteration + 1].save_raw()))
+
+            #xgboost removes its cache pages when the matrices are released
+            del train_matrix,test_matrix
+            shutil.rmtree(config.external_memory_cache_dir,ignore_errors = True)
+            return model
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def predict_array_file(self,model:XGBClassifier,file_path:str)->tuple:
+        """
+        predict a transformed array directory chunk by chunk
+        ================================
+        return target and predicted target of every row
+        """
+        try:
+            y_true,y_pred = [],[]
+            chunk_size = self.model_trainer_config.chunk_size
+            for X,y in zip(utils.iter_numpy_array_chunks(file_path = file_path,chunk_size = chunk_size,array_name = "X"),
+                    utils.iter_numpy_array_chunks(file_path = file_path,chunk_size = chunk_size,array_name = "y")):
+                y_true.append(y)
+                y_pred.append(model.predict(X))
+            return np.concatenate(y_true),np.concatenate(y_pred)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
     def initiate_model_trainer(self)->artifact_entity.ModelTrainerArtifact:
         try:
-            logging.info(f"loading train and test array")
-            train_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
+            best_params = dict()
+            search_trace_path = None
+            if self.model_trainer_config.training_mode == "external_memory":
+                logging.info(f"train the model from chunks of transformed arrays in xgboost external memory")
+                if self.model_trainer_config.fine_tune:
+                    logging.info(f"parameter search needs in memory arrays, it is skipped in external memory mode")
+                with instrumentation.step("train_external_memory"):
+                    instrumentation.add_file_read(self.data_transformation_artifact.transformed_train_path)
+                    instrumentation.add_file_read(self.data_transformation_artifact.transformed_test_path)
+                    model = self.train_model_external_memory()
+
+                logging.info(f"predict train and test array chunk by chunk")
+                with instrumentation.step("predict") as metrics:
+                    y_train,yhat_train = self.predict_array_file(model = model,file_path = self.data_transformation_artifact.transformed_train_path)
+                    y_test,yhat_test = self.predict_array_file(model = model,file_path = self.data_transformation_artifact.transformed_test_path)
+                    metrics.add(rows_in = len(y_train) + len(y_test))
+            else:
+                #memory mapped arrays are zero copy views of the files, parallel search workers map the same pages
+                logging.info(f"loading train and test array")
+                with instrumentation.step("load_arrays"):
+                    train_arrays = utils.load_numpy_arrays(dir_path = self.data_transformation_artifact.transformed_train_path,
+                        mmap_mode = self.model_trainer_config.mmap_mode)
+                    test_arrays = utils.load_numpy_arrays(dir_path = self.data_transformation_artifact.transformed_test_path,
+                        mmap_mode = self.model_trainer_config.mmap_mode)
+                    instrumentation.add_file_read(self.data_transformation_artifact.transformed_train_path)
+                    instrumentation.add_file_read(self.data_transformation_artifact.transformed_test_path)
+                X_train, y_train = train_arrays["X"], train_arrays["y"]
+                X_test, y_test = test_arrays["X"], test_arrays["y"]
 
-            logging.info(f"split input and target feature from train and test array")  
-            X_train, y_train = train_arr[:,:-1], train_arr[:,-1]
-            X_test, y_test = test_arr[:,:-1], test_arr[:,-1]
+                if self.model_trainer_config.fine_tune:
+                    logging.info(f"search best parameters")
+                    with instrumentation.step("fine_tune") as metrics:
+                        metrics.add(rows_in = len(y_train))
+                        search_result = self.fine_tune(X = X_train,y = y_train)
+                    best_params = search_result["best_params"]
+                    search_trace_path = self.model_trainer_config.search_trace_path
+                    utils.write_yaml_file(file_path = search_trace_path,data = search_result)
 
-            logging.info(f"train the model")
-            model = self.train_model(X = X_train,y = y_train)
+                logging.info(f"train the model")
+                with instrumentation.step("xgboost_fit") as metrics:
+                    metrics.add(rows_in = len(y_train))
+                    model = self.train_model(X = X_train,y = y_train,params = best_params)
+                with instrumentation.step("predict") as metrics:
+                    metrics.add(rows_in = len(y_train) + len(y_test))
+                    yhat_train = model.predict(X_train)
+                    yhat_test = model.predict(X_test)
 
-            logging.info(f"calculate f1 train score") 
-            yhat_train = model.predict(X_train)
+            logging.info(f"calculate f1 train score")
             f1_train_score = f1_score(y_true = y_train, y_pred = yhat_train)
 
             logging.info(f"calculate f1 test score")
-            yhat_test = model.predict(X_test)
             f1_test_score = f1_score(y_true = y_test, y_pred = yhat_test)
             logging.info(f"train score: {f1_train_score} and test score: {f1_test_score}")
         
@@ -74,11 +259,13 @@ class ModelTrainer:
             #save the trained model
             logging.info(f"save model object")
             utils.save_object(file_path = self.model_trainer_config.model_path, obj = model)
+            instrumentation.add_file_written(self.model_trainer_config.model_path)
 
             #prepare artifact
             logging.info(f"prepare the artifact")
             model_trainer_artifact = artifact_entity.ModelTrainerArtifact(model_path = self.model_trainer_config.model_path,
-            f1_train_score = f1_train_score, f1_test_score = f1_test_score)
+            f1_train_score = f1_train_score, f1_test_score = f1_test_score,
+            best_params = best_params, search_trace_path = search_trace_path)
             logging.info(f"Model trainer artifact:{model_trainer_artifact}")
 
             return model_trainer_artifact
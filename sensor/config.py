@@ -1,7 +1,5 @@
-import pymongo
-import pandas as pd
-import json
 import os
+import threading
 from dataclasses import dataclass
 
 
@@ -10,8 +8,37 @@ from dataclasses import dataclass
 @dataclass
 class EnvironMentVariable:
     mongodb_url:str = os.getenv("MONGODB_URL")
+    #size of connection pool shared by every thread of a process
+    mongodb_max_pool_size:int = int(os.getenv("MONGODB_MAX_POOL_SIZE",100))
 
 env_var = EnvironMentVariable()
 
-mongo_client = pymongo.MongoClient(env_var.mongodb_url)
-TARGET_COLUMN = "class"
\ No newline at end of file
+TARGET_COLUMN = "class"
+
+#client is created on first use so importing the package never resolves or connects to mongodb
+_mongo_client = None
+_mongo_client_pid = None
+_mongo_client_lock = threading.Lock()
+
+def get_mongo_client():
+    """
+    return mongodb client of the current process, created on first call and reused afterwards
+    a client is not fork safe, a forked child creates its own instead of using the one of its parent
+    """
+    global _mongo_client, _mongo_client_pid
+    if _mongo_client is None or _mongo_client_pid != os.getpid():
+        with _mongo_client_lock:
+            if _mongo_client is None or _mongo_client_pid != os.getpid():
+                import pymongo
+                _mongo_client = pymongo.MongoClient(env_var.mongodb_url,maxPoolSize = env_var.mongodb_max_pool_size)
+                _mongo_client_pid = os.getpid()
+    return _mongo_client
+
+def set_mongo_client(client)->None:
+    """
+    use client as mongodb client of the current process, e.g. a mongomock client in benchmarks
+    """
+    global _mongo_client, _mongo_client_pid
+    with _mongo_client_lock:
+        _mongo_client = client
+        _mongo_client_pid = os.getpid()
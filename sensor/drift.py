@@ -0,0 +1,147 @@
+import os, sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from scipy.stats import distributions, ks_2samp
+from sensor.exception import SensorException
+from sensor import logger
+
+#scipy ks_2samp switches from exact to asymptotic p-value above this sample size
+MAX_EXACT_N = 10000
+
+def sort_columns(arr:np.ndarray):
+    """
+    sort every column of a 2d array once, NaN values are moved to the end of each column
+    arr: 2d float array
+    ================================
+    return sorted array and number of non NaN values in each column
+    """
+    try:
+        arr = np.asarray(arr,dtype = np.float64)
+        #sorting rows of the transposed copy keeps every column contiguous in memory
+        sorted_arr = np.sort(arr.T,axis = 1).T
+        counts = np.count_nonzero(~np.isnan(sorted_arr),axis = 0)
+        return sorted_arr, counts
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def ks_statistic_sorted(base_sorted:np.ndarray,base_counts:np.ndarray,
+                        current_sorted:np.ndarray,current_counts:np.ndarray)->np.ndarray:
+    """
+    two sided KS statistic of every column in a single vectorized pass
+    both inputs are column wise sorted with NaN at the end (see sort_columns)
+    ================================
+    return array of KS statistics, NaN for columns without values in one of the samples
+    """
+    try:
+        #work on columns as contiguous rows of a (columns, rows) array
+        n_base = base_sorted.shape[0]
+        combined = np.concatenate([base_sorted.T,current_sorted.T],axis = 1)
+
+        #both halves are already sorted so a stable sort only merges two runs
+        order = np.argsort(combined,axis = 1,kind = "stable")
+        combined = np.take_along_axis(combined,order,axis = 1)
+
+        #every base value moves the ecdf difference up, every current value moves it down
+        with np.errstate(divide = "ignore"):
+            weights = np.where(order < n_base,(1.0 / base_counts)[:,None],(-1.0 / current_counts)[:,None])
+        is_nan = np.isnan(combined)
+        weights[is_nan] = 0.0
+        cdf_diff = np.abs(np.cumsum(weights,axis = 1))
+
+        #ecdf is only evaluated after the last value of a run of ties
+        is_last_tie = np.ones(combined.shape,dtype = bool)
+        is_last_tie[:,:-1] = combined[:,:-1] != combined[:,1:]
+        cdf_diff[~is_last_tie | is_nan] = 0.0
+
+        statistics = cdf_diff.max(axis = 1,initial = 0.0)
+        statistics[(base_counts == 0) | (current_counts == 0)] = np.nan
+        return statistics
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def ks_pvalues(statistics:np.ndarray,base_counts:np.ndarray,current_counts:np.ndarray,
+                base_sorted:np.ndarray,current_sorted:np.ndarray)->np.ndarray:
+    """
+    two sided p-values computed the same way as scipy.stats.ks_2samp(method = "auto")
+    asymptotic distribution is vectorized, small samples fall back to scipy exact method
+    """
+    try:
+        pvalues = np.full(statistics.shape,np.nan)
+        valid = ~np.isnan(statistics)
+        is_exact = valid & (np.maximum(base_counts,current_counts) <= MAX_EXACT_N)
+        is_asymp = valid & ~is_exact
+
+        m = np.maximum(base_counts[is_asymp],current_counts[is_asymp]).astype(np.float64)
+        n = np.minimum(base_counts[is_asymp],current_counts[is_asymp]).astype(np.float64)
+        en = m * n / (m + n)
+        pvalues[is_asymp] = np.clip(distributions.kstwo.sf(statistics[is_asymp],np.round(en)),0,1)
+
+        for column in np.flatnonzero(is_exact):
+            pvalues[column] = ks_2samp(base_sorted[:base_counts[column],column],
+                current_sorted[:current_counts[column],column]).pvalue
+        return pvalues
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def ks_2samp_block(base_sorted:np.ndarray,base_counts:np.ndarray,current:np.ndarray):
+    """
+    KS statistics and p-values of a block of columns, base block is already sorted
+    """
+    try:
+        current_sorted, current_counts = sort_columns(current)
+        statistics = ks_statistic_sorted(base_sorted = base_sorted,base_counts = base_counts,
+            current_sorted = current_sorted,current_counts = current_counts)
+        pvalues = ks_pvalues(statistics = statistics,base_counts = base_counts,current_counts = current_counts,
+            base_sorted = base_sorted,current_sorted = current_sorted)
+        return statistics, pvalues
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def ks_2samp_columns(base:np.ndarray,current:np.ndarray,base_is_sorted:bool = False,
+                    block_size:int = 32,n_jobs:Optional[int] = 1):
+    """
+    Batched two sample KS test of every column of base against same column of current.
+    NaN values are dropped column wise before testing (scipy nan_policy = "omit").
+    base: 2d float array, may be presorted with sort_columns
+    current: 2d float array with same number of columns
+    block_size: number of columns processed together, bounds the temporary memory
+    n_jobs: number of worker processes used for column blocks, None uses every cpu
+    ================================
+    return array of KS statistics and array of p-values
+    """
+    try:
+        if base_is_sorted:
+            base_sorted = np.asarray(base,dtype = np.float64)
+            base_counts = np.count_nonzero(~np.isnan(base_sorted),axis = 0)
+        else:
+            base_sorted, base_counts = sort_columns(base)
+        current = np.asarray(current,dtype = np.float64)
+
+        if base_sorted.shape[1] != current.shape[1]:
+            raise Exception(f"Number of columns does not match: {base_sorted.shape[1]} and {current.shape[1]}")
+
+        blocks = [slice(start,start + block_size) for start in range(0,current.shape[1],block_size)]
+        block_args = [(base_sorted[:,block],base_counts[block],current[:,block]) for block in blocks]
+
+        n_jobs = n_jobs or os.cpu_count()
+        if n_jobs > 1 and len(blocks) > 1:
+            #workers log through the queue of the parent, as the other process pools of the pipeline do
+            with ProcessPoolExecutor(max_workers = min(n_jobs,len(blocks)),initializer = logger.init_worker_logging,
+                    initargs = (logger.get_worker_log_queue(),)) as executor:
+                results = list(executor.map(ks_2samp_block,*zip(*block_args)))
+        else:
+            results = [ks_2samp_block(*args) for args in block_args]
+
+        if len(results) == 0:
+            return np.empty(0), np.empty(0)
+        statistics = np.concatenate([result[0] for result in results])
+        pvalues = np.concatenate([result[1] for result in results])
+        return statistics, pvalues
+
+    except Exception as e:
+        raise SensorException(e, sys)
@@ -16,18 +16,29 @@ class DataTransformationArtifact:
     transformed_train_path:str
     transformed_test_path:str
     target_encoder_path:str
+    compact_transformer_path:str
+    rebalancing_report_path:str
+    scale_pos_weight:float
 
 @dataclass
 class ModelTrainerArtifact:
     model_path:str
     f1_train_score:float
     f1_test_score:float
+    best_params:dict
+    search_trace_path:str
 
 
 @dataclass
 class ModelEvaluationArtifact:
     is_model_accepted:bool
     improved_accuracy:float
+    report_file_path:str
 
     
-class ModelPusherArtifact:...
\ No newline at end of file
+@dataclass
+class ModelPusherArtifact:
+    pusher_model_dir:str
+    saved_model_dir:str
+    version:int
+    manifest_file_path:str
\ No newline at end of file
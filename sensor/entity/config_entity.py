@@ -7,14 +7,25 @@ FILE_NAME = "sensor.csv"
 TRAIN_FILE_NAME = "train.csv"
 TEST_FILE_NAME = "test.csv"
 TRANSFORMER_OBJECT_FILE_NAME = "tranasformer.pkl"
+COMPACT_TRANSFORMER_FILE_NAME = "compact_transformer.npz"
 TARGET_ENCODER_OBJECT_FILE_NAME = "target_encoder.pkl"
 MODEL_FILE_NAME = "model.pkl"
+REGISTRY_MANIFEST_FILE_NAME = "manifest.yaml"
 
 class TrainingPipelineConfig:
 
     def __init__(self):
         try:
             self.artifact_dir = os.path.join(os.getcwd(),"artifact",f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}")
+            #stages whose config and inputs did not change reuse artifacts of an earlier run
+            self.use_cache = True
+            self.cache_dir = os.path.join(os.getcwd(),"stage_cache")
+            #independent stages run concurrently in a "thread" or "process" pool
+            self.executor_type = "thread"
+            self.max_workers = 2
+            #dtype sensor values are parsed, stored, transformed and trained in, "float32" halves their memory
+            #at the cost of precision, it changes the artifacts and baseline profile of a run so they are not reused
+            self.float_dtype = "float64"
         except Exception  as e:
             raise SensorException(e,sys)
 
@@ -23,11 +34,24 @@ class DataIngestionConfig:
         try:
             self.database_name = "aps"
             self.collection_name = "sensor"
+            #file format of feature store and train/test files: parquet or csv
+            self.file_format = "parquet"
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir,"data_ingestion")
-            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",FILE_NAME)
-            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_FILE_NAME)
-            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",TEST_FILE_NAME)
+            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,"feature_store",FILE_NAME.replace("csv", self.file_format))
+            self.train_file_path = os.path.join(self.data_ingestion_dir,"dataset",TRAIN_FILE_NAME.replace("csv", self.file_format))
+            self.test_file_path = os.path.join(self.data_ingestion_dir,"dataset",TEST_FILE_NAME.replace("csv", self.file_format))
             self.test_size = 0.2
+            #number of documents exported at a time, None exports the whole collection at once
+            self.chunk_size = 10000
+            #incremental mode only pulls documents newer than the stored watermark
+            self.incremental = False
+            self.watermark_field = "_id"
+            #ranges of partition_field read at the same time, 1 reads the collection over a single cursor
+            self.read_n_jobs = 1
+            self.partition_field = "_id"
+            self.float_dtype = training_pipeline_config.float_dtype
+            #persistent feature store shared by all runs, it is not inside timestamped artifact dir
+            self.persistent_feature_store_dir = os.path.join(os.getcwd(),"feature_store",self.collection_name)
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -45,6 +69,12 @@ class DataValidationConfig:
             self.report_file_path = os.path.join(self.data_validation_dir,"report.yaml")
             self.missing_threshold:float = 0.7
             self.base_file_path = os.path.join("aps_failure_training_set1.csv")
+            #profiles of base file are shared by all runs, it is not inside timestamped artifact dir
+            self.baseline_profile_dir = os.path.join(os.getcwd(),"baseline_profile")
+            #columns tested together by drift engine and number of worker processes
+            self.drift_block_size = 32
+            self.drift_n_jobs = 1
+            self.float_dtype = training_pipeline_config.float_dtype
             
         except Exception as e:
             raise SensorException(e, sys)
@@ -55,9 +85,23 @@ class DataTransformationConfig:
         try:
             self.data_transform_dir = os.path.join(training_pipeline_config.artifact_dir,"data_transformation")
             self.transform_object_path = os.path.join(self.data_transform_dir,"transformer",TRANSFORMER_OBJECT_FILE_NAME)
-            self.transformed_train_path = os.path.join(self.data_transform_dir,"transformed",TRAIN_FILE_NAME.replace("csv", "npz"))
-            self.transformed_test_path = os.path.join(self.data_transform_dir,"transformed",TEST_FILE_NAME.replace("csv", "npz"))
+            self.compact_transformer_path = os.path.join(self.data_transform_dir,"transformer",COMPACT_TRANSFORMER_FILE_NAME)
+            #directories with input features X.npy and target y.npy
+            self.transformed_train_path = os.path.join(self.data_transform_dir,"transformed",TRAIN_FILE_NAME.replace(".csv", ""))
+            self.transformed_test_path = os.path.join(self.data_transform_dir,"transformed",TEST_FILE_NAME.replace(".csv", ""))
             self.target_encoder_path = os.path.join(self.data_transform_dir,"target_encoder",TARGET_ENCODER_OBJECT_FILE_NAME)
+            #"smotetomek", "smote", "class_weight" (scale_pos_weight instead of resampling) or "none"
+            self.rebalancing_strategy = "smotetomek"
+            #neighbour searches of resampling run in rebalancing_n_jobs workers and can be approximate
+            self.rebalancing_n_jobs = 1
+            self.approximate_neighbors = False
+            #test array is resampled like the train array, False keeps its real class ratio
+            self.resample_test = True
+            self.random_state = 42
+            self.rebalancing_report_path = os.path.join(self.data_transform_dir,"rebalancing_report.yaml")
+            self.float_dtype = training_pipeline_config.float_dtype
+            #encoded target has two classes so a small integer array is enough
+            self.target_dtype = "int8"
             
         except Exception as e:
             raise SensorException(e, sys)
@@ -70,13 +114,70 @@ class ModelTrainerConfig:
             self.model_path = os.path.join(self.model_trainer_dir , "model",MODEL_FILE_NAME)
             self.expected_score = 0.7
             self.overfitting_threshold = 0.1
+            #successive halving search of xgboost parameters, default parameters are used when disabled
+            self.fine_tune = False
+            self.search_trace_path = os.path.join(self.model_trainer_dir,"search_trace.yaml")
+            self.search_space = {
+                "max_depth":[3,4,6,8],
+                "learning_rate":[0.03,0.1,0.3],
+                "min_child_weight":[1,3,5],
+                "subsample":[0.7,0.85,1.0],
+                "colsample_bytree":[0.5,0.75,1.0],
+                "reg_lambda":[0.1,1.0,10.0]}
+            self.n_candidates = 27
+            #boosting rounds of the first rung, every rung keeps 1/halving_factor candidates with halving_factor times more rounds
+            self.min_boosting_rounds = 50
+            self.max_boosting_rounds = 1350
+            self.halving_factor = 3
+            self.early_stopping_rounds = 20
+            #transformed arrays are memory mapped read only instead of being read in memory, None reads them
+            self.mmap_mode = "r"
+            #part of train array held out to rank candidates, test array is never seen by the search
+            self.validation_size = 0.2
+            self.search_n_jobs = 2
+            self.random_state = 42
+            #"in_memory" fits on loaded arrays, "external_memory" streams chunks of the transformed arrays
+            #into xgboost quantized external memory so train array does not need to fit in memory
+            self.training_mode = "in_memory"
+            self.chunk_size = 100000
+            self.n_threads = os.cpu_count()
+            self.max_bin = 256
+            self.num_boost_round = 100
+            self.external_memory_cache_dir = os.path.join(self.model_trainer_dir,"external_memory_cache")
 
         except Exception as e:
             raise SensorException(e, sys) 
 
 class ModelEvaluationConfig:
     def __init__(self,training_pipeline_config:TrainingPipelineConfig):
+        try:
+            #trained model is accepted when its f1 score beats the production version by more than change threshold
             self.change_threshold = 0.01
+            self.model_evaluation_dir = os.path.join(training_pipeline_config.artifact_dir,"model_evaluation")
+            self.report_file_path = os.path.join(self.model_evaluation_dir,"report.yaml")
+            self.saved_model_dir = os.path.join("saved_models")
+            #latest registry versions scored for the leaderboard, the latest one is the production version
+            self.n_versions = 5
+            #transformers and their models are scored in n_jobs threads
+            self.n_jobs = 4
+            #predictions are keyed by content of test file, transformer and model so a rerun reuses them
+            self.use_prediction_cache = training_pipeline_config.use_cache
+            self.prediction_cache_dir = os.path.join(training_pipeline_config.cache_dir,"model_evaluation")
+        except Exception as e:
+            raise SensorException(e,sys)
+
 
+class ModelPusherConfig:
 
-class ModelPusherConfig:...
\ No newline at end of file
+    def __init__(self,training_pipeline_config:TrainingPipelineConfig):
+        try:
+            self.model_pusher_dir = os.path.join(training_pipeline_config.artifact_dir , "model_pusher")
+            self.saved_model_dir = os.path.join("saved_models")
+            self.pusher_model_dir = os.path.join(self.model_pusher_dir,"saved_models")
+            self.pusher_model_path = os.path.join(self.pusher_model_dir,"model",MODEL_FILE_NAME)
+            self.pusher_transformer_path = os.path.join(self.pusher_model_dir,"transformer",TRANSFORMER_OBJECT_FILE_NAME)
+            self.pusher_compact_transformer_path = os.path.join(self.pusher_model_dir,"transformer",COMPACT_TRANSFORMER_FILE_NAME)
+            self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir,"target_encoder",TARGET_ENCODER_OBJECT_FILE_NAME)
+
+        except Exception as e:
+            raise SensorException(e, sys)
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os, sys
+import yaml
+import pandas as pd
+from bson import json_util
+from datetime import datetime
+from typing import Iterator, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import utils
+
+MANIFEST_FILE_NAME = "manifest.yaml"
+
+class FeatureStore:
+    """
+    Persistent feature store made of append only partitions.
+    Every incremental ingestion adds one partition and moves the watermark forward.
+    The manifest keeps partition list and watermark so later stages can read
+    the store in full or by a range of partitions.
+    """
+
+    def __init__(self,feature_store_dir:str,file_format:str = "csv"):
+        try:
+            self.feature_store_dir = feature_store_dir
+            self.file_format = file_format
+            os.makedirs(self.feature_store_dir,exist_ok = True)
+            self.manifest_file_path = os.path.join(self.feature_store_dir,MANIFEST_FILE_NAME)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def read_manifest(self)->dict:
+        try:
+            if not os.path.exists(self.manifest_file_path):
+                return {"watermark":None,"partitions":[]}
+
+            with open(self.manifest_file_path,"r") as file_obj:
+                return yaml.safe_load(file_obj)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def write_manifest(self,manifest:dict)->None:
+        try:
+            #write to a temp file and rename it so readers never see a half written manifest
+            tmp_file_path = f"{self.manifest_file_path}.tmp"
+            with open(tmp_file_path,"w") as file_obj:
+                yaml.safe_dump(manifest,file_obj)
+            os.replace(tmp_file_path,self.manifest_file_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_watermark(self):
+        """
+        return the highest watermark value already stored, None if store is empty
+        """
+        try:
+            watermark = self.read_manifest()["watermark"]
+            if watermark is None:
+                return None
+            #watermark is stored as extended json so ObjectId and datetime survive the round trip
+            return json_util.loads(watermark)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_partitions(self,start_partition:Optional[int] = None,end_partition:Optional[int] = None)->list:
+        """
+        return partition records between start_partition and end_partition (both inclusive)
+        """
+        try:
+            partitions = self.read_manifest()["partitions"]
+            return [partition for partition in partitions
+                if (start_partition is None or partition["partition"] >= start_partition)
+                and (end_partition is None or partition["partition"] <= end_partition)]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_next_partition_number(self)->int:
+        try:
+            partitions = self.read_manifest()["partitions"]
+            return partitions[-1]["partition"] + 1 if len(partitions) > 0 else 1
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_tmp_partition_file_path(self)->str:
+        """
+        return location where the next partition can be written before it is published
+        """
+        try:
+            return os.path.join(self.feature_store_dir,f"part-{self.get_next_partition_number():05d}.tmp.{self.file_format}")
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def add_partition(self,tmp_file_path:str,rows:int,watermark)->dict:
+        """
+        Publish an already written partition file and move the watermark
+        tmp_file_path: location of the written partition file
+        rows: number of rows in partition
+        watermark: highest watermark value in partition
+        ================================
+        return the partition record added to manifest
+        """
+        try:
+            manifest = self.read_manifest()
+            partition_number = self.get_next_partition_number()
+            partition_file_path = os.path.join(self.feature_store_dir,f"part-{partition_number:05d}.{self.file_format}")
+            os.replace(tmp_file_path,partition_file_path)
+
+            partition = {
+                "partition":partition_number,
+                "file_name":os.path.basename(partition_file_path),
+                "rows":int(rows),
+                "watermark":json_util.dumps(watermark),
+                "created_at":datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}
+
+            manifest["partitions"].append(partition)
+            manifest["watermark"] = partition["watermark"]
+            self.write_manifest(manifest)
+            logging.info(f"Added partition: {partition}")
+            return partition
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def iter_dataframes(self,start_partition:Optional[int] = None,end_partition:Optional[int] = None,
+                        chunk_size:Optional[int] = None,columns:Optional[list] = None)->Iterator[pd.DataFrame]:
+        """
+        yields dataframes of selected partitions, in chunks of chunk_size rows if given
+        columns: optional list of columns to read
+        """
+        try:
+            for partition in self.get_partitions(start_partition = start_partition,end_partition = end_partition):
+                #partitions keep their own extension so a store can mix csv and parquet partitions
+                partition_file_path = os.path.join(self.feature_store_dir,partition["file_name"])
+                yield from utils.iter_dataframe_chunks(file_path = partition_file_path,chunk_size = chunk_size,columns = columns)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def read(self,start_partition:Optional[int] = None,end_partition:Optional[int] = None,
+            columns:Optional[list] = None)->pd.DataFrame:
+        """
+        return selected partitions as a single dataframe
+        """
+        try:
+            return pd.concat(list(self.iter_dataframes(start_partition = start_partition,end_partition = end_partition,
+                columns = columns)),ignore_index = True)
+
+        except Exception as e:
+            raise SensorException(e, sys)
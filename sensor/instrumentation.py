@@ -0,0 +1,206 @@
+import os, sys
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+try:
+    import resource
+except ImportError:
+    #resource module is not available on windows, peak rss and child cpu time are not reported there
+    resource = None
+
+METRICS_FILE_NAME = "metrics.yaml"
+#comma separated stages to profile, optionally with the profiler: "model_trainer,data_transformation:tracemalloc"
+PROFILE_ENV_VAR = "SENSOR_PROFILE_STAGES"
+PROFILERS = ["cprofile","tracemalloc"]
+#number of allocation sites written to a tracemalloc report
+TRACEMALLOC_TOP_N = 25
+
+#innermost step of the current thread or process, steps started inside it become its sub steps
+current_step = contextvars.ContextVar("current_step",default = None)
+
+def get_peak_rss_mb()->Optional[float]:
+    """
+    return peak resident set size of current process in MB
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux reports kilobytes and macOS reports bytes
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+def get_rss_mb()->Optional[float]:
+    """
+    return current resident set size of current process in MB, only available on linux
+    """
+    try:
+        with open("/proc/self/statm") as file_obj:
+            return int(file_obj.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError,ValueError,IndexError):
+        return None
+
+def get_cpu_time_seconds()->float:
+    """
+    return cpu time of every thread of current process and of its finished child processes
+    """
+    if resource is None:
+        return time.process_time()
+    return sum(usage.ru_utime + usage.ru_stime for usage in
+        (resource.getrusage(resource.RUSAGE_SELF),resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+def get_path_size(path:str)->int:
+    """
+    return size in bytes of a file or of every file inside a directory
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root,file_name)) for root,_,file_names in os.walk(path) for file_name in file_names)
+
+class StepMetrics:
+    """
+    Wall time, cpu time, memory, rows and bytes of one step and of its sub steps.
+    cpu time and peak rss are the ones of the whole process, so steps running concurrently in threads share them.
+    Bytes read and written by sub steps are added to their parent, rows are counted per step.
+    """
+
+    def __init__(self,name:str):
+        self.name = name
+        self.counters = {"rows_in":0,"rows_out":0,"bytes_read":0,"bytes_written":0}
+        self.steps = []
+        self.extra = dict()
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = get_cpu_time_seconds()
+        self.wall_time_seconds = None
+        self.cpu_time_seconds = None
+        self.peak_rss_mb = None
+        self.rss_mb = None
+
+    def add(self,**counters)->None:
+        for name,value in counters.items():
+            self.counters[name] = self.counters.get(name,0) + int(value)
+
+    def finish(self)->None:
+        self.wall_time_seconds = time.perf_counter() - self.start_time
+        self.cpu_time_seconds = get_cpu_time_seconds() - self.start_cpu_time
+        self.peak_rss_mb = get_peak_rss_mb()
+        self.rss_mb = get_rss_mb()
+
+    def to_dict(self)->dict:
+        return {"name":self.name,
+            "wall_time_seconds":round(self.wall_time_seconds,4),
+            "cpu_time_seconds":round(self.cpu_time_seconds,4),
+            "peak_rss_mb":None if self.peak_rss_mb is None else round(self.peak_rss_mb,1),
+            "rss_mb":None if self.rss_mb is None else round(self.rss_mb,1),
+            **self.counters,
+            **self.extra,
+            "steps":[step.to_dict() for step in self.steps]}
+
+@contextmanager
+def step(name:str):
+    """
+    measure a block as a sub step of the current step
+    with instrumentation.step("smotetomek") as metrics:
+        ...
+        metrics.add(rows_out = len(y))
+    """
+    parent = current_step.get()
+    metrics = StepMetrics(name = name)
+    token = current_step.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current_step.reset(token)
+        metrics.finish()
+        if parent is not None:
+            parent.steps.append(metrics)
+            parent.add(bytes_read = metrics.counters["bytes_read"],bytes_written = metrics.counters["bytes_written"])
+        logging.info(f"step: [{name}] finished in {metrics.wall_time_seconds:.3f} s, counters: {metrics.counters}")
+
+def add(**counters)->None:
+    """
+    add rows_in, rows_out, bytes_read, bytes_written or any other counter to the current step
+    nothing is recorded when no step is running, e.g. a component used outside the pipeline
+    """
+    metrics = current_step.get()
+    if metrics is not None:
+        metrics.add(**counters)
+
+def add_file_read(path:str)->None:
+    add(bytes_read = get_path_size(path))
+
+def add_file_written(path:str)->None:
+    add(bytes_written = get_path_size(path))
+
+def get_profiled_stages()->dict:
+    """
+    return stage name and profiler of every stage listed in SENSOR_PROFILE_STAGES
+    """
+    profiled_stages = dict()
+    for item in os.getenv(PROFILE_ENV_VAR,"").split(","):
+        if item.strip() == "":
+            continue
+        stage_name,_,profiler = item.strip().partition(":")
+        profiler = profiler or "cprofile"
+        if profiler not in PROFILERS:
+            raise Exception(f"Unknown profiler: {profiler} of stage: {stage_name}, expected one of {PROFILERS}")
+        profiled_stages[stage_name] = profiler
+    return profiled_stages
+
+@contextmanager
+def profile(profiler:str,profile_dir:str,name:str):
+    """
+    run a block under cProfile or tracemalloc and write its profile in profile_dir
+    ================================
+    yield dictionary filled with the location of the profile and, for tracemalloc, the traced peak
+    """
+    os.makedirs(profile_dir,exist_ok = True)
+    profile_info = dict()
+    if profiler == "cprofile":
+        import cProfile
+        profiler_obj = cProfile.Profile()
+        profiler_obj.enable()
+        try:
+            yield profile_info
+        finally:
+            profiler_obj.disable()
+            profile_info["profile_file_path"] = os.path.join(profile_dir,f"{name}.prof")
+            profiler_obj.dump_stats(profile_info["profile_file_path"])
+    else:
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield profile_info
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _,traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            profile_info["traced_peak_mb"] = round(traced_peak / 1024**2,1)
+            profile_info["profile_file_path"] = os.path.join(profile_dir,f"{name}.tracemalloc.txt")
+            with open(profile_info["profile_file_path"],"w") as file_obj:
+                for statistic in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_N]:
+                    file_obj.write(f"{statistic}\n")
+
+def run_stage(name:str,func,profile_dir:Optional[str] = None,**kwargs)->tuple:
+    """
+    run a pipeline stage as the root step of its metrics, under a profiler when SENSOR_PROFILE_STAGES lists it
+    ================================
+    return result of func and metrics of the stage as a dictionary
+    """
+    try:
+        profiler = get_profiled_stages().get(name)
+        with step(name) as metrics:
+            if profiler is None or profile_dir is None:
+                result = func(**kwargs)
+            else:
+                logging.info(f"profiling stage: [{name}] with {profiler}")
+                with profile(profiler = profiler,profile_dir = profile_dir,name = name) as profile_info:
+                    result = func(**kwargs)
+                metrics.extra["profile"] = {"profiler":profiler,**profile_info}
+        metrics.extra["pid"] = os.getpid()
+        return result,metrics.to_dict()
+
+    except Exception as e:
+        raise SensorException(e, sys)
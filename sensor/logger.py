@@ -1,5 +1,9 @@
 import logging
+import logging.handlers
 import os
+import queue
+import atexit
+import threading
 from datetime import datetime
 
 #log file name
@@ -8,14 +12,162 @@ log_file_name = f"{datetime.now().strftime('%Y-%m-%d_%H:%M:%S')}.log"
 #log directory
 log_file_dir = os.path.join(os.getcwd(),"logs")
 
-#create folder if not available
-os.makedirs(log_file_dir,exist_ok=True)
-
 #log file path
 log_file_path = os.path.join(log_file_dir,log_file_name)
 
-logging.basicConfig(
-    filename=log_file_path,
-    format= "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s",
-    level=logging.DEBUG
-)
\ No newline at end of file
+LOG_FORMAT = "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s"
+
+#"queue" formats and writes records in a background thread, "sync" writes them in the thread logging them
+LOG_MODE = os.getenv("SENSOR_LOG_MODE","queue")
+#level of every module not listed in SENSOR_LOG_MODULE_LEVELS
+LOG_LEVEL = os.getenv("SENSOR_LOG_LEVEL","DEBUG")
+#comma separated module levels, module is the file name or logger name: "data_validation=WARNING,utils=INFO"
+LOG_MODULE_LEVELS = os.getenv("SENSOR_LOG_MODULE_LEVELS","")
+#"size" rotates when file reaches SENSOR_LOG_MAX_BYTES, "time" every SENSOR_LOG_ROTATE_WHEN, "none" never
+LOG_ROTATION = os.getenv("SENSOR_LOG_ROTATION","size")
+LOG_MAX_BYTES = int(os.getenv("SENSOR_LOG_MAX_BYTES",str(50 * 1024**2)))
+LOG_ROTATE_WHEN = os.getenv("SENSOR_LOG_ROTATE_WHEN","midnight")
+LOG_BACKUP_COUNT = int(os.getenv("SENSOR_LOG_BACKUP_COUNT","5"))
+
+class LazyOpenMixin:
+    """
+    Creates log folder and file on first record instead of at import
+    """
+
+    def _open(self):
+        #create folder if not available
+        os.makedirs(os.path.dirname(self.baseFilename),exist_ok=True)
+        return super()._open()
+
+class LazyFileHandler(LazyOpenMixin,logging.FileHandler):
+
+    def __init__(self,filename:str):
+        super().__init__(filename,delay = True)
+
+class LazyRotatingFileHandler(LazyOpenMixin,logging.handlers.RotatingFileHandler):
+
+    def __init__(self,filename:str,max_bytes:int,backup_count:int):
+        super().__init__(filename,maxBytes = max_bytes,backupCount = backup_count,delay = True)
+
+class LazyTimedRotatingFileHandler(LazyOpenMixin,logging.handlers.TimedRotatingFileHandler):
+
+    def __init__(self,filename:str,when:str,backup_count:int):
+        super().__init__(filename,when = when,backupCount = backup_count,delay = True)
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Drops records below the level of their module, so a module is made quieter or more verbose without editing it.
+    Records are dropped before they are formatted or queued.
+    """
+
+    def __init__(self,level:int,module_levels:dict):
+        super().__init__()
+        self.level = level
+        self.module_levels = module_levels
+
+    def filter(self,record:logging.LogRecord)->bool:
+        level = self.module_levels.get(record.name,self.module_levels.get(record.module,self.level))
+        return record.levelno >= level
+
+class ThreadQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler of threads of current process, message is formatted by the listener thread
+    and not by the thread logging it
+    """
+
+    def prepare(self,record:logging.LogRecord)->logging.LogRecord:
+        return record
+
+def get_level(level:str)->int:
+    level_number = logging.getLevelName(level.strip().upper())
+    if not isinstance(level_number,int):
+        raise ValueError(f"Unknown log level: {level}")
+    return level_number
+
+def get_module_levels(module_levels:str)->dict:
+    """
+    return level of every module of a "data_validation=WARNING,utils=INFO" string
+    """
+    levels = dict()
+    for item in module_levels.split(","):
+        if item.strip() == "":
+            continue
+        module,_,level = item.partition("=")
+        levels[module.strip()] = get_level(level)
+    return levels
+
+def get_file_handler()->logging.Handler:
+    if LOG_ROTATION == "size":
+        file_handler = LazyRotatingFileHandler(log_file_path,max_bytes = LOG_MAX_BYTES,backup_count = LOG_BACKUP_COUNT)
+    elif LOG_ROTATION == "time":
+        file_handler = LazyTimedRotatingFileHandler(log_file_path,when = LOG_ROTATE_WHEN,backup_count = LOG_BACKUP_COUNT)
+    elif LOG_ROTATION == "none":
+        file_handler = LazyFileHandler(log_file_path)
+    else:
+        raise ValueError(f"Unknown log rotation: {LOG_ROTATION}, expected size, time or none")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return file_handler
+
+def configure_root_logger(handler:logging.Handler)->None:
+    """
+    make handler the only handler of root logger, filtered by module levels
+    """
+    level = get_level(LOG_LEVEL)
+    module_levels = get_module_levels(LOG_MODULE_LEVELS)
+    handler.addFilter(ModuleLevelFilter(level = level,module_levels = module_levels))
+    root_logger = logging.getLogger()
+    for old_handler in list(root_logger.handlers):
+        root_logger.removeHandler(old_handler)
+    root_logger.addHandler(handler)
+    #logger lets through the lowest level, filter applies the level of each module
+    root_logger.setLevel(min([level,*module_levels.values()]))
+
+file_handler = get_file_handler()
+#listener and pid of the process that started it, a forked child inherits listeners it does not run
+listeners = []
+#one queue per start method, a queue is only shared with processes of the context that created it
+worker_log_queues = dict()
+worker_log_queue_lock = threading.Lock()
+
+def stop_listeners()->None:
+    #records still in the queues are written before the process exits
+    while len(listeners) > 0:
+        listener,pid = listeners.pop()
+        if pid == os.getpid():
+            listener.stop()
+    file_handler.close()
+
+if LOG_MODE == "queue":
+    log_queue = queue.SimpleQueue()
+    listeners.append((logging.handlers.QueueListener(log_queue,file_handler),os.getpid()))
+    listeners[-1][0].start()
+    configure_root_logger(handler = ThreadQueueHandler(log_queue))
+elif LOG_MODE == "sync":
+    configure_root_logger(handler = file_handler)
+else:
+    raise ValueError(f"Unknown log mode: {LOG_MODE}, expected queue or sync")
+atexit.register(stop_listeners)
+
+def get_worker_log_queue(mp_context = None):
+    """
+    return queue worker processes send their records to, they are written to the log file of current process
+    pass it to init_worker_logging as initializer of a process pool created with mp_context
+    mp_context: multiprocessing context of the pool, default context when None
+    """
+    import multiprocessing
+    mp_context = mp_context or multiprocessing.get_context()
+    start_method = mp_context.get_start_method()
+    with worker_log_queue_lock:
+        if start_method not in worker_log_queues:
+            worker_log_queues[start_method] = mp_context.Queue()
+            listeners.append((logging.handlers.QueueListener(worker_log_queues[start_method],file_handler),os.getpid()))
+            listeners[-1][0].start()
+        return worker_log_queues[start_method]
+
+def init_worker_logging(log_queue)->None:
+    """
+    initializer of a worker process: records are formatted in the worker and written by the parent process
+    so every process of a run logs to the same file without interleaving or rotating it concurrently
+    """
+    stop_listeners()
+    configure_root_logger(handler = logging.handlers.QueueHandler(log_queue))
@@ -0,0 +1,165 @@
+import os, sys
+import json
+import hashlib
+import uuid
+from dataclasses import asdict, fields, is_dataclass
+from typing import Callable, Optional
+from sensor.exception import SensorException
+from sensor.logger import logging
+from sensor import utils
+
+HASH_INDEX_FILE_NAME = "hash_index.yaml"
+#bumped when the layout of stage output files changes so artifacts of the old layout are not reused
+CACHE_FORMAT_VERSION = 2
+#config attributes that only decide how a stage runs (workers, threads, memory mapping) and not its output,
+#changing them reuses the cached artifact instead of running the stage again
+EXECUTION_ONLY_CONFIG_KEYS = {"n_jobs","read_n_jobs","drift_n_jobs","rebalancing_n_jobs","search_n_jobs",
+    "n_threads","mmap_mode","drift_block_size"}
+
+class StageCache:
+    """
+    Cache of pipeline stage artifacts.
+    A stage is keyed by a hash of its config (without run specific paths),
+    the content of every file its input artifacts point to and any extra
+    inputs such as a collection fingerprint. When the key is already cached
+    and the cached output files still exist, the stored artifact is reused
+    and the stage is not executed again.
+    """
+
+    def __init__(self,cache_dir:str):
+        try:
+            self.cache_dir = cache_dir
+            os.makedirs(self.cache_dir,exist_ok = True)
+            self.hash_index_file_path = os.path.join(self.cache_dir,HASH_INDEX_FILE_NAME)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    @classmethod
+    def get_config_fingerprint(cls,config)->dict:
+        """
+        return config attributes that decide a stage output, paths of timestamped artifact dir
+        and execution only attributes are excluded
+        """
+        try:
+            return {name:value for name,value in vars(config).items()
+                if not (name.endswith("_path") or name.endswith("_dir") or name in EXECUTION_ONLY_CONFIG_KEYS)}
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_path_hash(self,path:str)->str:
+        """
+        return content hash of a file or of every file inside a directory
+        """
+        try:
+            if os.path.isfile(path):
+                return utils.get_cached_file_hash(file_path = path,hash_index_file_path = self.hash_index_file_path)
+
+            dir_hash = hashlib.sha256()
+            for root,_,file_names in sorted(os.walk(path)):
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(root,file_name)
+                    dir_hash.update(os.path.relpath(file_path,path).encode())
+                    dir_hash.update(self.get_path_hash(file_path).encode())
+            return dir_hash.hexdigest()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_artifact_fingerprint(self,artifact)->dict:
+        """
+        return content hash of every path of an artifact, other fields are kept as they are
+        """
+        try:
+            fingerprint = dict()
+            for name,value in asdict(artifact).items():
+                if name.endswith("_path") and isinstance(value,str) and os.path.exists(value):
+                    fingerprint[name] = self.get_path_hash(value)
+                else:
+                    fingerprint[name] = value
+            return fingerprint
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_key(self,stage_name:str,config,input_artifacts:Optional[list] = None,extra:Optional[dict] = None)->str:
+        """
+        return cache key of a stage
+        stage_name: name of stage
+        config: stage config object
+        input_artifacts: artifacts the stage reads
+        extra: any other input deciding the output
+        """
+        try:
+            key_data = {
+                "stage":stage_name,
+                "format_version":CACHE_FORMAT_VERSION,
+                "config":StageCache.get_config_fingerprint(config),
+                "inputs":[self.get_artifact_fingerprint(artifact) for artifact in input_artifacts or []],
+                "extra":extra}
+            return hashlib.sha256(json.dumps(key_data,sort_keys = True,default = str).encode()).hexdigest()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_record_file_path(self,stage_name:str,key:str)->str:
+        return os.path.join(self.cache_dir,stage_name,f"{key}.yaml")
+
+    def get(self,stage_name:str,key:str,artifact_cls:type):
+        """
+        return cached artifact of a stage, None if it is not cached or its files were removed
+        """
+        try:
+            record_file_path = self.get_record_file_path(stage_name = stage_name,key = key)
+            if not os.path.exists(record_file_path):
+                return None
+
+            record = utils.read_yaml_file(record_file_path)
+            #records written before the artifact gained or lost a field can not be reused
+            if set(record) != {field.name for field in fields(artifact_cls)}:
+                logging.info(f"cached artifact of stage: [{stage_name}] has outdated fields: {list(record)}")
+                return None
+
+            artifact = artifact_cls(**record)
+            for field in fields(artifact):
+                value = getattr(artifact,field.name)
+                if field.name.endswith("_path") and isinstance(value,str) and not os.path.exists(value):
+                    logging.info(f"cached artifact of stage: [{stage_name}] is invalid, missing: {value}")
+                    return None
+            return artifact
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def put(self,stage_name:str,key:str,artifact)->None:
+        try:
+            if not is_dataclass(artifact):
+                raise Exception(f"Only dataclass artifacts can be cached, got: {type(artifact)}")
+            record_file_path = self.get_record_file_path(stage_name = stage_name,key = key)
+            tmp_file_path = f"{record_file_path}.{uuid.uuid4().hex}.tmp"
+            utils.write_yaml_file(file_path = tmp_file_path,data = json.loads(json.dumps(asdict(artifact),default = str)))
+            os.replace(tmp_file_path,record_file_path)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def run(self,stage_name:str,artifact_cls:type,func:Callable,config,
+            input_artifacts:Optional[list] = None,extra:Optional[dict] = None):
+        """
+        return cached artifact of a stage or run func and cache its artifact
+        """
+        try:
+            key = self.get_key(stage_name = stage_name,config = config,input_artifacts = input_artifacts,extra = extra)
+            artifact = self.get(stage_name = stage_name,key = key,artifact_cls = artifact_cls)
+            if artifact is not None:
+                logging.info(f"stage: [{stage_name}] reused cached artifact: {artifact}")
+                return artifact
+
+            logging.info(f"stage: [{stage_name}] is not cached, running it")
+            artifact = func()
+            self.put(stage_name = stage_name,key = key,artifact = artifact)
+            return artifact
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,212 @@
+import os, sys
+import multiprocessing
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional
+from sensor.exception import SensorException
+from sensor import logger
+from sensor.logger import logging
+from sensor import utils
+from sensor.entity import config_entity, artifact_entity
+from sensor.pipeline.stage_cache import StageCache
+from sensor import instrumentation
+
+PIPELINE_REPORT_FILE_NAME = "pipeline_report.yaml"
+
+def run_stage(stage_cache:Optional[StageCache],stage_name:str,artifact_cls:type,func:Callable,config,
+            input_artifacts:Optional[list] = None,extra:Optional[dict] = None):
+    """
+    run stage through stage cache, stage is run directly when cache is disabled
+    """
+    if stage_cache is None:
+        return func()
+    return stage_cache.run(stage_name = stage_name,artifact_cls = artifact_cls,func = func,
+        config = config,input_artifacts = input_artifacts,extra = extra)
+
+def start_data_ingestion(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache]):
+    #components are imported by the stage using them, a stage process only imports the libraries of its own stage
+    from sensor.components.data_ingestion import DataIngestion
+    data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config = training_pipeline_config)
+    data_ingestion = DataIngestion(data_ingestion_config = data_ingestion_config)
+    #collection fingerprint changes when documents are added or removed, it is only queried when cache is enabled
+    return run_stage(stage_cache,"data_ingestion",artifact_entity.DataIngestionArtifact,
+        data_ingestion.initiate_data_ingestion,data_ingestion_config,
+        extra = utils.get_collection_fingerprint(database_name = data_ingestion_config.database_name,
+            collection_name = data_ingestion_config.collection_name) if stage_cache else None)
+
+def start_data_validation(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache],
+                        data_ingestion_artifact:artifact_entity.DataIngestionArtifact):
+    from sensor.components.data_validation import DataValidation
+    data_validation_config = config_entity.DataValidationConfig(training_pipeline_config = training_pipeline_config)
+    data_validation = DataValidation(data_validation_config = data_validation_config,
+        data_ingestion_artifact = data_ingestion_artifact)
+    return run_stage(stage_cache,"data_validation",artifact_entity.DataValidationArtifact,
+        data_validation.initiate_data_validation,data_validation_config,
+        input_artifacts = [data_ingestion_artifact],
+        extra = {"base_file_hash":stage_cache.get_path_hash(data_validation_config.base_file_path) if stage_cache else None})
+
+def start_data_transformation(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache],
+                            data_ingestion_artifact:artifact_entity.DataIngestionArtifact):
+    from sensor.components.data_transformation import DataTransformation
+    data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config = training_pipeline_config)
+    data_transformation = DataTransformation(data_transformation_config = data_transformation_config,
+        data_ingestion_artifact = data_ingestion_artifact)
+    return run_stage(stage_cache,"data_transformation",artifact_entity.DataTransformationArtifact,
+        data_transformation.initiate_data_transformation,data_transformation_config,
+        input_artifacts = [data_ingestion_artifact])
+
+def start_model_trainer(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache],
+                        data_transformation_artifact:artifact_entity.DataTransformationArtifact):
+    from sensor.components.model_trainer import ModelTrainer
+    model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config = training_pipeline_config)
+    model_trainer = ModelTrainer(model_trainer_config = model_trainer_config,
+        data_transformation_artifact = data_transformation_artifact)
+    return run_stage(stage_cache,"model_trainer",artifact_entity.ModelTrainerArtifact,
+        model_trainer.initiate_model_trainer,model_trainer_config,
+        input_artifacts = [data_transformation_artifact])
+
+def start_model_evaluation(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache],
+                        data_ingestion_artifact:artifact_entity.DataIngestionArtifact,
+                        data_transformation_artifact:artifact_entity.DataTransformationArtifact,
+                        model_trainer_artifact:artifact_entity.ModelTrainerArtifact):
+    from sensor.components.model_evaluation import ModelEvaluation
+    #model evaluation depends on the model registry so it is never cached
+    model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config = training_pipeline_config)
+    model_eval = ModelEvaluation(model_eval_config = model_eval_config,
+        data_ingestion_artifact = data_ingestion_artifact,
+        data_transformation_artifact = data_transformation_artifact,
+        model_trainer_artifact = model_trainer_artifact)
+    return model_eval.initiate_model_evaluation()
+
+def start_model_pusher(training_pipeline_config:config_entity.TrainingPipelineConfig,stage_cache:Optional[StageCache],
+                        data_transformation_artifact:artifact_entity.DataTransformationArtifact,
+                        model_trainer_artifact:artifact_entity.ModelTrainerArtifact,
+                        model_evaluation_artifact:artifact_entity.ModelEvaluationArtifact):
+    from sensor.components.model_pusher import ModelPusher
+    #publishing changes the model registry so it is never cached
+    if not model_evaluation_artifact.is_model_accepted:
+        logging.info(f"trained model is not accepted, model registry is not changed")
+        return None
+    model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config = training_pipeline_config)
+    model_pusher = ModelPusher(model_pusher_config = model_pusher_config,
+        data_transformation_artifact = data_transformation_artifact,
+        model_trainer_artifact = model_trainer_artifact)
+    return model_pusher.initiate_model_pusher()
+
+def execute_stage(stage_name:str,func:Callable,kwargs:dict,profile_dir:Optional[str] = None)->dict:
+    """
+    run a stage function through instrumentation, metrics of its sub steps are returned
+    with the artifact so stages running in worker processes report them as well
+    """
+    artifact,metrics = instrumentation.run_stage(stage_name,func,profile_dir = profile_dir,**kwargs)
+    return {"artifact":artifact,
+        "wall_time_seconds":round(metrics["wall_time_seconds"],3),
+        "peak_rss_mb":metrics["peak_rss_mb"],
+        "pid":metrics["pid"],
+        "metrics":metrics}
+
+@dataclass
+class Stage:
+    name:str
+    func:Callable
+    #names of the stages whose artifacts are passed to func, keyed by "<stage name>_artifact"
+    depends_on:list = field(default_factory = list)
+
+class TrainingPipeline:
+    """
+    Runs the training stages as a dependency graph.
+    A stage is submitted as soon as all stages it depends on are finished, so
+    independent stages (data validation and data transformation) run concurrently.
+    Wall time and peak rss of every stage are written to pipeline_report.yaml
+    and metrics of every stage and sub step to metrics.yaml inside the run's artifact dir.
+    Peak rss is per stage (peak_rss_mb) only with the "process" executor, every stage gets a fresh process.
+    With the "thread" executor it is the peak of the whole process so far (process_peak_rss_mb),
+    it includes stages running concurrently and every stage before.
+    """
+
+    def __init__(self,training_pipeline_config:config_entity.TrainingPipelineConfig):
+        try:
+            self.training_pipeline_config = training_pipeline_config
+            self.stage_cache = StageCache(cache_dir = training_pipeline_config.cache_dir) if training_pipeline_config.use_cache else None
+            self.stage_report = dict()
+            self.stage_metrics = dict()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_stages(self)->list:
+        try:
+            return [
+                Stage(name = "data_ingestion",func = start_data_ingestion),
+                Stage(name = "data_validation",func = start_data_validation,depends_on = ["data_ingestion"]),
+                Stage(name = "data_transformation",func = start_data_transformation,depends_on = ["data_ingestion"]),
+                Stage(name = "model_trainer",func = start_model_trainer,depends_on = ["data_transformation"]),
+                Stage(name = "model_evaluation",func = start_model_evaluation,
+                    depends_on = ["data_ingestion","data_transformation","model_trainer"]),
+                Stage(name = "model_pusher",func = start_model_pusher,
+                    depends_on = ["data_transformation","model_trainer","model_evaluation"])]
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_executor(self):
+        try:
+            max_workers = self.training_pipeline_config.max_workers
+            if self.training_pipeline_config.executor_type == "process":
+                #a fresh process per stage so peak rss belongs to that stage only
+                #records of stages are sent back and written to the log file of this process
+                mp_context = multiprocessing.get_context("spawn")
+                return ProcessPoolExecutor(max_workers = max_workers,max_tasks_per_child = 1,mp_context = mp_context,
+                    initializer = logger.init_worker_logging,initargs = (logger.get_worker_log_queue(mp_context = mp_context),))
+            return ThreadPoolExecutor(max_workers = max_workers)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def run(self)->dict:
+        """
+        run every stage in dependency order
+        ================================
+        return dictionary of stage name and its artifact
+        """
+        try:
+            stages = {stage.name:stage for stage in self.get_stages()}
+            artifacts = dict()
+            running = dict()
+
+            with self.get_executor() as executor:
+                while len(artifacts) < len(stages):
+                    #submit every stage whose dependencies are finished
+                    for stage in stages.values():
+                        if stage.name in artifacts or stage.name in running.values():
+                            continue
+                        if all(dependency in artifacts for dependency in stage.depends_on):
+                            kwargs = {f"{dependency}_artifact":artifacts[dependency] for dependency in stage.depends_on}
+                            kwargs.update(training_pipeline_config = self.training_pipeline_config,stage_cache = self.stage_cache)
+                            logging.info(f"submitting stage: [{stage.name}]")
+                            running[executor.submit(execute_stage,stage.name,stage.func,kwargs,
+                                os.path.join(self.training_pipeline_config.artifact_dir,"profiles"))] = stage.name
+
+                    if len(running) == 0:
+                        raise Exception(f"Stages can not be scheduled, check dependencies: {list(set(stages) - set(artifacts))}")
+
+                    done, _ = wait(running,return_when = FIRST_COMPLETED)
+                    for future in done:
+                        stage_name = running.pop(future)
+                        result = future.result()
+                        if self.training_pipeline_config.executor_type != "process":
+                            #stages share one process, its peak rss does not belong to this stage alone
+                            result["process_peak_rss_mb"] = result.pop("peak_rss_mb")
+                        artifacts[stage_name] = result.pop("artifact")
+                        self.stage_metrics[stage_name] = result.pop("metrics")
+                        self.stage_report[stage_name] = result
+                        logging.info(f"finished stage: [{stage_name}] {result}")
+
+            utils.write_yaml_file(file_path = os.path.join(self.training_pipeline_config.artifact_dir,PIPELINE_REPORT_FILE_NAME),
+                data = self.stage_report)
+            utils.write_yaml_file(file_path = os.path.join(self.training_pipeline_config.artifact_dir,instrumentation.METRICS_FILE_NAME),
+                data = {"stages":self.stage_metrics})
+            return artifacts
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -1,33 +1,233 @@
-import os
-from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME
-from glob import glob
+import os, sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
+from sensor.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME, REGISTRY_MANIFEST_FILE_NAME, COMPACT_TRANSFORMER_FILE_NAME
+from sensor.config import TARGET_COLUMN
+from sensor.exception import SensorException
+from sensor import logger
+from sensor.logger import logging
+from sensor import utils
+from sensor.compact_transformer import CompactTransformer
+
+PREDICTION_COLUMN = "prediction"
+
+def load_transformer(file_path:str):
+    """
+    return compact transformer or sklearn pipeline saved at file_path
+    """
+    try:
+        if os.path.basename(file_path) == COMPACT_TRANSFORMER_FILE_NAME:
+            return CompactTransformer.load(file_path = file_path)
+        return utils.load_object(file_path = file_path)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def normalize_chunk(df:pd.DataFrame,float_dtype:str = "float64")->pd.DataFrame:
+    """
+    replace na with NaN and cast sensor columns to float_dtype as data ingestion does,
+    so every chunk of a file has the same column dtypes whatever values it holds
+    """
+    try:
+        df = df.replace({"na":np.nan})
+        #per column cast leaves one block per column, copy consolidates them before the prediction column is added
+        return utils.convert_column_float(df = df,exclude_columns = [TARGET_COLUMN],dtype = float_dtype).copy()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def transform_features(transformer,df:pd.DataFrame)->np.ndarray:
+    """
+    return input features of df transformed by a compact transformer or a sklearn pipeline
+    df: dataframe with at least every column the transformer was fitted on, or a float array
+    of these columns in fitted order
+    """
+    try:
+        if isinstance(df,np.ndarray):
+            if isinstance(transformer,CompactTransformer):
+                return transformer.transform(df)
+            #sklearn pipeline was fitted on a dataframe and checks its column names
+            df = pd.DataFrame(df,columns = transformer.feature_names_in_)
+        #select features in fitted order and cast them in a single bulk operation
+        input_df = df[list(transformer.feature_names_in_)].replace({"na":np.nan})
+        if isinstance(transformer,CompactTransformer):
+            #compact transformer casts to float32 once and transforms that copy in place
+            return transformer.transform(input_df)
+        return transformer.transform(input_df.astype(np.float64))
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+class ModelCache:
+    """
+    Process wide LRU cache of loaded (transformer, target encoder, model) bundles.
+    Bundles are keyed by registry and version dir, so a published version is loaded once
+    and least recently used versions are evicted when max_size is reached.
+    """
+
+    def __init__(self,max_size:int = 2):
+        try:
+            self.max_size = max_size
+            self.bundles = OrderedDict()
+            self.lock = threading.Lock()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get(self,key:tuple)->Optional[tuple]:
+        with self.lock:
+            bundle = self.bundles.get(key)
+            if bundle is not None:
+                self.bundles.move_to_end(key)
+            return bundle
+
+    def put(self,key:tuple,bundle:tuple)->None:
+        with self.lock:
+            self.bundles[key] = bundle
+            self.bundles.move_to_end(key)
+            while len(self.bundles) > self.max_size:
+                evicted_key,_ = self.bundles.popitem(last = False)
+                logging.info(f"evicted model bundle from cache: {evicted_key}")
+
+    def clear(self)->None:
+        with self.lock:
+            self.bundles.clear()
+
+model_cache = ModelCache()
 
 class ModelResolver:
 
     def __init__(self,model_registry:str = "saved_models",
                 transformer_dir_name = "transformer",
                 target_encoder_dir_name = "target_encoder",
-                model_dir_name = "model"):
+                model_dir_name = "model",
+                poll_interval_seconds:float = 1.0):
         try:
             self.model_registry = model_registry
             os.makedirs(self.model_registry,exist_ok = True)
             self.transformer_dir_name = transformer_dir_name
             self.target_encoder_dir_name = target_encoder_dir_name
             self.model_dir_name = model_dir_name
+            self.manifest_file_path = os.path.join(self.model_registry,REGISTRY_MANIFEST_FILE_NAME)
+            #registry is checked for a new version at most once per poll interval
+            self.poll_interval_seconds = poll_interval_seconds
+            self.last_poll_time = None
+            self.registry_mtime_ns = None
+            self.polled_latest_dir_path = None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_polled_latest_dir_path(self)-> Optional[str]:
+        """
+        return latest version dir for readers, the manifest is only read again
+        when poll interval passed and its modification time changed
+        """
+        try:
+            now = time.monotonic()
+            if self.last_poll_time is not None and now - self.last_poll_time < self.poll_interval_seconds:
+                return self.polled_latest_dir_path
+            self.last_poll_time = now
+
+            #publishing replaces the manifest, legacy registries without manifest change the dir itself
+            watched_path = self.manifest_file_path if os.path.exists(self.manifest_file_path) else self.model_registry
+            registry_mtime_ns = os.stat(watched_path).st_mtime_ns
+            if registry_mtime_ns != self.registry_mtime_ns:
+                self.polled_latest_dir_path = self.get_latest_dir_path()
+                self.registry_mtime_ns = registry_mtime_ns
+            return self.polled_latest_dir_path
 
         except Exception as e:
             raise SensorException(e, sys)
-    
+
+    def load_latest_bundle(self)->tuple:
+        """
+        return (transformer, target encoder, model) of latest version
+        bundle is loaded from disk only once per version and served from model_cache afterwards
+        """
+        try:
+            latest_dir = self.get_polled_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"model is not available")
+            return self.load_bundle(version_dir = latest_dir)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def load_bundle(self,version_dir:str)->tuple:
+        """
+        return (transformer, target encoder, model) of the version in version_dir, served from model_cache once loaded
+        """
+        try:
+            key = (os.path.abspath(self.model_registry),os.path.basename(version_dir))
+            bundle = model_cache.get(key)
+            if bundle is None:
+                #target encoder and model are read on first use, a process only asking for feature names never loads them
+                logging.info(f"loading transformer, target encoder and model of version: {version_dir}")
+                bundle = (self.load_transformer(version_dir = version_dir),
+                    utils.load_object(file_path = os.path.join(version_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME),lazy = True),
+                    utils.load_object(file_path = os.path.join(version_dir,self.model_dir_name,MODEL_FILE_NAME),lazy = True))
+                model_cache.put(key,bundle)
+            return bundle
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_transformer_path(self,version_dir:str)->str:
+        """
+        return compact transformer path of a version, versions published before it existed use the sklearn pipeline
+        """
+        compact_transformer_path = os.path.join(version_dir,self.transformer_dir_name,COMPACT_TRANSFORMER_FILE_NAME)
+        if os.path.exists(compact_transformer_path):
+            return compact_transformer_path
+        return os.path.join(version_dir,self.transformer_dir_name,TRANSFORMER_OBJECT_FILE_NAME)
+
+    def load_transformer(self,version_dir:str):
+        try:
+            return load_transformer(file_path = self.get_transformer_path(version_dir = version_dir))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def read_manifest(self)->dict:
+        """
+        return registry manifest: latest version and record of every published version
+        """
+        try:
+            if os.path.exists(self.manifest_file_path):
+                return utils.read_yaml_file(self.manifest_file_path)
+
+            #registries created before the manifest: only numbered version dirs are part of the registry
+            versions = sorted(int(dir_name) for dir_name in os.listdir(self.model_registry) if dir_name.isdigit())
+            return {"latest":versions[-1] if len(versions) > 0 else None,
+                "versions":{version:{"dir_name":f"{version}"} for version in versions}}
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_version_dir_path(self,version:int)->str:
+        try:
+            version_record = self.read_manifest()["versions"].get(int(version))
+            if version_record is None:
+                raise Exception(f"version: {version} is not available in model registry")
+            return os.path.join(self.model_registry,version_record["dir_name"])
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
     def get_latest_dir_path(self)-> Optional[str]:
         try:
-            dir_names = os.listdir(self.model_registry)
-            if len(dir_names) == 0:
+            #manifest gives latest version without listing the registry
+            manifest = self.read_manifest()
+            if manifest["latest"] is None:
                 return None
-            dir_names = list(map(int,dir_names))
-            latest_dir_name = max(dir_names)
-
-            return os.path.join(self.model_registry,f"{latest_dir_name}")
+            return os.path.join(self.model_registry,manifest["versions"][manifest["latest"]]["dir_name"])
 
         except Exception as e:
             raise SensorException(e, sys)
@@ -50,8 +250,8 @@ class ModelResolver:
             latest_dir = self.get_latest_dir_path()
             if latest_dir is None:
                 raise Exception(f"transformer is not available")
-                
-            return os.path.join(latest_dir,self.model_dir_name,TRANSFORMER_OBJECT_FILE_NAME)
+
+            return os.path.join(latest_dir,self.transformer_dir_name,TRANSFORMER_OBJECT_FILE_NAME)
         except Exception as e:
             raise SensorException(e, sys)
 
@@ -60,20 +260,19 @@ class ModelResolver:
             latest_dir = self.get_latest_dir_path()
             if latest_dir is None:
                 raise Exception(f"target encoder is not available")
-                
-            return os.path.join(latest_dir,self.model_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
+
+            return os.path.join(latest_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
         except Exception as e:
             raise SensorException(e, sys)
-    
+
     def get_latest_save_dir_path(self):
         try:
             latest_dir = self.get_latest_dir_path()
-            if list_dir == None:
-                os.path.join(self.model_registry,f"{0}")
-            latest_dir_num = int(os.path.basename(self.get_latest_save_dir_path()))
-
+            if latest_dir == None:
+                return os.path.join(self.model_registry,f"{0}")
+            latest_dir_num = int(os.path.basename(latest_dir))
 
-            return os.path.join(self.model_registry,f"{latest_dir_name+1}")
+            return os.path.join(self.model_registry,f"{latest_dir_num+1}")
 
         except Exception as e:
             raise SensorException(e, sys)
@@ -81,44 +280,150 @@ class ModelResolver:
     def get_latest_save_model_path(self):
         try:
             latest_dir = self.get_latest_save_dir_path()
-            glob(pathname=os.path.join(latest_dir,self.model_dir_name,MODEL_FILE_NAME))
+            return os.path.join(latest_dir,self.model_dir_name,MODEL_FILE_NAME)
 
         except Exception as e:
             raise SensorException(e, sys)
 
-    def get_latest_transformer_path(self):
+    def get_latest_save_transformer_path(self):
         try:
             latest_dir = self.get_latest_save_dir_path()
-            glob(pathname=os.path.join(latest_dir,self.transformer_dir_name,TRANSFORMER_OBJECT_FILE_NAME))
+            return os.path.join(latest_dir,self.transformer_dir_name,TRANSFORMER_OBJECT_FILE_NAME)
 
         except Exception as e:
             raise SensorException(e, sys)
 
-    def get_latest_target_encoder_path(self):
+    def get_latest_save_target_encoder_path(self):
         try:
             latest_dir = self.get_latest_save_dir_path()
-            glob(pathname=os.path.join(latest_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME))
+            return os.path.join(latest_dir,self.target_encoder_dir_name,TARGET_ENCODER_OBJECT_FILE_NAME)
 
         except Exception as e:
             raise SensorException(e, sys)
 
+#objects loaded once by every worker process of batch prediction
+worker_predictor = None
+
+def init_prediction_worker(model_registry:str,version_dir:str,log_queue = None):
+    global worker_predictor
+    if log_queue is not None:
+        logger.init_worker_logging(log_queue)
+    worker_predictor = Predictor(model_resolver = ModelResolver(model_registry = model_registry))
+    #every worker loads the version pinned by the parent, a version published meanwhile is not picked up
+    worker_predictor.transformer,worker_predictor.target_encoder,worker_predictor.model = \
+        worker_predictor.model_resolver.load_bundle(version_dir = version_dir)
+
+def predict_chunk(features:np.ndarray)->np.ndarray:
+    #every chunk of a batch prediction is predicted with the version pinned for the whole file
+    #only the float feature block is sent to the worker and only the labels are sent back
+    return worker_predictor.predict_dataframe(features,bundle = (worker_predictor.transformer,
+        worker_predictor.target_encoder,worker_predictor.model))
+
 class Predictor:
-    
+
     def __init__(self,model_resolver:ModelResolver):
         try:
             self.model_resolver = model_resolver
+            self.transformer = None
+            self.target_encoder = None
+            self.model = None
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def load_objects(self)->None:
+        """
+        refresh transformer, target encoder and model to the latest version
+        objects come from the in process model cache so disk is only read when a new version is published
+        """
+        try:
+            self.transformer,self.target_encoder,self.model = self.model_resolver.load_latest_bundle()
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def get_feature_names(self)->list:
+        """
+        return input columns the transformer was fitted on
+        """
+        try:
+            self.load_objects()
+            return list(self.transformer.feature_names_in_)
+
         except Exception as e:
             raise SensorException(e, sys)
 
+    def predict_dataframe(self,df:pd.DataFrame,bundle:Optional[tuple] = None)->np.ndarray:
+        """
+        transform input features and predict target labels
+        df: dataframe with at least every column the transformer was fitted on, or a float array of these columns
+        bundle: optional (transformer, target encoder, model) to use instead of latest version
+        ================================
+        return array of decoded target labels
+        """
+        try:
+            #local references keep one consistent version even if a new one is published meanwhile
+            transformer,target_encoder,model = bundle or self.model_resolver.load_latest_bundle()
+            prediction = model.predict(transform_features(transformer,df))
+            return target_encoder.inverse_transform(prediction.astype(int))
+
+        except Exception as e:
+            raise SensorException(e, sys)
 
-    
-    def predict(self):
+    def predict(self,input_file_path:str,output_file_path:str,chunk_size:int = 50000,n_jobs:int = 1,
+                float_dtype:str = "float64")->dict:
+        """
+        Batch prediction of a csv or parquet file of any size
+        input file is streamed in chunks of chunk_size rows, chunks are predicted in n_jobs
+        worker processes and written to output file in input order as soon as they are ready
+        input_file_path: location of input file
+        output_file_path: location of output file, input columns with a prediction column
+        chunk_size: number of rows predicted at a time
+        n_jobs: number of worker processes, 1 predicts in current process
+        float_dtype: dtype sensor columns are parsed in and written to output file
+        ================================
+        return dictionary with output file path, number of rows and throughput
+        """
         try:
-            dir_names = os.listdir(self.model_registry)
-            dir_names = list(map(int,dir_names))
-            latest_dir_name = max(dir_names)
+            logging.info(f"batch prediction of file: {input_file_path}")
+            start_time = time.perf_counter()
+            df_chunks = (normalize_chunk(df,float_dtype = float_dtype)
+                for df in utils.iter_dataframe_chunks(file_path = input_file_path,chunk_size = chunk_size,na_values = ["na"]))
+
+            #whole file is predicted with the version that was latest when prediction started
+            version_dir = self.model_resolver.get_latest_dir_path()
+            if version_dir is None:
+                raise Exception(f"model is not available")
+            logging.info(f"batch prediction pinned to version: {version_dir}")
 
-            return os.path.join(self.model_registry,f"{latest_dir_name}")
+            with utils.DataFrameWriter(file_path = output_file_path) as writer:
+                if n_jobs == 1:
+                    bundle = self.model_resolver.load_bundle(version_dir = version_dir)
+                    for df in df_chunks:
+                        df[PREDICTION_COLUMN] = self.predict_dataframe(df,bundle = bundle)
+                        writer.write(df)
+                else:
+                    feature_names = list(self.model_resolver.load_bundle(version_dir = version_dir)[0].feature_names_in_)
+                    with ProcessPoolExecutor(max_workers = n_jobs,initializer = init_prediction_worker,
+                                            initargs = (self.model_resolver.model_registry,version_dir,logger.get_worker_log_queue())) as executor:
+                        #only a bounded number of chunks is in flight so memory does not grow with file size
+                        pending = deque()
+                        for df in df_chunks:
+                            features = df[feature_names].to_numpy(dtype = float_dtype)
+                            pending.append((df,executor.submit(predict_chunk,features)))
+                            if len(pending) >= 2 * n_jobs:
+                                df,future = pending.popleft()
+                                df[PREDICTION_COLUMN] = future.result()
+                                writer.write(df)
+                        while len(pending) > 0:
+                            df,future = pending.popleft()
+                            df[PREDICTION_COLUMN] = future.result()
+                            writer.write(df)
+
+            seconds = time.perf_counter() - start_time
+            prediction_report = {"output_file_path":output_file_path,"version_dir":version_dir,"rows":writer.rows,
+                "seconds":round(seconds,3),"rows_per_second":round(writer.rows / seconds,1) if seconds > 0 else None}
+            logging.info(f"batch prediction finished: {prediction_report}")
+            return prediction_report
 
         except Exception as e:
-            raise SensorException(e, sys)
\ No newline at end of file
+            raise SensorException(e, sys)
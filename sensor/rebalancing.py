@@ -0,0 +1,167 @@
+import sys
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import csr_matrix
+from sklearn.base import BaseEstimator, clone
+from sklearn.neighbors import KDTree, NearestNeighbors
+from imblearn.over_sampling import SMOTE
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+REBALANCING_STRATEGIES = ["smotetomek","smote","class_weight","none"]
+
+class ApproximateNeighbors(BaseEstimator):
+    """
+    Approximate nearest neighbours: rows are projected on n_components random gaussian
+    directions and neighbours are searched exactly in that low dimensional space with a kd tree.
+    Query rows are split between n_jobs threads.
+    It has the kneighbors interface imblearn expects from a neighbours object.
+    """
+
+    def __init__(self,n_neighbors:int = 5,n_components:int = 8,n_jobs:int = 1,random_state:int = 42):
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self,X,y = None)->"ApproximateNeighbors":
+        try:
+            rng = np.random.default_rng(self.random_state)
+            n_components = min(self.n_components,X.shape[1])
+            self.projection_ = (rng.normal(size = (X.shape[1],n_components)) / np.sqrt(n_components)).astype(np.float32)
+            self.tree_ = KDTree(np.asarray(X,dtype = np.float32) @ self.projection_)
+            return self
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def kneighbors(self,X = None,n_neighbors:int = None,return_distance:bool = True):
+        try:
+            n_neighbors = n_neighbors or self.n_neighbors
+            #like sklearn, a query on the fitted rows does not return a row as its own neighbour
+            is_fitted_data = X is None
+            if is_fitted_data:
+                projected = np.asarray(self.tree_.data)
+                n_neighbors += 1
+            else:
+                projected = np.asarray(X,dtype = np.float32) @ self.projection_
+
+            n_jobs = max(1,self.n_jobs)
+            row_chunks = np.array_split(np.arange(len(projected)),n_jobs)
+            with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+                results = list(executor.map(lambda rows: self.tree_.query(projected[rows],k = n_neighbors),row_chunks))
+            distances = np.concatenate([distance for distance,_ in results])
+            indices = np.concatenate([index for _,index in results])
+
+            if is_fitted_data:
+                distances,indices = distances[:,1:],indices[:,1:]
+            return (distances,indices) if return_distance else indices
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def kneighbors_graph(self,X = None,n_neighbors:int = None,mode:str = "connectivity")->csr_matrix:
+        """
+        return sparse graph of the neighbours of every query row, like sklearn's kneighbors_graph
+        mode: "connectivity" gives ones, "distance" gives distances in the projected space
+        """
+        try:
+            n_neighbors = n_neighbors or self.n_neighbors
+            if mode == "connectivity":
+                indices = self.kneighbors(X,n_neighbors = n_neighbors,return_distance = False)
+                data = np.ones(indices.size)
+            elif mode == "distance":
+                distances,indices = self.kneighbors(X,n_neighbors = n_neighbors,return_distance = True)
+                data = distances.ravel()
+            else:
+                raise ValueError(f"Unsupported mode: {mode}, expected connectivity or distance")
+
+            n_queries = indices.shape[0]
+            indptr = np.arange(0,n_queries * n_neighbors + 1,n_neighbors)
+            return csr_matrix((data,indices.ravel(),indptr),shape = (n_queries,self.tree_.data.shape[0]))
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+def get_neighbors(n_neighbors:int,n_jobs:int,approximate:bool,random_state:int):
+    """
+    return exact or approximate neighbours object searching in n_jobs workers
+    """
+    if approximate:
+        return ApproximateNeighbors(n_neighbors = n_neighbors,n_jobs = n_jobs,random_state = random_state)
+    return NearestNeighbors(n_neighbors = n_neighbors,n_jobs = n_jobs)
+
+def remove_tomek_links(X:np.ndarray,y:np.ndarray,neighbors)->tuple:
+    """
+    remove both rows of every tomek link: two rows of different class that are each other's nearest neighbour
+    ================================
+    return input features and target without linked rows
+    """
+    try:
+        nn = clone(neighbors).set_params(n_neighbors = 2).fit(X)
+        nearest = nn.kneighbors(X,return_distance = False)[:,1]
+        is_link = (y != y[nearest]) & (nearest[nearest] == np.arange(len(y)))
+        return X[~is_link],y[~is_link]
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+class Rebalancer:
+    """
+    Class rebalancing of the transformed train array
+    smotetomek: SMOTE oversampling of minority class then tomek link cleaning
+    smote: SMOTE oversampling only, no neighbour search over all rows
+    class_weight: rows are kept as they are, scale_pos_weight for xgboost is returned instead
+    none: rows are kept as they are
+    Neighbour searches run in n_jobs workers and can be approximate.
+    """
+
+    def __init__(self,strategy:str = "smotetomek",n_jobs:int = 1,approximate:bool = False,random_state:int = 42):
+        try:
+            if strategy not in REBALANCING_STRATEGIES:
+                raise Exception(f"Unknown rebalancing strategy: {strategy}, expected one of {REBALANCING_STRATEGIES}")
+            self.strategy = strategy
+            self.n_jobs = n_jobs
+            self.approximate = approximate
+            self.random_state = random_state
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def fit_resample(self,X:np.ndarray,y:np.ndarray)->tuple:
+        """
+        X: input features
+        y: encoded target, 1 is the minority class
+        ================================
+        return resampled input features, resampled target and report with timing and class counts
+        """
+        try:
+            start_time = time.perf_counter()
+            class_counts_before = {int(label):int(count) for label,count in zip(*np.unique(y,return_counts = True))}
+            scale_pos_weight = None
+
+            if self.strategy in ("smote","smotetomek"):
+                smote = SMOTE(sampling_strategy = "minority",random_state = self.random_state,
+                    k_neighbors = get_neighbors(n_neighbors = 6,n_jobs = self.n_jobs,
+                        approximate = self.approximate,random_state = self.random_state))
+                X,y = smote.fit_resample(X,y)
+                if self.strategy == "smotetomek":
+                    X,y = remove_tomek_links(X,y,neighbors = get_neighbors(n_neighbors = 2,n_jobs = self.n_jobs,
+                        approximate = self.approximate,random_state = self.random_state))
+            elif self.strategy == "class_weight":
+                #weight of positive rows so both classes have the same total weight
+                scale_pos_weight = class_counts_before.get(0,0) / max(class_counts_before.get(1,0),1)
+
+            rebalancing_report = {"strategy":self.strategy,
+                "approximate":self.approximate,
+                "n_jobs":self.n_jobs,
+                "seconds":round(time.perf_counter() - start_time,3),
+                "class_counts_before":class_counts_before,
+                "class_counts_after":{int(label):int(count) for label,count in zip(*np.unique(y,return_counts = True))},
+                "scale_pos_weight":scale_pos_weight}
+            logging.info(f"rebalancing report: {rebalancing_report}")
+            return X,y,rebalancing_report
+
+        except Exception as e:
+            raise SensorException(e, sys)
@@ -0,0 +1,256 @@
+import os, sys
+import io
+import json
+import struct
+import uuid
+import importlib
+import threading
+import numpy as np
+from sensor.exception import SensorException
+
+#object file layout: MAGIC, uint32 header length, json header, then the raw sections listed in the header
+MAGIC = b"SENSOROBJ\x00"
+FORMAT_VERSION = 1
+HEADER_LENGTH_STRUCT = struct.Struct("<I")
+
+#classes written as json parameters and npy arrays, looked up by name when loading
+SKLEARN_CLASSES = {"Pipeline":"sklearn.pipeline",
+    "SimpleImputer":"sklearn.impute",
+    "RobustScaler":"sklearn.preprocessing",
+    "LabelEncoder":"sklearn.preprocessing"}
+#classes written as xgboost ubjson model
+XGBOOST_CLASSES = ["XGBClassifier"]
+
+class UnsupportedObjectError(Exception):
+    """
+    raised when an object has no serializer of this module, callers fall back to pickling it
+    """
+
+class ObjectWriter:
+    """
+    Collects raw sections of an object file while its header is built
+    """
+
+    def __init__(self):
+        self.sections = dict()
+        self.size = 0
+
+    def add_section(self,name:str,data:bytes)->str:
+        self.sections[name] = (self.size,len(data),data)
+        self.size += len(data)
+        return name
+
+    def add_array(self,name:str,array:np.ndarray)->str:
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer,np.ascontiguousarray(array),allow_pickle = False)
+        return self.add_section(name = name,data = buffer.getvalue())
+
+def encode_value(value,writer:ObjectWriter,name:str):
+    """
+    return json compatible value, arrays are added to writer as npy sections
+    """
+    if value is None or isinstance(value,(bool,int,float,str)):
+        return value
+    if isinstance(value,(np.bool_,np.integer,np.floating)):
+        return value.item()
+    if isinstance(value,np.dtype):
+        return {"__dtype__":value.str}
+    if isinstance(value,np.ndarray):
+        #object arrays of feature names or class labels are kept in the header as a list of strings
+        if value.dtype == object:
+            if value.ndim != 1 or not all(isinstance(item,str) for item in value):
+                raise UnsupportedObjectError(f"object array: {name} holds values that are not strings")
+            return {"__strings__":value.tolist()}
+        return {"__array__":writer.add_array(name = name,array = value)}
+    if isinstance(value,(list,tuple)):
+        items = [encode_value(item,writer = writer,name = f"{name}.{index}") for index,item in enumerate(value)]
+        return {"__tuple__":items} if isinstance(value,tuple) else items
+    raise UnsupportedObjectError(f"value: {name} of type: {type(value)} can not be serialized")
+
+def decode_value(value,read_array):
+    if isinstance(value,list):
+        return [decode_value(item,read_array = read_array) for item in value]
+    if isinstance(value,dict):
+        if "__dtype__" in value:
+            return np.dtype(value["__dtype__"])
+        if "__tuple__" in value:
+            return tuple(decode_value(item,read_array = read_array) for item in value["__tuple__"])
+        if "__strings__" in value:
+            return np.array(value["__strings__"],dtype = object)
+        if "__array__" in value:
+            return read_array(value["__array__"])
+    return value
+
+def encode_estimator(estimator,writer:ObjectWriter,name:str)->dict:
+    """
+    return json description of a fitted sklearn estimator: class, parameters and fitted attributes
+    pipelines are described step by step
+    """
+    class_name = type(estimator).__name__
+    if SKLEARN_CLASSES.get(class_name) is None or not type(estimator).__module__.startswith(SKLEARN_CLASSES[class_name]):
+        raise UnsupportedObjectError(f"estimator class: {type(estimator)} can not be serialized")
+
+    params = estimator.get_params(deep = False)
+    description = {"class":class_name}
+    if class_name == "Pipeline":
+        description["steps"] = [[step_name,encode_estimator(step,writer = writer,name = f"{name}.{step_name}")]
+            for step_name,step in params.pop("steps")]
+    description["params"] = {param:encode_value(value,writer = writer,name = f"{name}.{param}") for param,value in params.items()}
+    #fitted attributes end with an underscore, private ones like _fit_dtype are set by fit as well
+    description["attributes"] = {attribute:encode_value(value,writer = writer,name = f"{name}.{attribute}")
+        for attribute,value in vars(estimator).items() if attribute not in params and attribute != "steps"}
+    return description
+
+def decode_estimator(description:dict,read_array):
+    class_name = description["class"]
+    if class_name not in SKLEARN_CLASSES:
+        raise Exception(f"estimator class: {class_name} is not a known sklearn class")
+    cls = getattr(importlib.import_module(SKLEARN_CLASSES[class_name]),class_name)
+
+    params = {param:decode_value(value,read_array = read_array) for param,value in description["params"].items()}
+    if class_name == "Pipeline":
+        params["steps"] = [(step_name,decode_estimator(step,read_array = read_array)) for step_name,step in description["steps"]]
+    estimator = cls(**params)
+    for attribute,value in description["attributes"].items():
+        setattr(estimator,attribute,decode_value(value,read_array = read_array))
+    return estimator
+
+def encode_xgboost_model(model,writer:ObjectWriter,file_path:str)->dict:
+    """
+    return description of xgboost sklearn model, the booster and its sklearn attributes are saved as ubjson
+    """
+    #save_model writes sklearn attributes of the model along with the booster, it only writes to files
+    tmp_file_path = f"{file_path}.{uuid.uuid4().hex}.ubj"
+    try:
+        model.save_model(tmp_file_path)
+        with open(tmp_file_path,"rb") as file_obj:
+            writer.add_section(name = "booster",data = file_obj.read())
+    finally:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+    return {"class":type(model).__name__,"booster":"booster"}
+
+def decode_xgboost_model(description:dict,read_section):
+    import xgboost
+    model = getattr(xgboost,description["class"])()
+    model.load_model(bytearray(read_section(description["booster"])))
+    return model
+
+def dump(obj,file_path:str)->None:
+    """
+    write obj in object file format
+    xgboost models are written as ubjson, sklearn imputer, scaler, label encoder and their pipelines as npy arrays
+    ================================
+    raise UnsupportedObjectError when obj has no serializer, nothing is written then
+    """
+    try:
+        writer = ObjectWriter()
+        module_name = type(obj).__module__
+        if module_name.startswith("xgboost") and type(obj).__name__ in XGBOOST_CLASSES:
+            kind = "xgboost"
+            description = encode_xgboost_model(obj,writer = writer,file_path = file_path)
+        elif module_name.startswith("sklearn"):
+            kind = "sklearn"
+            description = encode_estimator(obj,writer = writer,name = "estimator")
+        else:
+            raise UnsupportedObjectError(f"object of type: {type(obj)} can not be serialized")
+
+        header = {"format_version":FORMAT_VERSION,
+            "kind":kind,
+            "description":description,
+            "sections":{name:[offset,length] for name,(offset,length,_) in writer.sections.items()}}
+        header_bytes = json.dumps(header).encode()
+
+        os.makedirs(os.path.dirname(file_path),exist_ok = True)
+        with open(file_path,"wb") as file_obj:
+            file_obj.write(MAGIC)
+            file_obj.write(HEADER_LENGTH_STRUCT.pack(len(header_bytes)))
+            file_obj.write(header_bytes)
+            for _,_,data in writer.sections.values():
+                file_obj.write(data)
+
+    except UnsupportedObjectError:
+        raise
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def is_object_file(file_path:str)->bool:
+    with open(file_path,"rb") as file_obj:
+        return file_obj.read(len(MAGIC)) == MAGIC
+
+def read_header(file_obj)->dict:
+    """
+    return header of an open object file, the file is left positioned at the first section
+    """
+    if file_obj.read(len(MAGIC)) != MAGIC:
+        raise Exception(f"file is not an object file")
+    header_length, = HEADER_LENGTH_STRUCT.unpack(file_obj.read(HEADER_LENGTH_STRUCT.size))
+    header = json.loads(file_obj.read(header_length))
+    if header["format_version"] > FORMAT_VERSION:
+        raise Exception(f"object file format version: {header['format_version']} is newer than supported: {FORMAT_VERSION}")
+    header["data_offset"] = len(MAGIC) + HEADER_LENGTH_STRUCT.size + header_length
+    return header
+
+def load(file_path:str):
+    """
+    read an object file written by dump, only the sections the object needs are read
+    """
+    try:
+        with open(file_path,"rb") as file_obj:
+            header = read_header(file_obj)
+
+            def read_section(name:str)->bytes:
+                offset,length = header["sections"][name]
+                file_obj.seek(header["data_offset"] + offset)
+                return file_obj.read(length)
+
+            def read_array(name:str)->np.ndarray:
+                return np.load(io.BytesIO(read_section(name)),allow_pickle = False)
+
+            if header["kind"] == "xgboost":
+                return decode_xgboost_model(header["description"],read_section = read_section)
+            if header["kind"] == "sklearn":
+                return decode_estimator(header["description"],read_array = read_array)
+            raise Exception(f"unknown object kind: {header['kind']}")
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+class LazyObject:
+    """
+    Stand in for an object saved with utils.save_object, the file is only read on first attribute access
+    so a process pays for loading only the objects it actually uses.
+    """
+
+    def __init__(self,file_path:str,loader):
+        self._file_path = file_path
+        self._loader = loader
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        return the loaded object, loading it once
+        """
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._loader(self._file_path)
+        return self._obj
+
+    @property
+    def is_loaded(self)->bool:
+        return self._obj is not None
+
+    def __getattr__(self,name:str):
+        #private and special attributes are never forwarded so copying or pickling the proxy can not recurse
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(),name)
+
+    def __reduce__(self):
+        #pickled as a reference to the file, the receiving process loads it on its own first use
+        return (LazyObject,(self._file_path,self._loader))
+
+    def __repr__(self)->str:
+        return f"LazyObject(file_path={self._file_path!r}, is_loaded={self.is_loaded})"
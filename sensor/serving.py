@@ -0,0 +1,131 @@
+import sys
+import time
+import asyncio
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Callable
+from sensor.exception import SensorException
+from sensor.logger import logging
+
+class LatencyMetrics:
+    """
+    Keeps latency of the most recent requests and size of the most recent batches
+    """
+
+    def __init__(self,window_size:int = 10000):
+        try:
+            self.latencies_ms = deque(maxlen = window_size)
+            self.batch_sizes = deque(maxlen = window_size)
+            self.total_requests = 0
+            self.total_batches = 0
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def record_batch(self,batch_size:int,latencies_ms:list)->None:
+        self.batch_sizes.append(batch_size)
+        self.latencies_ms.extend(latencies_ms)
+        self.total_batches += 1
+        self.total_requests += batch_size
+
+    def summary(self)->dict:
+        try:
+            if len(self.latencies_ms) == 0:
+                return {"total_requests":0,"total_batches":0}
+
+            latencies_ms = np.fromiter(self.latencies_ms,dtype = np.float64)
+            batch_sizes = np.fromiter(self.batch_sizes,dtype = np.int64)
+            return {
+                "total_requests":self.total_requests,
+                "total_batches":self.total_batches,
+                "latency_ms_p50":float(np.percentile(latencies_ms,50)),
+                "latency_ms_p99":float(np.percentile(latencies_ms,99)),
+                "latency_ms_max":float(latencies_ms.max()),
+                "batch_size_mean":float(batch_sizes.mean()),
+                "batch_size_p50":float(np.percentile(batch_sizes,50)),
+                "batch_size_max":int(batch_sizes.max())}
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single row requests into micro batches.
+    A batch is sent to predict_func when it holds max_batch_size rows or when
+    max_wait_ms passed since its first row arrived, whichever comes first.
+    predict_func receives a dataframe and returns one prediction per row, it is
+    run in a worker thread so the event loop keeps accepting requests.
+    """
+
+    def __init__(self,predict_func:Callable,max_batch_size:int = 64,max_wait_ms:float = 5.0):
+        try:
+            self.predict_func = predict_func
+            self.max_batch_size = max_batch_size
+            self.max_wait_seconds = max_wait_ms / 1000
+            self.metrics = LatencyMetrics()
+            self.queue = None
+            self.worker_task = None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    async def start(self)->None:
+        self.queue = asyncio.Queue()
+        self.worker_task = asyncio.create_task(self.run())
+
+    async def stop(self)->None:
+        if self.worker_task is not None:
+            self.worker_task.cancel()
+            try:
+                await self.worker_task
+            except asyncio.CancelledError:
+                pass
+            self.worker_task = None
+
+    async def submit(self,row:dict):
+        """
+        queue a single row and wait for its prediction
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((row,future,time.perf_counter()))
+        return await future
+
+    async def collect_batch(self)->list:
+        #wait for the first row, then fill the batch until it is full or the deadline passes
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(),timeout = timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self)->None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect_batch()
+            rows = [row for row,_,_ in batch]
+            try:
+                predictions = await loop.run_in_executor(None,self.predict_func,pd.DataFrame.from_records(rows))
+            except Exception as e:
+                logging.info(f"prediction of batch of {len(batch)} rows failed: {e}")
+                for _,future,_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            end_time = time.perf_counter()
+            for (_,future,start_time),prediction in zip(batch,predictions):
+                if not future.done():
+                    future.set_result(prediction)
+            self.metrics.record_batch(batch_size = len(batch),
+                latencies_ms = [(end_time - start_time) * 1000 for _,_,start_time in batch])
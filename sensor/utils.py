@@ -1,11 +1,17 @@
 import yaml
-import dill
 import numpy as np
 import pandas as pd
 import os, sys
-from sensor.config import mongo_client
+import hashlib
+import uuid
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+from sensor.config import get_mongo_client
 from sensor.logger import logging
 from sensor.exception import SensorException
+from sensor import serialization
 
 def get_collection_as_datarame(database_name:str,collection_name:str)->pd.DataFrame:
     """
@@ -18,9 +24,9 @@ def get_collection_as_datarame(database_name:str,collection_name:str)->pd.DataFr
     
     try:
         logging.info(f"Reading data from database: [{database_name}] and collection: [{collection_name}]")
-        coll_data = list(mongo_client[database_name][collection_name].find())
+        coll_data = list(get_mongo_client()[database_name][collection_name].find())
         df = pd.DataFrame(coll_data)
-        logging.info(f"Found Columns: {df.columns}")
+        logging.info("Found Columns: %s",df.columns)
 
         if "_id" in df.columns:
             logging.info(f"Dropping column: _id")
@@ -30,6 +36,356 @@ def get_collection_as_datarame(database_name:str,collection_name:str)->pd.DataFr
     except Exception as e:
         raise SensorException(e, sys)
 
+def get_collection_as_dataframe_chunks(database_name:str,collection_name:str,chunk_size:int = 10000,
+                                        query:Optional[dict] = None,sort_field = None)->Iterator[pd.DataFrame]:
+    """
+    This Function streams a collection as fixed size dataframe chunks
+    database_name: database name
+    collection_name: collection name
+    chunk_size: number of documents in each chunk (also used as cursor batch size)
+    query: optional filter applied on server side
+    sort_field: optional field or list of fields to sort documents on, _id is only fetched when sorting on it
+    ================================
+    return iterator of Pandas dataframes
+    """
+    try:
+        logging.info(f"Streaming data from database: [{database_name}] and collection: [{collection_name}] in chunks of {chunk_size} rows")
+        sort_fields = [] if sort_field is None else [sort_field] if isinstance(sort_field,str) else list(sort_field)
+        #projection is applied on server side so _id never leaves mongodb unless it is required
+        projection = None if "_id" in sort_fields else {"_id":0}
+        cursor = get_mongo_client()[database_name][collection_name].find(query or {},projection = projection,batch_size = chunk_size)
+        if len(sort_fields) > 0:
+            cursor = cursor.sort([(field,1) for field in sort_fields])
+
+        columns = None
+        values = None
+        row_number = 0
+        for document in cursor:
+            if columns is None:
+                columns = list(document.keys())
+                logging.info("Found Columns: %s",columns)
+
+            if values is None:
+                #preallocate the chunk once and fill it row by row
+                values = np.empty((chunk_size,len(columns)),dtype = object)
+            values[row_number] = [document.get(column) for column in columns]
+            row_number += 1
+
+            if row_number == chunk_size:
+                yield pd.DataFrame(values,columns = columns)
+                values = None
+                row_number = 0
+
+        if row_number > 0:
+            yield pd.DataFrame(values[:row_number],columns = columns)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_partition_bounds(collection,partition_field:str,partition_size:int,query:Optional[dict] = None)->list:
+    """
+    return lower bound of every range of partition_size documents of partition_field
+    only partition_field is read, so with an index on it the scan is covered by the index
+    """
+    try:
+        projection = {partition_field:1} if partition_field == "_id" else {partition_field:1,"_id":0}
+        cursor = collection.find(query or {},projection = projection).sort(partition_field,1).batch_size(partition_size)
+        bounds = []
+        for row_number,document in enumerate(cursor):
+            #repeated values of a non unique field stay in the range of their first occurrence
+            if row_number % partition_size == 0 and (len(bounds) == 0 or document[partition_field] != bounds[-1]):
+                bounds.append(document[partition_field])
+        return bounds
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def read_collection_range(collection,query:dict,projection:Optional[dict],partition_field:str,batch_size:int)->pd.DataFrame:
+    """
+    read documents of one range sorted on partition_field, decoded straight into one list per column
+    """
+    try:
+        sort = [(partition_field,1)] if partition_field == "_id" else [(partition_field,1),("_id",1)]
+        cursor = collection.find(query,projection = projection,batch_size = batch_size).sort(sort)
+        columns = None
+        column_values = None
+        for document in cursor:
+            if columns is None:
+                columns = list(document.keys())
+                column_values = [[] for _ in columns]
+            for values,column in zip(column_values,columns):
+                values.append(document.get(column))
+        if columns is None:
+            return pd.DataFrame()
+        return pd.DataFrame(dict(zip(columns,column_values)),columns = columns)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_collection_as_dataframe_partitions(database_name:str,collection_name:str,partition_size:int = 10000,
+                                        partition_field:str = "_id",query:Optional[dict] = None,
+                                        n_jobs:int = 4,include_id:bool = False)->Iterator[pd.DataFrame]:
+    """
+    This Function reads a collection as ranges of partition_field read concurrently
+    database_name: database name
+    collection_name: collection name
+    partition_size: number of documents in each range, every range is returned as one dataframe
+    partition_field: indexed field the collection is split on
+    query: optional filter applied on server side
+    n_jobs: number of ranges read at the same time, each over its own connection of the client pool
+    include_id: keep _id column in the dataframes
+    ================================
+    return iterator of Pandas dataframes in partition_field order, the same for every run
+    """
+    try:
+        collection = get_mongo_client()[database_name][collection_name]
+        bounds = get_partition_bounds(collection = collection,partition_field = partition_field,
+            partition_size = partition_size,query = query)
+        logging.info(f"Reading data from database: [{database_name}] and collection: [{collection_name}] "
+            f"as {len(bounds)} ranges of {partition_field} with {n_jobs} workers")
+
+        projection = None if include_id else {"_id":0}
+        range_queries = []
+        for index,lower_bound in enumerate(bounds):
+            range_query = {"$gte":lower_bound}
+            if index + 1 < len(bounds):
+                range_query["$lt"] = bounds[index + 1]
+            range_queries.append({"$and":[query,{partition_field:range_query}]} if query else {partition_field:range_query})
+
+        with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+            #ranges are yielded in order and only a bounded number of them is read ahead
+            pending = deque()
+            for range_query in range_queries:
+                pending.append(executor.submit(read_collection_range,collection = collection,query = range_query,
+                    projection = projection,partition_field = partition_field,batch_size = partition_size))
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_file_format(file_path:str)->str:
+    """
+    return file format of a dataset file from its extension: csv or parquet
+    """
+    try:
+        file_format = os.path.splitext(file_path)[1].lstrip(".").lower()
+        if file_format not in ("csv","parquet"):
+            raise Exception(f"Unsupported file format: [{file_format}] of file: {file_path}")
+        return file_format
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+class DataFrameWriter:
+    """
+    Writes dataframe chunks one after another into a single csv or parquet file.
+    Parquet is written one row group per chunk with the schema of the first chunk.
+    """
+
+    def __init__(self,file_path:str):
+        try:
+            self.file_path = file_path
+            self.file_format = get_file_format(file_path)
+            self.rows = 0
+            self.is_created = False
+            self.parquet_writer = None
+            os.makedirs(os.path.dirname(file_path),exist_ok = True)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def write(self,df:pd.DataFrame)->None:
+        try:
+            if self.file_format == "csv":
+                #first chunk creates the file with header, next chunks are appended
+                mode,header = ("a",False) if self.is_created else ("w",True)
+                df.to_csv(path_or_buf = self.file_path,mode = mode,index = False,header = header)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                if self.parquet_writer is None:
+                    table = pa.Table.from_pandas(df,preserve_index = False)
+                    self.parquet_writer = pq.ParquetWriter(self.file_path,table.schema)
+                else:
+                    table = pa.Table.from_pandas(df,schema = self.parquet_writer.schema,preserve_index = False)
+                self.parquet_writer.write_table(table)
+            self.is_created = True
+            self.rows += len(df)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def close(self)->None:
+        try:
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
+                self.parquet_writer = None
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class FileLock:
+    """
+    Lock shared by processes and machines using the same filesystem.
+    The lock file is created with O_CREAT|O_EXCL so only one holder can create it, it holds the
+    pid of its owner and a lock file older than stale_seconds is treated as left by a crashed owner.
+    """
+
+    def __init__(self,lock_file_path:str,timeout_seconds:float = 60,stale_seconds:float = 300,poll_interval_seconds:float = 0.05):
+        self.lock_file_path = lock_file_path
+        self.timeout_seconds = timeout_seconds
+        self.stale_seconds = stale_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+
+    def acquire(self)->None:
+        try:
+            deadline = time.monotonic() + self.timeout_seconds
+            while True:
+                try:
+                    fd = os.open(self.lock_file_path,os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    os.write(fd,f"{os.getpid()}".encode())
+                    os.close(fd)
+                    return
+                except FileExistsError:
+                    try:
+                        if time.time() - os.path.getmtime(self.lock_file_path) > self.stale_seconds:
+                            logging.info(f"removing stale lock file: {self.lock_file_path}")
+                            os.remove(self.lock_file_path)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                if time.monotonic() > deadline:
+                    raise Exception(f"lock file: {self.lock_file_path} is still held after {self.timeout_seconds} seconds")
+                time.sleep(self.poll_interval_seconds)
+
+        except Exception as e:
+            raise SensorException(e, sys)
+
+    def release(self)->None:
+        try:
+            os.remove(self.lock_file_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.release()
+
+def read_dataframe(file_path:str,columns:Optional[list] = None)->pd.DataFrame:
+    """
+    read csv or parquet file as dataframe
+    file_path: location of file
+    columns: optional list of columns to read, parquet reads only these columns from disk
+    ================================
+    return Pandas dataframe
+    """
+    try:
+        if get_file_format(file_path) == "csv":
+            return pd.read_csv(file_path,usecols = columns)
+        return pd.read_parquet(file_path,columns = columns)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def iter_dataframe_chunks(file_path:str,chunk_size:Optional[int] = None,columns:Optional[list] = None,
+                        na_values:Optional[list] = None)->Iterator[pd.DataFrame]:
+    """
+    read csv or parquet file in chunks of chunk_size rows, whole file is a single chunk if chunk_size is None
+    na_values: optional strings a csv file marks missing values with, they are parsed directly as NaN
+    """
+    try:
+        if get_file_format(file_path) == "csv":
+            if chunk_size is None:
+                yield pd.read_csv(file_path,usecols = columns,na_values = na_values)
+            else:
+                yield from pd.read_csv(file_path,usecols = columns,chunksize = chunk_size,na_values = na_values)
+        elif chunk_size is None:
+            yield read_dataframe(file_path = file_path,columns = columns)
+        else:
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size = chunk_size,columns = columns):
+                yield batch.to_pandas()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_file_hash(file_path:str,block_size:int = 1024*1024)->str:
+    """
+    return sha256 hex digest of file content, file is read in blocks of block_size bytes
+    """
+    try:
+        file_hash = hashlib.sha256()
+        with open(file_path,"rb") as file_obj:
+            for block in iter(lambda: file_obj.read(block_size),b""):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_cached_file_hash(file_path:str,hash_index_file_path:str)->str:
+    """
+    return content hash of file, hash is only recomputed when size or modification time of file changes
+    file_path: location of file to hash
+    hash_index_file_path: yaml file remembering hashes of already seen files
+    """
+    try:
+        hash_index = read_yaml_file(hash_index_file_path) if os.path.exists(hash_index_file_path) else None
+        hash_index = hash_index or {}
+
+        file_stat = os.stat(file_path)
+        key = os.path.abspath(file_path)
+        entry = hash_index.get(key)
+        if entry is not None and entry["size"] == file_stat.st_size and entry["mtime_ns"] == file_stat.st_mtime_ns:
+            return entry["hash"]
+
+        logging.info(f"computing content hash of file: {file_path}")
+        file_hash = get_file_hash(file_path)
+        hash_index[key] = {"size":file_stat.st_size,"mtime_ns":file_stat.st_mtime_ns,"hash":file_hash}
+
+        #write to a temp file and rename it so concurrent readers never see a half written index
+        tmp_file_path = f"{hash_index_file_path}.{uuid.uuid4().hex}.tmp"
+        write_yaml_file(file_path = tmp_file_path,data = hash_index)
+        os.replace(tmp_file_path,hash_index_file_path)
+        return file_hash
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def read_yaml_file(file_path:str)->dict:
+    try:
+        with open(file_path,"r") as file_obj:
+            return yaml.safe_load(file_obj)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def get_collection_fingerprint(database_name:str,collection_name:str)->dict:
+    """
+    return a cheap fingerprint of a collection: number of documents and highest _id
+    it changes whenever documents are added or removed
+    """
+    try:
+        collection = get_mongo_client()[database_name][collection_name]
+        latest_document = collection.find_one({},projection = {"_id":1},sort = [("_id",-1)])
+        return {"count":collection.estimated_document_count(),
+            "max_id":None if latest_document is None else str(latest_document["_id"])}
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
 def write_yaml_file(file_path, data:dict):
     try:
         file_dir = os.path.dirname(file_path)
@@ -41,33 +397,62 @@ def write_yaml_file(file_path, data:dict):
     except Exception as e:
         raise SensorException(e, sys)
 
-def convert_column_float(df:pd.DataFrame,exclude_columns:list)->pd.DataFrame:
+def convert_column_float(df:pd.DataFrame,exclude_columns:list,dtype = np.float64)->pd.DataFrame:
+    """
+    cast every column except exclude_columns to a float dtype in a single bulk cast
+    df: dataframe to cast
+    exclude_columns: columns kept as they are
+    dtype: float dtype, float32 halves memory of sensor values
+    ================================
+    return casted dataframe
+    """
     try:
-        for column in df.columns:
-            if column not in exclude_columns:
-                df[column] = df[column].astype('float')
-        return df
-    
+        #columns already of dtype are not cast again
+        dtypes = {column:dtype for column in df.columns if column not in exclude_columns and df[column].dtype != dtype}
+        if len(dtypes) == 0:
+            return df
+        return df.astype(dtypes)
+
     except Exception as e:
         raise SensorException(e, sys)
 
 def save_object(file_path:str,obj:object)-> None:
+    """
+    save object to file
+    xgboost models and sklearn transformers are saved in object file format of sensor.serialization,
+    any other object is pickled with dill
+    """
     try:
         logging.info(f"Entered the save_object method of Mainutils class")
         os.makedirs(os.path.dirname(file_path),exist_ok = True)
 
-        with open(file_path,"wb") as file_obj:
-            dill.dump(obj,file_obj)
+        try:
+            serialization.dump(obj,file_path = file_path)
+        except serialization.UnsupportedObjectError as e:
+            logging.info(f"pickle object with dill: {e}")
+            import dill
+            with open(file_path,"wb") as file_obj:
+                dill.dump(obj,file_obj)
         logging.info(f"Exited the save_object method of Mainutils class")
 
     except Exception as e:
         raise SensorException(e, sys)
 
-def load_object(file_path:str)-> object:
+def load_object(file_path:str,lazy:bool = False)-> object:
+    """
+    load object saved with save_object, format of file is detected from its first bytes
+    file_path:str location of file
+    lazy:bool return serialization.LazyObject reading the file on first attribute access
+    """
     try:
         if not os.path.exists(file_path):
             raise Exception(f"The file: {file_path} does not exist")
-        
+        if lazy:
+            return serialization.LazyObject(file_path = file_path,loader = load_object)
+
+        if serialization.is_object_file(file_path):
+            return serialization.load(file_path)
+        import dill
         with open(file_path,'rb') as file_obj:
             return dill.load(file_obj)
 
@@ -89,6 +474,65 @@ def save_numpy_array_data(file_path:str,array:np.array):
     except Exception as e:
         raise SensorException(e, sys)
 
+def save_numpy_arrays(dir_path:str,**arrays)->None:
+    """
+    save named numpy arrays as separate npy files of a directory
+    dir_path:str location of directory to save
+    arrays: arrays to save keyed by name, every array is saved as <name>.npy in C order
+    so it can be memory mapped and read in chunks of rows
+    """
+    try:
+        os.makedirs(dir_path,exist_ok = True)
+        for name,array in arrays.items():
+            with open(os.path.join(dir_path,f"{name}.npy"),"wb") as file_obj:
+                np.save(file_obj,np.ascontiguousarray(array))
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def load_numpy_arrays(dir_path:str,mmap_mode:Optional[str] = None)->dict:
+    """
+    load every array of a directory saved with save_numpy_arrays
+    dir_path:str location of directory to load
+    mmap_mode:str "r" memory maps arrays read only, pages are read on access and
+    shared through page cache by every process mapping the same file
+    ================================
+    return dictionary of array name and array
+    """
+    try:
+        return {os.path.splitext(file_name)[0]:np.load(os.path.join(dir_path,file_name),mmap_mode = mmap_mode)
+            for file_name in sorted(os.listdir(dir_path)) if file_name.endswith(".npy")}
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
+def iter_numpy_array_chunks(file_path:str,chunk_size:int,array_name:Optional[str] = None)->Iterator[np.ndarray]:
+    """
+    read a npy file in chunks of rows, only one chunk is in memory at a time
+    file_path:str location of npy file or of directory saved with save_numpy_arrays
+    chunk_size:int number of rows per chunk
+    array_name:str name of array when file_path is a directory
+    ================================
+    yield array of at most chunk_size rows
+    """
+    try:
+        if array_name is not None:
+            file_path = os.path.join(file_path,f"{array_name}.npy")
+        with open(file_path,"rb") as file_obj:
+            version = np.lib.format.read_magic(file_obj)
+            read_array_header = np.lib.format.read_array_header_1_0 if version == (1,0) else np.lib.format.read_array_header_2_0
+            shape,fortran_order,dtype = read_array_header(file_obj)
+            if fortran_order:
+                raise Exception(f"Only C ordered arrays can be read in chunks, file: {file_path}")
+            n_rows,row_shape = shape[0],shape[1:]
+            row_size = int(np.prod(row_shape,dtype = np.int64))
+            for start in range(0,n_rows,chunk_size):
+                n_chunk_rows = min(chunk_size,n_rows - start)
+                yield np.fromfile(file_obj,dtype = dtype,count = n_chunk_rows * row_size).reshape((n_chunk_rows,) + row_shape)
+
+    except Exception as e:
+        raise SensorException(e, sys)
+
 def load_numpy_array_data(file_path:str)-> np.array:
     """
     load numpy array data from file